@@ -19,17 +19,24 @@
 
 
 import asyncio
+import collections
+import concurrent.futures
 import contextlib
 import itertools
 import functools
+import hashlib
 import os
 import re
+import sys
+import threading
+import weakref
 from urllib import parse
 
 
 import appkit
 import appkit.application
 import appkit.application.console
+import appkit.blocks.cache
 import appkit.blocks.extensionmanager
 import appkit.blocks.httpclient
 import appkit.blocks.quicklogging
@@ -40,15 +47,22 @@ import yaml
 
 
 import arroyo.extensions
+import arroyo.helpers.asyncutils
 import arroyo.helpers.database
 import arroyo.helpers.downloads
 import arroyo.helpers.filterengine
 import arroyo.helpers.mediaparser
+import arroyo.helpers.profiling
+import arroyo.helpers.resolver
 import arroyo.helpers.scanner
+import arroyo.helpers.sharedstate
+import arroyo.helpers.stats
+import arroyo.helpers.tagger
 from arroyo.models import (
     Download,
     Episode,
     Movie,
+    ScanRecord,
     Source,
     Variable
 )
@@ -60,6 +74,7 @@ __all__ = [
     'Download',
     'DownloadState',
     'Episode',
+    'ScanRecord',
     'SettingsKey',
     'Source',
     'Variable',
@@ -76,10 +91,19 @@ class SettingsKey:
     DOWNLOADER               = 'downloader'
     ENABLE_CACHE             = 'enable-cache'
     LOG_LEVEL                = 'log-level'
+    MEDIAPARSER_BAD_TAGS     = 'mediaparser.bad-tags'
+    MEDIAPARSER_DISTRIBUTORS = 'mediaparser.distributors'
+    MEDIAPARSER_GROUPS       = 'mediaparser.release-groups'
     PLUGINS                  = 'plugins'
+    PROVIDERS_BASE_URI       = 'providers-base-uri'
     QUERY_DEFAULTS           = 'selector.query-defaults'
     QUERY_TYPE_DEFAULTS_TMPL = 'selector.query-{type}-defaults'
     QUERIES                  = 'queries'
+    RESOLVER_CONCURRENCY     = 'resolver.concurrency'
+    SCANNER_FETCH_MEMO_TTL   = 'scanner.fetch-memo-ttl'
+    SCANNER_PARSER_EXECUTOR  = 'scanner.parser-executor'
+    SCANNER_SHARED_URIS      = 'scanner.shared-uris'
+    SHARED_STATE             = 'shared-state'
     SORTER                   = 'sorter'
 
 
@@ -87,6 +111,7 @@ class CacheType:
     SCAN = 'scan'
     NETWORK = 'network'
     FILTER = 'filter'
+    RESOLVE = 'resolve'
 
 
 class DownloadState:
@@ -149,6 +174,29 @@ class _BaseApplication(appkit.application.console.ConsoleApplicationMixin,
             action='store_true',
             help='Disable all caches'
         )
+        parser.add_argument(
+            '--stats',
+            nargs='?',
+            const='-',
+            default=None,
+            help=('Collect per query timers and counters and dump them as '
+                  'JSON into STATS file (or stdout) at exit')
+        )
+        parser.add_argument(
+            '--profile',
+            nargs='?',
+            const='arroyo.pstats',
+            default=None,
+            help=('Profile command execution with cProfile. Saves stats into '
+                  'PROFILE (default: arroyo.pstats) and collapsed stacks '
+                  '(flamegraph compatible) alongside')
+        )
+        parser.add_argument(
+            '--profile-memory',
+            action='store_true',
+            help=('With --profile, record top allocation sites for each '
+                  'pipeline stage using tracemalloc')
+        )
 
     def consume_application_parameters(self, parameters):
         downloader = parameters.pop('downloader')
@@ -158,9 +206,50 @@ class _BaseApplication(appkit.application.console.ConsoleApplicationMixin,
         disable_cache = parameters.pop('disable_cache')
         if disable_cache is True:
             self.caches[CacheType.SCAN] = ArroyoScanCache()
+            self.caches[CacheType.RESOLVE] = appkit.blocks.cache.NullCache()
+
+        stats = parameters.pop('stats')
+        if stats is not None:
+            self.stats.enabled = True
+            self._stats_path = stats
+
+        profile = parameters.pop('profile')
+        profile_memory = parameters.pop('profile_memory')
+        if profile is not None:
+            self._profiler = arroyo.helpers.profiling.Profiler(
+                profile, memory=profile_memory, logger=self.logger)
+            self.stats.observer = self._profiler.memory
+            self._profiler.start()
 
         super().consume_application_parameters(parameters)
 
+    def execute_from_args(self, *args, **kwargs):
+        try:
+            return super().execute_from_args(*args, **kwargs)
+        finally:
+            if self._profiler is not None:
+                self._profiler.stop()
+                self.stats.observer = None
+                self._profiler = None
+
+            self.dump_stats()
+
+    def dump_stats(self):
+        path = self._stats_path
+        if not self.stats.enabled or path is None:
+            return
+
+        if path == '-':
+            self.stats.dump(sys.stdout)
+            return
+
+        with open(path, 'w') as fh:
+            self.stats.dump(fh)
+
+        msg = "Stats saved to '{path}'"
+        msg = msg.format(path=path)
+        self.logger.info(msg)
+
     def main(self):
         print('arroyo is up and running')
 
@@ -176,6 +265,7 @@ class Application(_BaseApplication):
 
     DEFAULT_PLUGINS = [
         'commands.download',
+        'commands.importer',
         'commands.queue',
         # 'commands.settings',
 
@@ -192,7 +282,8 @@ class Application(_BaseApplication):
         'providers.eztv',
         'providers.torrentapi',
 
-        'sorters.basic'
+        'sorters.basic',
+        'sorters.vectorized'
     ]
 
     DEFAULT_SETTINGS = {
@@ -204,6 +295,9 @@ class Application(_BaseApplication):
         SettingsKey.DOWNLOADER: 'mock',
         SettingsKey.ENABLE_CACHE: True,
         SettingsKey.LOG_LEVEL: 'INFO',
+        SettingsKey.SCANNER_SHARED_URIS: True,
+        SettingsKey.SHARED_STATE: appkit.utils.user_path(
+            appkit.utils.UserPathType.CACHE, 'shared-state.json', create=True),
         SettingsKey.SORTER: 'basic'
     }
 
@@ -224,28 +318,32 @@ class Application(_BaseApplication):
         # if SettingsKey.PLUGINS not in settings:
         #     settings[SettingsKey.PLUGINS] = {}
 
+        self._controllers = {}
+        self.stats = arroyo.helpers.stats.Stats()
+        self._stats_path = None
+        self._profiler = None
+        self._http_client = None
+        self._process_executor = None
+
         super().__init__(
             name='arroyo',
             logger=QuickLogger(level=appkit.blocks.quicklogging.Level.WARNING),
             settings=store,
         )
 
-        # Open database connection
+        # Open database connection. Session is thread local, see
+        # arroyo.helpers.database.create_session
         db_uri = self.settings.get(SettingsKey.DB_URI)
-
-        # Add check_same_thread=False to db_uri.
-        # FIXME: This is a _hack_ required by the webui plugin.
-        if '?' in db_uri:
-            db_uri += '&check_same_thread=False'
-        else:
-            db_uri += '?check_same_thread=False'
-
-        db_sess = appkit.db.sqlalchemyutils.create_session(db_uri)
+        db_sess = arroyo.helpers.database.create_session(db_uri)
 
         # Initialize app variables
         self.variables = appkit.db.sqlalchemyutils.KeyValueManager(Variable,
                                                                    db_sess)
 
+        # State shared between processes (provider tokens, rate limits...)
+        self.shared_state = arroyo.helpers.sharedstate.SharedState(
+            self.settings.get(SettingsKey.SHARED_STATE, None) or None)
+
         # Register extension points
         self.register_extension_point(arroyo.extensions.DownloaderExtension)
         self.register_extension_point(arroyo.extensions.FilterExtension)
@@ -253,7 +351,7 @@ class Application(_BaseApplication):
         self.register_extension_point(arroyo.extensions.SorterExtension)
 
         # Initialize database controller
-        self.db = arroyo.helpers.database.Database(db_sess)
+        self.db = arroyo.helpers.database.Database(db_sess, stats=self.stats)
 
         # app.register_extension_class(DownloadSyncCronTask)
         # app.register_extension_class(DownloadQueriesCronTask)
@@ -261,8 +359,14 @@ class Application(_BaseApplication):
 
         # Initialize app caches
         self.caches = {
-            CacheType.SCAN: appkit.blocks.cache.NullCache()
+            CacheType.SCAN: appkit.blocks.cache.NullCache(),
+            CacheType.RESOLVE: appkit.blocks.cache.NullCache()
         }
+        if self.settings.get(SettingsKey.ENABLE_CACHE, False):
+            self.caches[CacheType.RESOLVE] = ArroyoResolveCache()
+
+        # Drop cached controllers if settings change
+        self.settings.listeners.append(self._on_settings_change)
 
         plugin_categories = self.settings.children(SettingsKey.PLUGINS_NS[:-1])
 
@@ -286,19 +390,112 @@ class Application(_BaseApplication):
     #
     # Controllers
     #
+    # Controllers are built on first access and cached. Any change in
+    # settings or in the set of loaded plugins invalidates them, see
+    # invalidate_controllers
+    #
+    def _get_controller(self, name, factory):
+        try:
+            return self._controllers[name]
+        except KeyError:
+            pass
+
+        ctrl = factory()
+        self._controllers[name] = ctrl
+
+        return ctrl
+
+    def invalidate_controllers(self):
+        self._controllers = {}
+        self.shutdown_process_executor(wait=False)
+
+    def get_process_executor(self):
+        """
+        Process pool shared by controllers (see Scanner.get_parser_executor).
+
+        Created on demand and shut down with controllers or at the end of
+        execute_from_args
+        """
+        if self._process_executor is None:
+            self._process_executor = concurrent.futures.ProcessPoolExecutor()
+
+        return self._process_executor
+
+    def shutdown_process_executor(self, wait=True):
+        if self._process_executor is None:
+            return
+
+        self._process_executor.shutdown(wait=wait)
+        self._process_executor = None
+
+    def execute_from_args(self, *args, **kwargs):
+        try:
+            return super().execute_from_args(*args, **kwargs)
+        finally:
+            self.shutdown_process_executor()
+
+    def load_plugin(self, *args, **kwargs):
+        super().load_plugin(*args, **kwargs)
+        self.invalidate_controllers()
+
+    def _on_settings_change(self, key, value):
+        self.invalidate_controllers()
+
     @property
     def scanner(self):
-        return arroyo.helpers.scanner.Scanner(
-            logger=self.logger,
-            providers=self.get_providers())
+        return self._get_controller('scanner', self._build_scanner)
 
     @property
     def mediaparser(self):
-        return arroyo.helpers.mediaparser.MediaParser(
-            logger=self.logger.getChild('mediaparser'))
+        return self._get_controller('mediaparser', self._build_mediaparser)
 
     @property
     def selector(self):
+        return self._get_controller('selector', self._build_selector)
+
+    @property
+    def downloads(self):
+        return self._get_controller('downloads', self._build_downloads)
+
+    @property
+    def resolver(self):
+        return self._get_controller('resolver', self._build_resolver)
+
+    def _build_scanner(self):
+        return arroyo.helpers.scanner.Scanner(
+            logger=self.logger,
+            providers=self.get_providers(),
+            stats=self.stats,
+            shared_uris=self.settings.get(SettingsKey.SCANNER_SHARED_URIS,
+                                          True),
+            fetch_memo_ttl=self.settings.get(
+                SettingsKey.SCANNER_FETCH_MEMO_TTL, None),
+            parser_executor=self.settings.get(
+                SettingsKey.SCANNER_PARSER_EXECUTOR, None),
+            get_process_executor=self.get_process_executor)
+
+    def _build_mediaparser(self):
+        # Settings extend tagger's default lists
+        def _extra(key):
+            value = self.settings.get(key, None) or []
+            if isinstance(value, str):
+                value = value.split(',')
+
+            return list(value)
+
+        tagger = arroyo.helpers.tagger.Tagger(
+            distributors=(arroyo.helpers.tagger.DISTRIBUTORS +
+                          _extra(SettingsKey.MEDIAPARSER_DISTRIBUTORS)),
+            release_groups=(arroyo.helpers.tagger.RELEASE_GROUPS +
+                            _extra(SettingsKey.MEDIAPARSER_GROUPS)),
+            bad_tags=(arroyo.helpers.tagger.BAD_TAGS +
+                      _extra(SettingsKey.MEDIAPARSER_BAD_TAGS)))
+
+        return arroyo.helpers.mediaparser.MediaParser(
+            logger=self.logger.getChild('mediaparser'),
+            tagger=tagger)
+
+    def _build_selector(self):
         filters = self.get_filters()
         if not filters:
             msg = "No filters available"
@@ -311,14 +508,24 @@ class Application(_BaseApplication):
         return arroyo.helpers.filterengine.Engine(
             filters=filters,
             sorter=sorter,
-            logger=self.logger)
+            logger=self.logger,
+            stats=self.stats)
 
-    @property
-    def downloads(self):
+    def _build_downloads(self):
         name = self.settings.get(SettingsKey.DOWNLOADER)
         return arroyo.helpers.downloads.Downloads(
             plugin=self.get_downloader(name),
-            db=self.db)
+            db=self.db,
+            stats=self.stats)
+
+    def _build_resolver(self):
+        return arroyo.helpers.resolver.Resolver(
+            logger=self.logger.getChild('resolver'),
+            providers=self.get_providers(),
+            stats=self.stats,
+            cache=self.caches[CacheType.RESOLVE],
+            concurrency=self.settings.get(SettingsKey.RESOLVER_CONCURRENCY,
+                                          None))
 
     #
     # Own methods
@@ -357,8 +564,18 @@ class Application(_BaseApplication):
             if override_value:
                 overrides[field] = override_value
 
+        # Redirect provider requests (mirrors, local replay server). Provider
+        # specific setting has precedence over the global one
+        base_uri = self.settings.get(
+            SettingsKey.PROVIDERS_NS + name + '.base-uri', None)
+        if not base_uri:
+            base_uri = self.settings.get(SettingsKey.PROVIDERS_BASE_URI, None)
+            if base_uri:
+                base_uri = base_uri.rstrip('/') + '/' + name
+
         return self.get_extension(arroyo.extensions.ProviderExtension, name,
-                                  defaults=defaults, overrides=overrides)
+                                  defaults=defaults, overrides=overrides,
+                                  base_uri=base_uri)
 
     def get_filters(self):
         return self.get_extensions_for(arroyo.extensions.FilterExtension)
@@ -405,7 +622,14 @@ class Application(_BaseApplication):
             params = self._get_base_query_params_from_type(query_type)
             params.update(query_params)
 
+            # Identical queries are the same (interned) object
             query = Query(**params)
+            if query in ret:
+                msg = "Query '{name}' is a duplicate, ignoring"
+                msg = msg.format(name=name)
+                self.logger.warning(msg)
+                continue
+
             ret.append(query)
 
         return ret
@@ -428,26 +652,31 @@ class Application(_BaseApplication):
 
         return Query(**params)
 
-    def search(self, query):
-        def _post_process(items):
-            for src, metadata in items:
-                try:
-                    entity, tags = self.mediaparser.parse(src,
-                                                          metadata=metadata)
+    def query_stats_scope(self, query):
+        """
+        Stats scope (see arroyo.helpers.stats) for query
+        """
+        return self.stats.scope(
+            ', '.join(['{}={}'.format(k, v)
+                       for (k, v) in sorted(query.asdict().items())]))
 
-                except (arroyo.helpers.mediaparser.InvalidEntityTypeError,
-                        arroyo.helpers.mediaparser.InvalidEntityArgumentsError
-                        ) as e:
-                    err = "Unable to parse '{name}': {e}"
-                    err = err.format(name=src.name, e=e)
-                    self.logger.error(err)
-                    continue
+    def search(self, query):
+        return arroyo.helpers.asyncutils.run_until_complete(
+            self.asearch(query))
 
-                src.entity = entity
-                src.tags = tags
+    @asyncio.coroutine
+    def asearch(self, query):
+        """
+        Coroutine version of Application.search.
 
-                yield src
+        Runs in the caller's event loop. Parsing is done in the loop's
+        default executor.
+        """
+        with self.query_stats_scope(query):
+            return (yield from self._asearch(query))
 
+    @asyncio.coroutine
+    def _asearch(self, query):
         try:
             results = self.caches[CacheType.SCAN].get(query)
             msg = "Scan data found in cache"
@@ -458,15 +687,119 @@ class Application(_BaseApplication):
             self.logger.debug(msg)
             results = None
 
-            sources_and_metas = self.scanner.scan(query)
-            results = list(_post_process(sources_and_metas))
+            sources_and_metas = yield from self.scanner.async_scan(query)
+            with self.stats.timer('search.post-process'):
+                results = yield from self._async_parse_scan_results(
+                    sources_and_metas)
 
             self.caches[CacheType.SCAN].set(query, results)
 
         return results
 
+    def search_many(self, queries):
+        return arroyo.helpers.asyncutils.run_until_complete(
+            self.asearch_many(queries))
+
+    @asyncio.coroutine
+    def asearch_many(self, queries):
+        """
+        Search several queries at once coalescing their requests (see
+        Scanner.scan_many).
+
+        Returns a dict {query: results}
+        """
+        ret = collections.OrderedDict()
+        missing = []
+
+        for query in queries:
+            try:
+                ret[query] = self.caches[CacheType.SCAN].get(query)
+            except KeyError:
+                ret[query] = None
+                missing.append(query)
+
+        if not missing:
+            return ret
+
+        results = yield from self._ascan_many(missing)
+
+        # Shared URIs are listings of recent additions (see
+        # ProviderExtension.get_shared_uris), queries without matches in them
+        # are scanned again with its own URIs
+        shared = self.scanner.shared_queries(missing)
+        fallback = [
+            query for query in missing
+            if query in shared and
+            not list(self.selector.filter(results[query], query))]
+
+        if fallback:
+            msg = "{n} queries without matches in shared URIs, scanning again"
+            msg = msg.format(n=len(fallback))
+            self.logger.info(msg)
+
+            rescanned = yield from self._ascan_many(fallback,
+                                                    shared_uris=False)
+            results.update(rescanned)
+
+        for query in missing:
+            self.caches[CacheType.SCAN].set(query, results[query])
+            ret[query] = results[query]
+
+        return ret
+
+    @asyncio.coroutine
+    def _ascan_many(self, queries, shared_uris=None):
+        scanned = yield from self.scanner.async_scan_many(
+            queries, shared_uris=shared_uris)
+
+        # Records are shared between queries, parse each one once
+        unique = collections.OrderedDict()
+        for items in scanned.values():
+            for (src, metadata) in items:
+                unique[id(src)] = (src, metadata)
+
+        with self.stats.timer('search.post-process'):
+            parsed = yield from self._async_parse_scan_results(
+                unique.values())
+            parsed = set([id(src) for src in parsed])
+
+        return collections.OrderedDict([
+            (query, [src for (src, _) in scanned[query]
+                     if id(src) in parsed])
+            for query in queries])
+
+    @asyncio.coroutine
+    def _async_parse_scan_results(self, items):
+        # mediaparser is CPU bound, keep it out of the loop
+        return (yield from arroyo.helpers.asyncutils.run_in_executor(
+            None, lambda: list(self._parse_scan_results(items))))
+
+    def _parse_scan_results(self, items):
+        mediaparser = self.mediaparser
+        timer = self.stats.timer
+
+        for src, metadata in items:
+            try:
+                with timer('mediaparser.parse'):
+                    entity, tags = mediaparser.parse(src,
+                                                     metadata=metadata)
+
+            except (arroyo.helpers.mediaparser.InvalidEntityTypeError,
+                    arroyo.helpers.mediaparser.InvalidEntityArgumentsError
+                    ) as e:
+                err = "Unable to parse '{name}': {e}"
+                err = err.format(name=src.name, e=e)
+                self.logger.error(err)
+                continue
+
+            src.entity = entity
+            src.tags = tags
+
+            yield src
+
     def filter(self, results, query):
-        results = self.selector.filter(results, query)
+        with self.query_stats_scope(query):
+            results = self.selector.filter(results, query)
         # if not ignore_state:
         #     results = self.filters.apply(self.get_filter('state'),
         #                                  None,
@@ -475,6 +808,17 @@ class Application(_BaseApplication):
 
         return results
 
+    @asyncio.coroutine
+    def afilter(self, results, query):
+        """
+        Coroutine version of Application.filter.
+
+        Filters can access the database (see the state filter) so they run
+        in the caller's thread.
+        """
+        with self.query_stats_scope(query):
+            return self.selector.filter(results, query)
+
     def group(self, results):
         groups = {
             None: [],
@@ -523,18 +867,77 @@ class Application(_BaseApplication):
         return ret
 
     def select(self, sources, query):
-        return self.selector.sorted(sources, query)[0]
+        with self.query_stats_scope(query):
+            return self.selector.sorted(sources, query)[0]
+
+    def resolve(self, sources):
+        """
+        Resolve lazy sources (see arroyo.helpers.resolver) concurrently.
+        Only call this for sources that are going to be downloaded, each
+        one costs a request.
+
+        Returns the list of sources that couldn't be resolved
+        """
+        return self.resolver.resolve_all(sources)
+
+    @asyncio.coroutine
+    def aresolve(self, sources):
+        """
+        Coroutine version of Application.resolve
+        """
+        return (yield from self.resolver.async_resolve_all(sources))
 
     def download(self, source):
-        source = self.db.merge(source)
-        self.downloads.add(source)
+        if source.needs_postprocessing:
+            self.resolver.resolve(source)
+
+        with self.db.transaction():
+            source = self.db.merge(source)
+            self.downloads.add(source)
+
+    @asyncio.coroutine
+    def adownload(self, source):
+        """
+        Coroutine version of Application.download.
+
+        Database work is done in the caller's thread, network bound
+        downloader plugin calls in the loop's default executor (see
+        Downloads.async_add).
+        """
+        if source.needs_postprocessing:
+            yield from self.resolver.async_resolve(source)
+
+        with self.db.transaction():
+            source = self.db.merge(source)
+
+        yield from self.downloads.async_add(source)
 
     def get_downloads(self):
         return self.downloads.list()
 
     @contextlib.contextmanager
     def get_async_http_client(self):
-        yield ArroyoAsyncHTTPClient()
+        if self._http_client is not None:
+            yield self._http_client
+        else:
+            yield ArroyoAsyncHTTPClient()
+
+    @contextlib.contextmanager
+    def shared_http_client(self):
+        """
+        Use the same HTTP client (and its connection pool) for all requests
+        inside this context: provider fetches, token requests, lazy sources
+        resolution, etc. See get_async_http_client.
+        """
+        if self._http_client is not None:
+            yield self._http_client
+            return
+
+        self._http_client = ArroyoAsyncHTTPClient()
+        try:
+            yield self._http_client
+        finally:
+            self._http_client = None
 
 
 class ArroyoStore(appkit.blocks.store.Store):
@@ -542,6 +945,18 @@ class ArroyoStore(appkit.blocks.store.Store):
     YAML compatible store
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Callables with signature fn(key, value) called after each set
+        self.listeners = []
+
+    def set(self, key, value):
+        ret = super().set(key, value)
+        for fn in self.listeners:
+            fn(key, value)
+
+        return ret
+
     def validate_key(self, key):
         key = key.lower()
         key = key.replace(' ', '-')
@@ -599,10 +1014,22 @@ class ArroyoScanCache(appkit.blocks.cache.DiskCache):
         super().__init__(*args, basedir=basedir, delta=delta, **kwargs)
 
     def encode_key(self, query):
-        data = query.asdict()
-        data = sorted(data.items())
-        key = parse.urlencode(data)
-        return self.basedir / key
+        return self.basedir / query.cache_key
+
+
+class ArroyoResolveCache(appkit.blocks.cache.DiskCache):
+    def __init__(self, *args, **kwargs):
+        basedir = (
+            kwargs.pop('basedir', None) or
+            appkit.utils.user_path(appkit.utils.UserPathType.CACHE,
+                                   name='resolve')
+        )
+        os.makedirs(basedir, exist_ok=True)
+        delta = kwargs.pop('delta', None) or 60*60*24*7
+        super().__init__(*args, basedir=basedir, delta=delta, **kwargs)
+
+    def encode_key(self, uri):
+        return self.basedir / hashlib.sha1(uri.encode('utf-8')).hexdigest()
 
 
 class QuickLogger(appkit.blocks.quicklogging.QuickLogger):
@@ -635,11 +1062,22 @@ class Query:
     """
     Represents a user query.
 
-    All init parameters are validated and turned into object attributes
+    All init parameters are validated and turned into object attributes.
+
+    Queries are immutable values: equal params (after validation) produce
+    the same (interned) object, so they can be used as keys and compared
+    cheaply. Derived forms (str, asdict, cache_key) are computed once.
     """
     _PATTERN = r'^[a-z]+$'
 
-    def __init__(self, *args, **params):
+    # {canonical key: Query}
+    _interned = weakref.WeakValueDictionary()
+    _interned_lock = threading.Lock()
+
+    # Shared parser for keyword queries
+    _keywords_parser = None
+
+    def __new__(cls, *args, **params):
         if args:
             # Convert args[0] in keyword
             if len(args) != 1:
@@ -656,20 +1094,44 @@ class Query:
 
             else:
                 # In any other cases we relay on mediaparser to build the query
-                parser = arroyo.helpers.mediaparser.MediaParser()
-                entity_type_name, entity_params, _, _ = parser.parse_name(args[0], hints=params)
+                if Query._keywords_parser is None:
+                    Query._keywords_parser = \
+                        arroyo.helpers.mediaparser.MediaParser()
+
+                entity_type_name, entity_params, _, _ = \
+                    Query._keywords_parser.parse_name(keywords, hints=params)
                 params.update(entity_params)
                 params['type'] = entity_type_name
+
         if 'type' not in params:
             params['type'] = 'source'
 
-        _attrs = []
+        validated = []
         for (key, value) in params.items():
-            key, value = self._validate(key, value)
-            _attrs.append(key)
-            setattr(self, key, value)
+            validated.append(cls._validate(key, value))
+
+        key = tuple(sorted([(k, _freeze(v)) for (k, v) in validated]))
+
+        with cls._interned_lock:
+            try:
+                return cls._interned[key]
+            except KeyError:
+                pass
+
+            self = super().__new__(cls)
+            for (attr, value) in validated:
+                setattr(self, attr, value)
 
-        self._attrs = tuple(_attrs)
+            self._key = key
+            self._dict = dict(validated)
+            self._attrs = tuple([attr for (attr, _) in validated])
+
+            cls._interned[key] = self
+            return self
+
+    def __init__(self, *args, **params):
+        # Everything is done in __new__
+        pass
 
     @classmethod
     def _validate(cls, attr, value):
@@ -687,6 +1149,17 @@ class Query:
         return attr, value
 
     def __str__(self):
+        try:
+            return self._str
+        except AttributeError:
+            pass
+
+        # Errors are not cached, they are raised on each call
+        ret = self._build_str()
+        object.__setattr__(self, '_str', ret)
+        return ret
+
+    def _build_str(self):
         def _get_base_string(attr='name'):
             try:
                 return getattr(self, attr).strip()
@@ -749,9 +1222,42 @@ class Query:
             raise NotImplementedError(err)
 
     def asdict(self):
-        return {
-            x: getattr(self, x) for x in self
-        }
+        return dict(self._dict)
+
+    @property
+    def cache_key(self):
+        """
+        Stable string for this query, suitable for cache keys or paths
+        """
+        try:
+            return self._cache_key
+        except AttributeError:
+            pass
+
+        ret = parse.urlencode(sorted(self._dict.items()))
+        object.__setattr__(self, '_cache_key', ret)
+        return ret
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+
+        if not isinstance(other, Query):
+            return NotImplemented
+
+        return self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (_query_from_params, (self.__class__, self.asdict()))
 
     def __contains__(self, attr):
         return attr in self._attrs
@@ -777,6 +1283,27 @@ class Query:
         )
 
 
+def _freeze(value):
+    """
+    Hashable version of value for Query's canonical key
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple([_freeze(x) for x in value])
+
+    if isinstance(value, dict):
+        return tuple(sorted([(k, _freeze(v)) for (k, v) in value.items()]))
+
+    if isinstance(value, (set, frozenset)):
+        return frozenset([_freeze(x) for x in value])
+
+    # Keep type, 1, 1.0 and True are equal (and have the same hash)
+    return (value.__class__, value)
+
+
+def _query_from_params(cls, params):
+    return cls(**params)
+
+
 def unroll(fn):
     @functools.wraps(fn)
     def _wrapper(*args, **kwargs):
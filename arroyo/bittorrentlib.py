@@ -20,7 +20,9 @@
 
 import base64
 import binascii
+import functools
 import hashlib
+import mmap
 import re
 from urllib import parse
 
@@ -28,48 +30,279 @@ from urllib import parse
 import bencodepy
 
 
+_SHA1_URN_RE = re.compile(r'^urn:(.+?):[A-F0-9]{40}$', re.IGNORECASE)
+_BASE32_URN_RE = re.compile(r'^urn:(.+?):[A-Z2-7]{32}$', re.IGNORECASE)
+
+# Fast path for the (almost universal) btih URNs, see parse_magnet
+_BTIH_URN_RE = re.compile(
+    r'^urn:btih:(?:(?P<sha1>[A-Fa-f0-9]{40})|(?P<base32>[A-Za-z2-7]{32}))$')
+
+
 def is_sha1_urn(urn):
     """Check if urn matches sha1 urn: scheme
     """
 
-    return re.match('^urn:(.+?):[A-F0-9]{40}$', urn, re.IGNORECASE) is not None
+    return _SHA1_URN_RE.match(urn) is not None
 
 
 def is_base32_urn(urn):
     """Check if urn matches base32 urn: scheme
     """
 
-    return re.match('^urn:(.+?):[A-Z2-7]{32}$', urn, re.IGNORECASE) is not None
+    return _BASE32_URN_RE.match(urn) is not None
 
 
 def normalize_urn(urn):
-    prefix, func, hash = urn.split(':', 2)
+    m = _BTIH_URN_RE.match(urn)
+    if m:
+        if m.group('sha1'):
+            return 'urn:btih:' + m.group('sha1').lower()
+        else:
+            return 'urn:btih:' + _base32_to_hex(m.group('base32').upper())
+
+    prefix, func, _ = urn.split(':', 2)
     if prefix != 'urn' or func != 'btih':
         msg = 'Unknow urn configuration: {urn}'
         msg = msg.format(urn=urn)
         raise ValueError(msg)
 
-    if is_sha1_urn(urn):
-        return urn.lower()
-
-    elif is_base32_urn(urn):
-        hash = hash.upper()
-        hash = base64.b32decode(hash)
-        hash = binascii.hexlify(hash)
-        hash = hash.decode('ascii')
-        hash = hash.lower()
-        return '{prefix}:{func}:{hash}'.format(
-            prefix=prefix,
-            func=func,
-            hash=hash)
-
-    else:
-        msg = "Unknow encoding: '{urn}'"
-        msg = msg.format(urn=urn)
+    msg = "Unknow encoding: '{urn}'"
+    msg = msg.format(urn=urn)
+    raise ValueError(msg)
+
+
+@functools.lru_cache(maxsize=4096)
+def _base32_to_hex(hash):
+    hash = base64.b32decode(hash)
+    hash = binascii.hexlify(hash)
+    return hash.decode('ascii')
+
+
+def parse_magnet(uri):
+    """Parse a magnet URI in a single pass.
+
+    Returns None if uri is not a magnet or a dict with keys:
+    - xt: normalized URN (see normalize_urn) or None if missing
+    - dn: display name or None
+    - xl: length (int) or None
+    - tr: list of trackers
+    Raises ValueError if URN can't be normalized.
+    """
+    if not uri.startswith('magnet:'):
+        return None
+
+    xt = dn = xl = None
+    tr = []
+
+    # Like parse_qs: last xt wins, blank values are ignored
+    for param in uri[uri.find('?') + 1:].split('&'):
+        key, _, value = param.partition('=')
+        if not value:
+            continue
+
+        if key == 'xt':
+            xt = value
+        elif key == 'dn':
+            dn = parse.unquote_plus(value)
+        elif key == 'xl':
+            try:
+                xl = int(value)
+            except ValueError:
+                pass
+        elif key == 'tr':
+            tr.append(parse.unquote_plus(value))
+
+    return {'xt': _normalize_xt(xt), 'dn': dn, 'xl': xl, 'tr': tr}
+
+
+def _normalize_xt(xt):
+    if xt is None:
+        return None
+
+    if '%' in xt or '+' in xt:
+        xt = parse.unquote_plus(xt)
+
+    return normalize_urn(xt)
+
+
+def urn_from_magnet(uri):
+    """Extract the normalized URN (see normalize_urn) from a magnet URI.
+
+    Returns None if uri is not a magnet or it doesn't have a 'xt' parameter.
+    Raises ValueError if URN can't be normalized.
+    """
+    if not uri.startswith('magnet:'):
+        return None
+
+    # Same as parse_magnet but skipping other parameters
+    xt = None
+    for param in uri[uri.find('?') + 1:].split('&'):
+        if param.startswith('xt=') and len(param) > 3:
+            xt = param[3:]
+
+    return _normalize_xt(xt)
+
+
+def normalize_many(uris):
+    """Batch version of urn_from_magnet.
+
+    Returns a list with the normalized URN for each uri. Non magnet URIs,
+    magnets without 'xt' and invalid URNs are returned as None.
+    """
+    # Same URI can be found multiple times (shared records, etc)
+    seen = {}
+    ret = []
+
+    for uri in uris:
+        if uri not in seen:
+            try:
+                seen[uri] = urn_from_magnet(uri)
+            except ValueError:
+                seen[uri] = None
+
+        ret.append(seen[uri])
+
+    return ret
+
+
+# Bencode tokens as returned by indexing bytes or mmap objects
+_BENCODE_INT = ord('i')
+_BENCODE_LIST = ord('l')
+_BENCODE_DICT = ord('d')
+_BENCODE_END = ord('e')
+_BENCODE_DIGITS = frozenset(b'0123456789')
+
+
+def _bencode_string_span(data, pos):
+    """Return the (start, end) span of the bencoded string at pos
+    """
+    colon = data.find(b':', pos)
+    if colon < 0:
+        raise ValueError(pos)
+
+    start = colon + 1
+    end = start + int(data[pos:colon])
+    if end > len(data):
+        raise ValueError(pos)
+
+    return start, end
+
+
+def _bencode_skip(data, pos):
+    """Return the position right after the bencoded value at pos.
+
+    Strings are skipped by its length, without being read
+    """
+    token = data[pos]
+
+    if token in _BENCODE_DIGITS:
+        return _bencode_string_span(data, pos)[1]
+
+    elif token == _BENCODE_INT:
+        end = data.find(b'e', pos)
+        if end < 0:
+            raise ValueError(pos)
+        return end + 1
+
+    elif token == _BENCODE_LIST or token == _BENCODE_DICT:
+        pos += 1
+        while data[pos] != _BENCODE_END:
+            pos = _bencode_skip(data, pos)
+        return pos + 1
+
+    raise ValueError(pos)
+
+
+def _bencode_decode(data, pos):
+    """Decode the bencoded value at pos.
+
+    Returns a tuple (value, end). Strings are returned as bytes
+    """
+    token = data[pos]
+
+    if token in _BENCODE_DIGITS:
+        start, end = _bencode_string_span(data, pos)
+        return bytes(data[start:end]), end
+
+    elif token == _BENCODE_INT:
+        end = _bencode_skip(data, pos)
+        return int(data[pos + 1:end - 1]), end
+
+    elif token == _BENCODE_LIST:
+        ret = []
+        pos += 1
+        while data[pos] != _BENCODE_END:
+            value, pos = _bencode_decode(data, pos)
+            ret.append(value)
+        return ret, pos + 1
+
+    elif token == _BENCODE_DICT:
+        ret = {}
+        for (key, value_pos) in _bencode_dict_items(data, pos):
+            ret[key], _ = _bencode_decode(data, value_pos)
+        return ret, _bencode_skip(data, pos)
+
+    raise ValueError(pos)
+
+
+def _bencode_dict_items(data, pos):
+    """Iterate over the dict at pos.
+
+    Yields tuples (key, value_pos) and values are not decoded, use
+    _bencode_decode or _bencode_skip on value_pos as needed
+    """
+    if data[pos] != _BENCODE_DICT:
+        raise ValueError(pos)
+
+    pos += 1
+    while data[pos] != _BENCODE_END:
+        start, end = _bencode_string_span(data, pos)
+        yield bytes(data[start:end]), end
+        pos = _bencode_skip(data, end)
+
+
+def _scan_torrent_data(data):
+    """Scan torrent metadata without decoding it.
+
+    Returns a tuple (info_span, fields): info_span is the (start, end) span
+    of the bencoded info dict and fields a dict with the decoded 'announce',
+    'announce-list', 'name' and 'length' keys (if present).
+    """
+    info_span = None
+    fields = {}
+
+    try:
+        for (key, pos) in _bencode_dict_items(data, 0):
+            if key in (b'announce', b'announce-list'):
+                fields[key.decode('ascii')], _ = _bencode_decode(data, pos)
+
+            elif key == b'info':
+                info_span = (pos, _bencode_skip(data, pos))
+                for (info_key, info_pos) in _bencode_dict_items(data, pos):
+                    if info_key in (b'name', b'length'):
+                        fields[info_key.decode('ascii')], _ = \
+                            _bencode_decode(data, info_pos)
+
+    except (IndexError, ValueError) as e:
+        msg = "Invalid or truncated torrent data"
+        raise ValueError(msg) from e
+
+    if info_span is None:
+        msg = "Missing info dict"
         raise ValueError(msg)
 
+    return info_span, fields
+
 
 def magnet_from_torrent_data(torrent_data):
+    """Build a magnet URI from torrent metadata.
+
+    torrent_data can be any bytes-like object supporting find (bytes, mmap,
+    etc). The infohash is calculated over the raw info span and only the
+    fields needed for the magnet are decoded.
+
+    Raises ValueError for invalid data.
+    """
     def flatten(x):
         if isinstance(x, list):
             for y in x:
@@ -77,37 +310,66 @@ def magnet_from_torrent_data(torrent_data):
         else:
             yield x
 
-    metadata = bencodepy.decode(torrent_data)
+    (start, end), fields = _scan_torrent_data(torrent_data)
+
+    with memoryview(torrent_data) as view:
+        digest = hashlib.sha1(view[start:end]).digest()
 
-    hash_contents = bencodepy.encode(metadata[b'info'])
-    digest = hashlib.sha1(hash_contents).digest()
     b32hash = base64.b32encode(digest)
 
-    info = {
-        'b32hash':  b32hash.decode('utf-8'),
-        'tr': [x.decode('utf-8') for x in
-               flatten(metadata.get(b'announce-list', []) or
-                       [metadata[b'announce']])],
-        'dn': metadata.get(b'info', {}).get(b'name', b'').decode('utf-8'),
-        'xl': metadata.get(b'info', {}).get(b'length')
-    }
+    trackers = fields.get('announce-list', [])
+    if not trackers and 'announce' in fields:
+        trackers = [fields['announce']]
 
-    try:
-        info['xl'] = int(info['xl'])
-    except (TypeError, ValueError):
-        del info['xl']
+    info = [
+        ('tr', [x.decode('utf-8') for x in flatten(trackers)]),
+        ('dn', fields.get('name', b'').decode('utf-8')),
+    ]
+    if isinstance(fields.get('length'), int):
+        info.append(('xl', fields['length']))
 
     magnet = 'magnet:?xt=urn:btih:{b32hash}&{params}'.format(
-        b32hash=info.pop('b32hash'),
-        params=parse.urlencode(info)
+        b32hash=b32hash.decode('utf-8'),
+        params=parse.urlencode(info, doseq=True)
     )
 
     return magnet
 
 
 def magnet_from_torrent_file(torrent_file):
+    """Build a magnet URI from a torrent file.
+
+    File is mapped into memory instead of being read.
+    """
     with open(torrent_file, 'rb') as fh:
-        return magnet_from_torrent_data(fh.read())
+        try:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            msg = "Empty torrent file"
+            raise ValueError(msg) from e
+
+        with mm:
+            return magnet_from_torrent_data(mm)
+
+
+def mock_torrent_data(name, length=1024, piece_length=256, trackers=None):
+    """Build valid torrent metadata for name (see mock_urn)
+    """
+    assert name and isinstance(name, str)
+
+    n_pieces = max(1, (length + piece_length - 1) // piece_length)
+    trackers = trackers or ['udp://tracker.local:80/announce']
+
+    return bencodepy.encode({
+        b'announce': trackers[0].encode('utf-8'),
+        b'announce-list': [[x.encode('utf-8')] for x in trackers],
+        b'info': {
+            b'name': name.encode('utf-8'),
+            b'length': length,
+            b'piece length': piece_length,
+            b'pieces': hashlib.sha1(name.encode('utf-8')).digest() * n_pieces
+        }
+    })
 
 
 def mock_urn(name):
@@ -19,6 +19,8 @@
 
 
 import abc
+import re
+from urllib import parse
 
 
 import appkit
@@ -52,6 +54,9 @@ class Extension(appkit.application.Extension):
 
 
 class BS4ParserProviderExtensionMixin:
+    # html.parser is pure Python, run it in worker processes
+    PARSER_EXECUTOR = 'process'
+
     def parse(self, buffer):
         return self.parse_soup(bs4.BeautifulSoup(buffer, "html.parser"))
 
@@ -63,6 +68,11 @@ class BS4ParserProviderExtensionMixin:
 class DownloaderExtension(Extension):
     """Extension point for downloaders"""
 
+    # Run plugin calls from Downloads.async_* in an executor. Only for
+    # thread safe plugins not using the application database (database
+    # sessions are per thread and must stay in the caller's transaction)
+    RUN_IN_EXECUTOR = False
+
     def add(self, source):
         """Adds source to download.
 
@@ -132,7 +142,21 @@ class ProviderExtension(Extension):
     """
     Extension for providers
     """
-    def __init__(self, *args, defaults=None, overrides=None, **kwargs):
+
+    # Minimal number of queries to use shared URIs (see get_shared_uris)
+    SHARED_URIS_MIN_QUERIES = 2
+
+    # Preferred executor for parse: 'thread' (C parsers like json, lxml or
+    # parsers using the application) or 'process' (pure Python parsers).
+    # See arroyo.helpers.scanner.Scanner.get_parser_executor
+    PARSER_EXECUTOR = 'thread'
+
+    # parse uses the application (shared state, database...), it always runs
+    # in the thread executor
+    PARSER_NEEDS_SHELL = False
+
+    def __init__(self, *args, defaults=None, overrides=None, base_uri=None,
+                 **kwargs):
         defaults = defaults or {}
         overrides = overrides or {}
 
@@ -150,9 +174,41 @@ class ProviderExtension(Extension):
 
         self.defaults = defaults
         self.overrides = overrides
+        self.base_uri = base_uri.rstrip('/') if base_uri else None
 
         super().__init__(*args, **kwargs)
 
+    def __getstate__(self):
+        # Providers are pickled to run its parser in a worker process.
+        # Application and logger can't be pickled, providers using them in
+        # parse must set PARSER_NEEDS_SHELL
+        state = self.__dict__.copy()
+        state['shell'] = None
+        state['logger'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = appkit.Null
+
+    def rewrite_uri(self, uri):
+        """
+        Point uri to base_uri (if any) keeping path and query.
+        Used to redirect requests to mirrors or to a local replay server.
+
+        rewrite_uri('https://eztv.ag/page_1') ->
+          'http://127.0.0.1:8080/eztv/page_1'
+        """
+        if not self.base_uri:
+            return uri
+
+        parsed = parse.urlparse(uri)
+        ret = self.base_uri + parsed.path
+        if parsed.query:
+            ret += '?' + parsed.query
+
+        return ret
+
     def compatible_uri(self, uri):
         attr_name = 'URI_PATTERNS'
         attr = getattr(self, attr_name, None)
@@ -181,15 +237,34 @@ class ProviderExtension(Extension):
     def get_query_uri(self, query):
         return None
 
+    def get_shared_uris(self, queries):
+        """
+        Optional capability: serve several queries from shared URIs (latest
+        additions listings, category feeds, etc) instead of one URI per
+        query.
+
+        Returns a list of tuples (uri, iterations, queries). Queries not
+        included in any tuple are scanned with get_query_uri.
+        """
+        return []
+
     @abc.abstractmethod
     def fetch(self, uri):
         with self.shell.get_async_http_client() as client:
-            return (yield from client.fetch(uri))
+            return (yield from client.fetch(self.rewrite_uri(uri)))
 
     @abc.abstractmethod
     def parse(self, buffer):
         raise NotImplementedError()
 
+    def is_cacheable(self, buffer):
+        """
+        Optional capability: check if a fetched buffer can be reused for the
+        same URI (see Scanner.get_buffer_from_uri). Providers getting error
+        payloads with successful responses must reject them.
+        """
+        return True
+
     def __unicode__(self):
         return "Provider({name})".format(
             name=self.__extension_name__)
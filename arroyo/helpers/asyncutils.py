@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import asyncio
+import functools
+
+
+try:
+    import contextvars
+except ImportError:
+    # Python < 3.7
+    contextvars = None
+
+
+def run_until_complete(coro):
+    """
+    Run coro in the current event loop from synchronous code.
+
+    Synchronous APIs (Application.search, Scanner.scan, etc) are thin
+    wrappers around its coroutine counterparts using this function, they
+    can't be called from a running loop.
+    """
+    loop = asyncio.get_event_loop()
+    if loop.is_running():
+        coro.close()
+        msg = ("Event loop is already running, use the coroutine API "
+               "(Application.asearch, Scanner.async_scan, etc)")
+        raise RuntimeError(msg)
+
+    return loop.run_until_complete(coro)
+
+
+def run_in_executor(executor, fn, *args):
+    """
+    loop.run_in_executor keeping context variables (like the current stats
+    scope, see arroyo.helpers.stats) in the worker thread.
+
+    Only for thread executors, context can't be sent to other processes.
+    """
+    if contextvars is not None:
+        fn = functools.partial(contextvars.copy_context().run, fn)
+
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(executor, fn, *args)
@@ -19,12 +19,73 @@
 
 
 import contextlib
+import threading
 
 
+import sqlalchemy
 from appkit.db import sqlalchemyutils as sautils
+from sqlalchemy import (
+    event,
+    orm,
+    pool
+)
 
 
 import arroyo
+import arroyo.bittorrentlib
+import arroyo.helpers.stats
+
+
+# Applied to each new SQLite connection. WAL allows readers to run
+# concurrently with a writer (daemon and CLI sharing the same database)
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -16 * 1024),
+    ('mmap_size', 64 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+)
+
+
+def create_engine(uri, pragmas=SQLITE_PRAGMAS):
+    kwargs = {}
+
+    url = sqlalchemy.engine.url.make_url(uri)
+    if (url.drivername.startswith('sqlite') and
+            url.database in (None, '', ':memory:')):
+        # In-memory databases exist only inside its connection, share it
+        # between threads
+        kwargs['poolclass'] = pool.StaticPool
+        kwargs['connect_args'] = {'check_same_thread': False}
+
+    engine = sqlalchemy.create_engine(uri, **kwargs)
+
+    if engine.dialect.name == 'sqlite' and pragmas:
+        @event.listens_for(engine, 'connect')
+        def _on_connect(dbapi_conn, connection_record):
+            cursor = dbapi_conn.cursor()
+            for (key, value) in pragmas:
+                cursor.execute('PRAGMA {key}={value}'.format(key=key,
+                                                             value=value))
+            cursor.close()
+
+    return engine
+
+
+def create_session(uri, pragmas=SQLITE_PRAGMAS):
+    """
+    Create tables (if needed) and return a thread local session (see
+    sqlalchemy.orm.scoped_session): each thread gets its own connection.
+
+    Sessions are not scoped per asyncio task: coroutines share the
+    session of the loop's thread and the ORM objects passed between them.
+    Worker threads must call session.remove() when they are done.
+    """
+    engine = create_engine(uri, pragmas=pragmas)
+    sautils.Base.metadata.create_all(engine)
+
+    return orm.scoped_session(orm.sessionmaker(bind=engine))
 
 
 class NoResultsFoundError(Exception):
@@ -36,27 +97,61 @@ class MultipleResultsFoundError(Exception):
 
 
 class Database:
-    def __init__(self, session):
+    def __init__(self, session, stats=None):
+        # Reads go directly through session, writes must be done inside a
+        # transaction block (see Database.transaction). There is no separate
+        # read path: reads see the pending changes of the current thread
         self.session = session
+        self.stats = stats or arroyo.helpers.stats.Stats()
+
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
 
     @contextlib.contextmanager
     def transaction(self):
-        yield self
-        self.session.commit()
+        """
+        Unit of work: changes made inside the block are committed at once
+        when it exits or rolled back on errors.
+
+        Blocks can be nested, only the outermost one commits. Writers from
+        different threads are serialized.
+
+        Coroutines share the loop's thread session, blocks must not contain
+        suspension points (yield from) or other tasks would see (and
+        commit) its changes.
+        """
+        with self._write_lock:
+            self._write_depth += 1
+            try:
+                yield self
+
+            except BaseException:
+                if self._write_depth == 1:
+                    self.session.rollback()
+                raise
+
+            else:
+                if self._write_depth == 1:
+                    with self.stats.timer('db.commit'):
+                        self.session.commit()
+
+            finally:
+                self._write_depth -= 1
 
     def add(self, obj):
         self.session.add(obj)
 
     def add_all(self, objs):
-        self.session.add_all([objs])
+        self.session.add_all(objs)
 
     def delete(self, obj):
         self.session.delete(obj)
 
-    def get(self, obj):
+    def _unique_attrs(self, obj):
         # Keep attrs in this method in sync with
         # models.py Unique fields
         attrs = None
+        model = obj.__class__
 
         if isinstance(obj, arroyo.Movie):
             attrs = ('title', 'modifier')
@@ -64,11 +159,17 @@ class Database:
             attrs = ('series', 'modifier', 'season', 'number')
         elif isinstance(obj, arroyo.Source):
             attrs = ('uri',)
+        elif isinstance(obj, arroyo.ScanRecord):
+            attrs = ('uri',)
+            model = arroyo.Source
         else:
-            raise NotImplemented(obj)
+            raise NotImplementedError(obj)
 
-        params = {attr: getattr(obj, attr) for attr in attrs}
-        db_obj = sautils.get(self.session, obj.__class__, **params)
+        return model, {attr: getattr(obj, attr) for attr in attrs}
+
+    def get(self, obj):
+        model, params = self._unique_attrs(obj)
+        db_obj = sautils.get(self.session, model, **params)
 
         if db_obj is None:
             raise NoResultsFoundError(obj)
@@ -79,14 +180,22 @@ class Database:
         return db_obj
 
     def merge(self, obj):
+        with self.stats.timer('db.merge'):
+            return self._merge(obj)
+
+    def _merge(self, obj):
         try:
             return self.get(obj)
         except NoResultsFoundError:
             pass
 
+        # Scan records become real models only when they reach the database
+        if isinstance(obj, arroyo.ScanRecord):
+            obj = obj.to_source()
+
         # Deep-first merging
         if isinstance(obj, arroyo.Source) and obj.entity:
-            obj.entity = self.merge(obj.entity)
+            obj.entity = self._merge(obj.entity)
 
         self.session.add(obj)
         return obj
@@ -94,5 +203,51 @@ class Database:
     def merge_all(self, objs):
         return [self.merge(obj) for obj in objs]
 
+    def known_urns(self):
+        """
+        Returns the set of URNs (as in Source.urn) of sources in the
+        database.
+
+        The same torrent can be found with different magnet URIs (hex or
+        base32 infohash, other trackers or names) so URNs are normalized
+        from all magnets. Lazy sources are skipped.
+        """
+        qs = self.session.query(arroyo.Source.uri)
+        qs = qs.filter(arroyo.Source.uri.like('magnet:%'))
+
+        urns = arroyo.bittorrentlib.normalize_many([uri for (uri,) in qs])
+        return set([urn[len('urn:'):] for urn in urns if urn])
+
+    def add_sources(self, sources):
+        """
+        Bulk version of merge for sources known to be new (see known_urns).
+
+        Sources are not looked up and entities shared between sources are
+        merged only once.
+        """
+        with self.stats.timer('db.add-sources'):
+            return self._add_sources(sources)
+
+    def _add_sources(self, sources):
+        entities = {}
+        ret = []
+
+        for src in sources:
+            if isinstance(src, arroyo.ScanRecord):
+                src = src.to_source()
+
+            if src.entity:
+                model, params = self._unique_attrs(src.entity)
+                key = (model, tuple(sorted(params.items())))
+                if key not in entities:
+                    entities[key] = self._merge(src.entity)
+
+                src.entity = entities[key]
+
+            ret.append(src)
+
+        self.session.add_all(ret)
+        return ret
+
     def list_downloads(self):
         return self.session.query(arroyo.Download).all()
@@ -18,9 +18,13 @@
 # USA.
 
 
+import asyncio
+
+
 import appkit
 import arroyo
 import arroyo.exc
+import arroyo.helpers.stats
 
 
 class AlreadyDownloadedError(Exception):
@@ -40,7 +44,7 @@ class ResolveLazySourceError(Exception):
 
 
 class Downloads:
-    def __init__(self, db, plugin, logger=None):
+    def __init__(self, db, plugin, logger=None, stats=None):
         # app.register_extension_point(Downloader)
         # app.register_extension_class(DownloadSyncCronTask)
         # app.register_extension_class(DownloadQueriesCronTask)
@@ -48,6 +52,7 @@ class Downloads:
         self.db = db
         self.plugin = plugin
         self.logger = logger or appkit.Null
+        self.stats = stats or arroyo.helpers.stats.Stats()
 
         self.plugin_name = plugin.__extension_name__
 
@@ -60,21 +65,64 @@ class Downloads:
         return self.plugin_name + ':' + s
 
     def sync(self):
+        with self.stats.timer('downloads.sync'):
+            with self.db.transaction():
+                db_sources = self._get_db_sources()
+                plugin_ids, plugin_states = self._get_plugin_states(
+                    [src.download.foreign_id for src in db_sources])
+                return self._sync(db_sources, plugin_ids, plugin_states)
+
+    @asyncio.coroutine
+    def async_sync(self):
+        """
+        Coroutine version of Downloads.sync.
+
+        Calls to network bound downloader plugins (see
+        DownloaderExtension.RUN_IN_EXECUTOR) run in the loop's default
+        executor while database access stays in the caller's thread.
+        """
+        with self.stats.timer('downloads.sync'):
+            db_sources = self._get_db_sources()
+            plugin_ids, plugin_states = yield from self._call_plugin(
+                self._get_plugin_states,
+                [src.download.foreign_id for src in db_sources])
+
+            with self.db.transaction():
+                return self._sync(db_sources, plugin_ids, plugin_states)
+
+    @asyncio.coroutine
+    def _call_plugin(self, fn, *args):
+        if not self.plugin.RUN_IN_EXECUTOR:
+            # Plugin may use the database, keep it in the caller's session
+            return fn(*args)
+
+        loop = asyncio.get_event_loop()
+        return (yield from loop.run_in_executor(None, fn, *args))
+
+    def _get_db_sources(self):
         qs = self.db.session.query(arroyo.Download)
         qs = qs.filter(
             arroyo.Download.foreign_id.startswith(self.plugin_name + ':'))
         qs = qs.filter(arroyo.Download.state != arroyo.DownloadState.ARCHIVED)
-        db_sources = [x.source for x in qs]
+        return [x.source for x in qs]
 
+    def _get_plugin_states(self, foreign_ids):
         plugin_ids = [self.add_plugin_prefix(x) for x in self.plugin.list()]
+        plugin_states = {
+            foreign_id: self.plugin.get_state(
+                self.strip_plugin_prefix(foreign_id))
+            for foreign_id in foreign_ids
+            if foreign_id in plugin_ids}
+
+        return plugin_ids, plugin_states
 
+    def _sync(self, db_sources, plugin_ids, plugin_states):
         # Update state on db sources with info from plugin
         state_changes = []
         for src in db_sources:
             if src.download.foreign_id in plugin_ids:
                 # src is present in downloader plugin
-                plugin_id = self.strip_plugin_prefix(src.download.foreign_id)
-                plugin_state = self.plugin.get_state(plugin_id)
+                plugin_state = plugin_states[src.download.foreign_id]
                 if plugin_state != src.download.state:
                     src.download.state = plugin_state
                     state_changes.append(src)
@@ -93,8 +141,6 @@ class Downloads:
 
                 state_changes.append(src)
 
-        self.db.session.commit()
-
         # Notify about state changes
         # for source in state_changes:
         #     self.app.signals.send('source-state-change', source=source)
@@ -106,12 +152,36 @@ class Downloads:
         ]
 
     def add(self, source):
+        with self.db.transaction():
+            self._add(source)
+
+    def _add(self, source):
         self.sync()
 
         if source.download:
             raise arroyo.exc.DuplicatedDownloadError()
 
-        foreign_id = self.plugin.add(source)
+        self._register(source, self.plugin.add(source))
+
+    @asyncio.coroutine
+    def async_add(self, source):
+        """
+        Coroutine version of Downloads.add, see Downloads.async_sync.
+
+        Don't call it with an open transaction, plugin may run in another
+        thread
+        """
+        yield from self.async_sync()
+
+        if source.download:
+            raise arroyo.exc.DuplicatedDownloadError()
+
+        foreign_id = yield from self._call_plugin(self.plugin.add, source)
+
+        with self.db.transaction():
+            self._register(source, foreign_id)
+
+    def _register(self, source, foreign_id):
         foreign_id = '{name}:{fid}'.format(
             name=self.plugin_name, fid=foreign_id)
         source.download = arroyo.Download(
@@ -121,12 +191,14 @@ class Downloads:
         #     selection = source.entity.SELECTION_MODEL(source=source)
         #     source.entity.selection = selection
 
-        self.db.session.commit()
-
     def list(self):
         return self.sync()
 
     def _remove(self, source, delete):
+        with self.db.transaction():
+            self._remove_in_transaction(source, delete)
+
+    def _remove_in_transaction(self, source, delete):
         downloads = self.list()
 
         if source not in downloads:
@@ -160,8 +232,6 @@ class Downloads:
             # Just set the state
             source.download.state = arroyo.DownloadState.ARCHIVED
 
-        self.db.session.commit()
-
     def archive(self, source):
         self._remove(source, delete=False)
 
@@ -187,6 +257,11 @@ class Downloads:
         return self._generic_all_wrapper(self.cancel, sources)
 
     def _generic_all_wrapper(self, fn, args):
+        # All operations are committed at once
+        with self.db.transaction():
+            return self._generic_all(fn, args)
+
+    def _generic_all(self, fn, args):
         ret = []
 
         for arg in args:
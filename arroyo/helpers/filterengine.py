@@ -27,10 +27,11 @@ from appkit import Null
 import arroyo
 import arroyo.exc
 import arroyo.extensions
+import arroyo.helpers.stats
 
 
 class Engine:
-    def __init__(self, filters=None, sorter=None, logger=None):
+    def __init__(self, filters=None, sorter=None, logger=None, stats=None):
         if filters is None:
             errmsg = "At least one filter is required"
             raise ValueError(filters, errmsg)
@@ -46,6 +47,7 @@ class Engine:
 
         self.registry = {}
         self.logger = logger or Null
+        self.stats = stats or arroyo.helpers.stats.Stats()
 
         for filter in filters or []:
             self.register(filter)
@@ -75,7 +77,12 @@ class Engine:
         else:
             prev = '?? (iterable)'
 
-        results = filter.apply(handler, value, results)
+        if self.stats.enabled:
+            # Filters are lazy, materialize results to get meaningful times
+            with self.stats.timer('filter.' + handler):
+                results = list(filter.apply(handler, value, results))
+        else:
+            results = filter.apply(handler, value, results)
 
         if isinstance(results, list):
             curr = len(results)
@@ -150,7 +157,8 @@ class Engine:
         return matches, missing
 
     def sorted(self, sources, query):
-        return self.sorter.sort(sources, query)
+        with self.stats.timer('sorter.sort'):
+            return self.sorter.sort(sources, query)
 
     def sorted_by(self, sources, **params):
         return self.sorted(sorted, arroyo.Query(**params))
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import os
+
+
+import appkit
+
+
+import arroyo
+import arroyo.bittorrentlib
+import arroyo.helpers.mediaparser
+import arroyo.helpers.stats
+
+
+def find_torrent_files(path):
+    """
+    Walk path yielding .torrent files in a stable order
+    """
+    for (dirpath, dirnames, filenames) in os.walk(path):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith('.torrent'):
+                yield os.path.join(dirpath, name)
+
+
+def magnet_from_file(path):
+    """
+    Process pool worker, returns a tuple (path, magnet, error)
+    """
+    try:
+        magnet = arroyo.bittorrentlib.magnet_from_torrent_file(path)
+    except (OSError, ValueError) as e:
+        return path, None, str(e) or e.__class__.__name__
+
+    return path, magnet, None
+
+
+class Importer:
+    """
+    Seed the database from a directory of .torrent files.
+
+    Magnets are calculated in a process pool, names are parsed and sources
+    are inserted in batches. After each batch a progress marker is saved
+    into app variables so an interrupted import can be resumed. Sources
+    already in the database are skipped.
+    """
+
+    # Files per batch (a transaction each)
+    BATCH_SIZE = 500
+
+    # Files sent to each worker at once
+    CHUNK_SIZE = 16
+
+    PROVIDER = 'import'
+    VARIABLES_NS = 'importer'
+
+    def __init__(self, db, mediaparser, variables, logger=None, stats=None,
+                 jobs=None, batch_size=None):
+        self.db = db
+        self.mediaparser = mediaparser
+        self.variables = variables
+        self.logger = logger or appkit.Null
+        self.stats = stats or arroyo.helpers.stats.Stats()
+        self.jobs = jobs or os.cpu_count() or 1
+        self.batch_size = batch_size or self.BATCH_SIZE
+
+    def marker_key(self, path):
+        digest = hashlib.sha1(os.path.abspath(path).encode('utf-8'))
+        return '{ns}.{digest}'.format(ns=self.VARIABLES_NS,
+                                      digest=digest.hexdigest())
+
+    def get_marker(self, path):
+        try:
+            return self.variables.get(self.marker_key(path))
+        except KeyError:
+            return None
+
+    def set_marker(self, path, value):
+        key = self.marker_key(path)
+        try:
+            self.variables.reset(key)
+        except KeyError:
+            pass
+
+        if value is not None:
+            self.variables.set(key, value)
+
+    def run(self, path, resume=True):
+        """
+        Import all .torrent files under path.
+
+        Returns a collections.Counter with the number of imported, known
+        (already in database), skipped (before progress marker) and failed
+        files.
+        """
+        counters = collections.Counter()
+        files = list(find_torrent_files(path))
+
+        marker = self.get_marker(path) if resume else None
+        if marker in files:
+            idx = files.index(marker) + 1
+            counters['skipped'] = idx
+            files = files[idx:]
+
+            msg = "Resuming import of '{path}' after {n} files"
+            msg = msg.format(path=path, n=idx)
+            self.logger.info(msg)
+
+        # Sources are deduplicated by URN, loaded once and updated after each
+        # batch
+        known = self.db.known_urns()
+
+        with self._mapper() as mapfn:
+            for idx in range(0, len(files), self.batch_size):
+                batch = files[idx:idx+self.batch_size]
+
+                with self.stats.timer('importer.hash'):
+                    results = list(mapfn(magnet_from_file, batch))
+
+                self.import_batch(results, counters, known)
+                self.set_marker(path, batch[-1])
+
+        # Import is complete, next run starts from the beginning
+        self.set_marker(path, None)
+
+        return counters
+
+    @contextlib.contextmanager
+    def _mapper(self):
+        if self.jobs == 1:
+            yield map
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.jobs) as pool:
+            yield functools.partial(pool.map, chunksize=self.CHUNK_SIZE)
+
+    def import_batch(self, results, counters, known):
+        # Build records, duplicated infohashes are merged. known is the set
+        # of URNs already in the database (see Database.known_urns), it's
+        # updated with the imported records
+        records = collections.OrderedDict()
+        for (path, magnet, error) in results:
+            if error:
+                msg = "Unable to read '{path}': {error}"
+                msg = msg.format(path=path, error=error)
+                self.logger.warning(msg)
+                counters['errors'] += 1
+                continue
+
+            record = arroyo.ScanRecord(
+                name=self.name_from_magnet(magnet) or
+                os.path.splitext(os.path.basename(path))[0],
+                uri=magnet,
+                provider=self.PROVIDER)
+
+            if record.urn in records or record.urn in known:
+                counters['known'] += 1
+                continue
+
+            records[record.urn] = record
+
+        records = list(records.values())
+
+        with self.stats.timer('importer.parse'):
+            for record in records:
+                self.parse_record(record)
+
+        with self.stats.timer('importer.insert'):
+            with self.db.transaction():
+                self.db.add_sources(records)
+
+        known.update([x.urn for x in records])
+        counters['imported'] += len(records)
+
+    def parse_record(self, record):
+        try:
+            entity, tags = self.mediaparser.parse(record)
+
+        except (arroyo.helpers.mediaparser.InvalidEntityTypeError,
+                arroyo.helpers.mediaparser.InvalidEntityArgumentsError) as e:
+            # Source is imported anyway, without entity
+            msg = "Unable to parse '{name}': {e}"
+            msg = msg.format(name=record.name, e=e)
+            self.logger.debug(msg)
+            return
+
+        record.entity = entity
+        record.tags = tags
+
+    @staticmethod
+    def name_from_magnet(magnet):
+        parsed = arroyo.bittorrentlib.parse_magnet(magnet)
+        return parsed['dn'] if parsed else None
@@ -18,21 +18,30 @@
 # USA.
 
 
+import re
+import threading
 from urllib import parse
 
 
-import babelfish
-import guessit
 from appkit.blocks import cache
 from appkit import utils, Null
 
 
 import arroyo
 import arroyo.models
+import arroyo.helpers.tagger
 
 
 PARSEABLE_TYPES = ['']
 
+# guessit builds its whole rebulk rule tree at import time, and it (along with
+# babelfish) costs hundreds of milliseconds. Those modules are loaded on first
+# use by _load_backends() so commands that never parse names don't pay for
+# them. Daemon/worker modes can pay the price upfront using warmup()
+babelfish = None
+guessit = None
+_backends_lock = threading.Lock()
+
 # {
 #     Entity name: (guessit key, Entity attribute, transformation)
 # }
@@ -68,6 +77,7 @@ META_FIELD_TRANSLATIONS = [
     ('mimetype', 'mimetype'),
     ('proper_count', 'release.proper', lambda x: int(x) > 0),
     ('other', 'guessit.other'),
+    ('release_bad_tags', 'release.bad-tags'),
     ('release_distributors', 'release.distributors'),
     ('release_group', 'release.group'),
     ('screen_size', 'video.screen-size'),
@@ -79,12 +89,68 @@ META_FIELD_TRANSLATIONS = [
 ]
 
 
-# keep lower case!!
-KNOWN_DISTRIBUTORS = [
-    'ethd',
-    'eztv',
-    'rartv',
-]
+# Fast path for uniform scene names
+# (Series.Name.S01E02.720p.HDTV.x264-GROUP, Movie.Title.2017.1080p.BluRay...)
+# Those names are recognized with a precompiled regex and produce the same
+# data as guessit would, without running the whole rebulk rule engine.
+# Only tokens with a well known guessit interpretation are accepted, anything
+# else (including any dubious title word) is deferred to guessit.
+
+FAST_PATH_SCREEN_SIZES = {
+    '480p': '480p',
+    '720p': '720p',
+    '1080p': '1080p',
+}
+
+FAST_PATH_FORMATS = {
+    'bluray': 'BluRay',
+    'hdtv': 'HDTV',
+    'web-dl': 'WEB-DL',
+    'webrip': 'WEBRip',
+}
+
+FAST_PATH_VIDEO_CODECS = {
+    'h264': 'h264',
+    'x264': 'h264',
+    'x265': 'h265',
+    'xvid': 'XviD',
+}
+
+# Title words with some meaning for guessit (languages, countries, editions,
+# other tags, etc). Keep lower case!!
+FAST_PATH_RISKY_WORDS = frozenset([
+    'audio', 'bonus', 'cam', 'chi', 'complete', 'converted', 'custom',
+    'director', 'directors', 'doc', 'docu', 'dual', 'dubbed', 'dutch', 'dvd',
+    'eng', 'english', 'episode', 'esp', 'extended', 'final', 'fix', 'fre',
+    'french', 'ger', 'german', 'hdr', 'imax', 'internal', 'ita', 'italian',
+    'jap', 'japanese', 'kor', 'korean', 'limited', 'multi', 'ova', 'part',
+    'pilot', 'preair', 'proper', 'real', 'remastered', 'remux', 'repack',
+    'retail', 'rip', 'rus', 'russian', 'sample', 'screener', 'season',
+    'spa', 'spanish', 'special', 'subbed', 'subs', 'swe', 'swedish',
+    'trailer', 'uncensored', 'uncut', 'unrated', 'usa', 'vostfr', 'web',
+])
+
+# Short title words known to be safe (other short words can be language or
+# country codes)
+FAST_PATH_SHORT_WORDS = frozenset(['a', 'of'])
+
+_FAST_PATH_TAGS = (
+    r'(?:(?P<screen_size>\d{3,4}p)\.)?'
+    r'(?P<format>[A-Za-z]+(?:-DL)?)\.'
+    r'(?P<video_codec>[A-Za-z0-9]+)'
+    r'-(?P<release_group>[A-Za-z0-9]+)$'
+)
+
+_FAST_PATH_EPISODE_RE = re.compile(
+    r'^(?P<title>[A-Za-z]+(?:\.[A-Za-z]+)*)'
+    r'(?:\.(?P<year>(?:19|20)\d{2}))?'
+    r'\.S(?P<season>\d{2})E(?P<episode>\d{2})\.' +
+    _FAST_PATH_TAGS)
+
+_FAST_PATH_MOVIE_RE = re.compile(
+    r'^(?P<title>[A-Za-z]+(?:\.[A-Za-z]+)*)'
+    r'\.(?P<year>(?:19|20)\d{2})\.' +
+    _FAST_PATH_TAGS)
 
 
 class InvalidEntityTypeError(Exception):
@@ -95,6 +161,96 @@ class InvalidEntityArgumentsError(Exception):
     pass
 
 
+def _load_backends():
+    global babelfish, guessit
+
+    if guessit is not None:
+        return
+
+    with _backends_lock:
+        if guessit is not None:
+            return
+
+        import babelfish as _babelfish
+        import guessit as _guessit
+
+        babelfish = _babelfish
+        guessit = _guessit
+
+
+def warmup():
+    """
+    Load parser backends and run a dummy parse to build any lazy structure.
+
+    Optional, parsing works without calling it first.
+    """
+    _load_backends()
+    guessit.guessit('Warmup.S01E01.720p.HDTV.x264-ARROYO')
+
+
+def fast_parse(name, type=None):
+    """
+    Recognize common scene names without guessit.
+
+    name must be already stripped of distributors (see
+    MediaParser._guessit_parse).
+    Returns a dict with the same keys and values guessit would return or
+    None if name is not a high-confidence case.
+    """
+    m = None
+    if type in ('episode', None):
+        m = _FAST_PATH_EPISODE_RE.match(name)
+        if m:
+            type = 'episode'
+
+    if m is None and type in ('movie', None):
+        m = _FAST_PATH_MOVIE_RE.match(name)
+        if m:
+            type = 'movie'
+
+    if m is None:
+        return None
+
+    title = m.group('title').split('.')
+    if any([(len(x) < 3 and x.lower() not in FAST_PATH_SHORT_WORDS) or
+            x.lower() in FAST_PATH_RISKY_WORDS
+            for x in title]):
+        return None
+
+    try:
+        info = {
+            'type': type,
+            'title': ' '.join(title),
+            'format': FAST_PATH_FORMATS[m.group('format').lower()],
+            'video_codec': FAST_PATH_VIDEO_CODECS[
+                m.group('video_codec').lower()],
+        }
+        if m.group('screen_size'):
+            info['screen_size'] = FAST_PATH_SCREEN_SIZES[
+                m.group('screen_size').lower()]
+    except KeyError:
+        return None
+
+    # Release group can't be any other known tag
+    group = m.group('release_group')
+    if (group.lower() in FAST_PATH_RISKY_WORDS or
+            group.lower() in FAST_PATH_FORMATS or
+            group.lower() in FAST_PATH_VIDEO_CODECS or
+            group.lower() in FAST_PATH_SCREEN_SIZES):
+        return None
+
+    info['release_group'] = group
+
+    if m.group('year'):
+        info['year'] = int(m.group('year'))
+
+    if type == 'episode':
+        info['season'] = int(m.group('season'))
+        info['episode'] = int(m.group('episode'))
+
+    return info
+
+
 def transfer_items(input, output, translations):
     for translation in translations:
         if len(translation) == 3:
@@ -138,11 +294,13 @@ class MediaParser:
     - _ebook_parse for ebooks
     """
 
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, fast_path=True, tagger=None):
         # app.signals.connect('sources-added-batch', self._on_source_batch)
         # app.signals.connect('sources-updated-batch', self._on_source_batch)
         self.logger = logger or Null
         self.cache = ParseCache()
+        self.fast_path = fast_path
+        self.tagger = tagger or arroyo.helpers.tagger.default_tagger()
 
     def parse_name(self, name, hints={}):
         type = hints.get('type')
@@ -229,24 +387,22 @@ class MediaParser:
         # In order to fix this we made a "preprocessing" to extract (and
         # remove) known distributors from source's name and add distribution
         # field into info after processing source's name with guessit.
-        distributors = set()
-        for dist in KNOWN_DISTRIBUTORS:
-            tag = '[' + dist + ']'
-            idx = name.lower().find(tag)
-            if idx == -1:
-                continue
-
-            name = (name[:idx] + name[idx+len(tag):]).strip()
-            distributors.add(dist)
+        # Known release groups and bad tags are found in the same pass (see
+        # arroyo.helpers.tagger)
+        name, tagged = self.tagger.tag(name)
 
         # Step 2:
-        # Parse name with guessit using its type as a type hint
-        info = guessit.guessit(name, options={'type': type})
+        # Parse name with guessit using its type as a type hint.
+        # Common scene names are recognized by fast_parse without guessit.
+        info = fast_parse(name, type) if self.fast_path else None
+        if info is None:
+            _load_backends()
+            info = guessit.guessit(name, options={'type': type})
 
         # Step 3:
-        # Re-introduce distributors from step 1
-        if distributors:
-            info['release_distributors'] = list(distributors)
+        # Re-introduce data from step 1. Known release groups have precedence
+        # over guessit's guesses
+        info.update(tagged)
 
         # Step 4:
         # Remove empty values
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import cProfile
+import fnmatch
+import pstats
+import threading
+import tracemalloc
+
+
+from appkit import Null
+
+
+# Stages tracked by MemoryTracker. Per item stages (mediaparser.parse) and
+# concurrent ones (scanner.fetch) are not included on purpose: they would
+# take a snapshot for each source or mix data between fetches
+MEMORY_TRACKED_STAGES = (
+    'scanner.origins',
+    'scanner.parse.*',
+    'scanner.normalize',
+    'search.post-process',
+    'filter.*',
+    'sorter.sort',
+    'db.merge',
+    'downloads.sync',
+)
+
+
+def collapsed_stacks(stats, max_depth=64, min_fraction=0.0001,
+                     max_stacks=100000):
+    """
+    Convert a pstats.Stats object into collapsed stacks (the input format of
+    flamegraph.pl and compatible tools): one line per stack with frames
+    separated by ';' and its self time in microseconds.
+
+    cProfile only records caller-callee pairs so stacks are rebuilt walking
+    the call graph from the roots and splitting each function's time between
+    its callers proportionally.
+
+    The number of paths in a call graph grows exponentially, the walk is
+    bounded: stacks deeper than max_depth, stacks with less than min_fraction
+    of the total time and stacks beyond the first max_stacks are not
+    expanded, its whole (cumulative) time is reported as self time of its
+    last frame. Total time is preserved.
+    """
+    def label(func):
+        filename, lineno, funcname = func
+        return '{}:{}({})'.format(filename, lineno, funcname).replace(';', ',')
+
+    data = stats.stats
+    callees = {func: {} for func in data}
+    roots = []
+
+    for (func, (cc, nc, tt, ct, callers)) in data.items():
+        if not callers:
+            roots.append(func)
+
+        for (caller, edge) in callers.items():
+            if caller in callees:
+                callees[caller][func] = edge
+
+    ret = {}
+    labels = {func: label(func) for func in data}
+    min_time = sum([data[root][3] for root in roots]) * min_fraction
+    budget = [max_stacks]
+
+    def walk(func, path, key, scale):
+        tt, ct = data[func][2], data[func][3]
+        budget[0] -= 1
+
+        if (len(path) >= max_depth or ct * scale < min_time or
+                budget[0] <= 0):
+            ret[key] = ret.get(key, 0) + ct * scale
+            return
+
+        ret[key] = ret.get(key, 0) + tt * scale
+
+        for (callee, edge) in callees[func].items():
+            callee_ct = data[callee][3]
+            if callee in path or not callee_ct:
+                continue
+
+            # edge[3] is the cumulative time of callee when called from func
+            path.add(callee)
+            walk(callee, path, key + ';' + labels[callee],
+                 scale * edge[3] / callee_ct)
+            path.remove(callee)
+
+    for root in roots:
+        walk(root, set([root]), labels[root], 1.0)
+
+    return [
+        '{} {}'.format(stack, int(elapsed * 1000000))
+        for (stack, elapsed) in sorted(ret.items())
+        if int(elapsed * 1000000) > 0
+    ]
+
+
+class MemoryTracker:
+    """
+    Stats observer (see arroyo.helpers.stats.Stats.observer) recording
+    tracemalloc snapshot differences for each pipeline stage.
+
+    Only top level stages matching MEMORY_TRACKED_STAGES are measured.
+    """
+    def __init__(self, stages=MEMORY_TRACKED_STAGES, frames=1):
+        self.stages = stages
+        self.frames = frames
+        self.diffs = {}
+        self._current = None
+        self._snapshot = None
+
+    def start(self):
+        tracemalloc.start(self.frames)
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def _take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__)
+        ])
+
+    def _is_tracked(self, name):
+        return any([fnmatch.fnmatch(name, pattern) for pattern in self.stages])
+
+    def stage_enter(self, name):
+        if self._current is not None or not self._is_tracked(name):
+            return
+
+        self._current = name
+        self._snapshot = self._take_snapshot()
+
+    def stage_exit(self, name):
+        if self._current != name:
+            return
+
+        diff = self._take_snapshot().compare_to(self._snapshot, 'lineno')
+        acc = self.diffs.setdefault(name, {})
+        for stat in diff:
+            key = str(stat.traceback)
+            size, count = acc.get(key, (0, 0))
+            acc[key] = (size + stat.size_diff, count + stat.count_diff)
+
+        self._current = None
+        self._snapshot = None
+
+    def report(self, top=10):
+        lines = []
+        for (stage, acc) in sorted(self.diffs.items()):
+            total = sum([size for (size, count) in acc.values()])
+            lines.append('{stage}: {total:+d} bytes'.format(
+                stage=stage, total=total))
+
+            items = sorted(acc.items(), key=lambda x: -x[1][0])[:top]
+            for (location, (size, count)) in items:
+                line = '    {size:+d} bytes {count:+d} blocks {loc}'
+                line = line.format(size=size, count=count, loc=location)
+                lines.append(line)
+
+        return lines
+
+
+class Profiler:
+    """
+    cProfile wrapper for command execution.
+
+    Writes a pstats file into path plus a collapsed-stacks file
+    (<path>.collapsed.txt). If memory is True allocations for each stage are
+    recorded with tracemalloc and saved into <path>.memory.txt
+
+    Threads started while profiling (executors used by parsers, see
+    arroyo.helpers.scanner) are profiled too and merged into the main
+    profile. Work done in worker processes (parser executor 'process') is
+    not recorded.
+    """
+    def __init__(self, path, memory=False, logger=None):
+        self.path = path
+        self.logger = logger or Null
+        self.profile = cProfile.Profile()
+        self.thread_profiles = []
+        self.memory = MemoryTracker() if memory else None
+        self._lock = threading.Lock()
+
+    def _profile_thread(self, *args):
+        # Called (once) from new threads, see threading.setprofile.
+        # Enabling the profiler replaces this function as profile hook
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Only one profiler can be active in newer Python versions
+            return
+
+        with self._lock:
+            self.thread_profiles.append(profile)
+
+    @property
+    def basepath(self):
+        if self.path.endswith('.pstats'):
+            return self.path[:-len('.pstats')]
+
+        return self.path
+
+    def start(self):
+        if self.memory:
+            self.memory.start()
+
+        threading.setprofile(self._profile_thread)
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        threading.setprofile(None)
+
+        if self.memory:
+            self.memory.stop()
+
+        self.save()
+
+    def get_stats(self):
+        stats = pstats.Stats(self.profile)
+
+        with self._lock:
+            for profile in self.thread_profiles:
+                profile.disable()
+                stats.add(profile)
+
+        return stats
+
+    def save(self):
+        self.get_stats().dump_stats(self.path)
+        outputs = [self.path]
+
+        collapsed_path = self.basepath + '.collapsed.txt'
+        with open(collapsed_path, 'w') as fh:
+            stats = self.get_stats()
+            for line in collapsed_stacks(stats):
+                fh.write(line + '\n')
+        outputs.append(collapsed_path)
+
+        if self.memory:
+            memory_path = self.basepath + '.memory.txt'
+            with open(memory_path, 'w') as fh:
+                for line in self.memory.report():
+                    fh.write(line + '\n')
+            outputs.append(memory_path)
+
+        msg = "Profile data saved to {outputs}"
+        msg = msg.format(outputs=', '.join(outputs))
+        self.logger.info(msg)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import asyncio
+import collections
+import socket
+
+
+import aiohttp
+import appkit
+import appkit.blocks.cache
+
+
+import arroyo.bittorrentlib
+import arroyo.helpers.asyncutils
+import arroyo.helpers.stats
+from arroyo.helpers.downloads import ResolveLazySourceError
+
+
+class Resolver:
+    """
+    Turns lazy sources (those with a http URI instead of a magnet, see
+    Source.needs_postprocessing) into regular ones.
+
+    The URI is fetched using the source's provider. If it points to a
+    .torrent file the magnet is built from its metadata, otherwise the
+    buffer is handled by the provider's parser (detail pages) and the first
+    magnet is used.
+    """
+
+    # Max number of simultaneous fetches
+    CONCURRENCY = 4
+
+    def __init__(self, providers=None, logger=None, stats=None, cache=None,
+                 concurrency=None):
+        if providers is None:
+            msg = "No providers supplied"
+            raise ValueError(providers, msg)
+
+        self.providers = dict(providers)
+        self.logger = logger or appkit.Null
+        self.stats = stats or arroyo.helpers.stats.Stats()
+        self.cache = (cache if cache is not None
+                      else appkit.blocks.cache.NullCache())
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.counters = collections.Counter()
+
+    def resolve(self, source):
+        return arroyo.helpers.asyncutils.run_until_complete(
+            self.async_resolve(source))
+
+    @asyncio.coroutine
+    def async_resolve(self, source):
+        failed = yield from self.async_resolve_all([source])
+        if failed:
+            msg = "Unable to resolve «{uri}»"
+            msg = msg.format(uri=source.uri)
+            raise ResolveLazySourceError(msg)
+
+    def resolve_all(self, sources):
+        return arroyo.helpers.asyncutils.run_until_complete(
+            self.async_resolve_all(sources))
+
+    @asyncio.coroutine
+    def async_resolve_all(self, sources):
+        """
+        Resolve lazy sources in place, concurrently.
+
+        Returns the list of sources that couldn't be resolved
+        """
+        lazy = [src for src in sources if src.needs_postprocessing]
+        if not lazy:
+            return []
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        @asyncio.coroutine
+        def _resolve(src):
+            yield from semaphore.acquire()
+            try:
+                magnet = yield from self.resolve_uri(src.provider, src.uri)
+
+            except ResolveLazySourceError as e:
+                msg = "Unable to resolve «{uri}»: {e}"
+                msg = msg.format(uri=src.uri, e=e)
+                self.logger.error(msg)
+                self.stats.incr('resolver.errors')
+                return src
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                # Unexpected errors (provider bugs, etc) must not abort the
+                # other sources
+                msg = "Unable to resolve «{uri}»: [{type}] {e}"
+                msg = msg.format(uri=src.uri, type=e.__class__.__name__,
+                                 e=str(e) or 'no reason')
+                self.logger.error(msg)
+                self.stats.incr('resolver.errors')
+                return src
+
+            finally:
+                semaphore.release()
+
+            src.uri = magnet
+            return None
+
+        with self.stats.timer('resolver.resolve'):
+            failed = yield from asyncio.gather(
+                *[_resolve(src) for src in lazy])
+
+        return [src for src in failed if src is not None]
+
+    @asyncio.coroutine
+    def resolve_uri(self, provider_name, uri):
+        try:
+            magnet = self.cache.get(uri)
+            self.counters['resolve.cache'] += 1
+            return magnet
+
+        except KeyError:
+            pass
+
+        try:
+            provider = self.providers[provider_name]
+        except KeyError as e:
+            msg = "Provider «{name}» not available"
+            msg = msg.format(name=provider_name)
+            raise ResolveLazySourceError(msg) from e
+
+        self.stats.incr('resolver.fetch')
+        try:
+            with self.stats.timer('resolver.fetch'):
+                buff = yield from provider.fetch(uri)
+
+        except (socket.gaierror,
+                asyncio.TimeoutError,
+                aiohttp.client_exceptions.ClientOSError,
+                aiohttp.client_exceptions.ClientResponseError,
+                aiohttp.client_exceptions.ServerDisconnectedError) as e:
+            msg = "[{type}] {e}"
+            msg = msg.format(type=e.__class__.__name__,
+                             e=str(e) or 'no reason')
+            raise ResolveLazySourceError(msg) from e
+
+        if not buff:
+            msg = "Empty buffer"
+            raise ResolveLazySourceError(msg)
+
+        magnet = self.magnet_from_buffer(provider, buff)
+        self.counters['resolve.fetch'] += 1
+        self.cache.set(uri, magnet)
+
+        return magnet
+
+    def magnet_from_buffer(self, provider, buff):
+        if isinstance(buff, bytes) and buff.startswith(b'd'):
+            # Looks like a bencoded .torrent
+            try:
+                return arroyo.bittorrentlib.magnet_from_torrent_data(buff)
+            except ValueError:
+                pass
+
+        try:
+            psrcs = provider.parse(buff)
+        except Exception as e:
+            msg = "Parser error: {e}"
+            msg = msg.format(e=e)
+            raise ResolveLazySourceError(msg) from e
+
+        for psrc in psrcs or []:
+            uri = psrc.get('uri') or ''
+            if uri.startswith('magnet:?'):
+                return uri
+
+        msg = "No magnet found"
+        raise ResolveLazySourceError(msg)
@@ -19,9 +19,13 @@
 
 
 import asyncio
+import collections
+import hashlib
+import pickle
 import traceback
 import socket
 import sys
+import time
 
 
 import aiohttp
@@ -34,6 +38,26 @@ import arroyo
 import arroyo.bittorrentlib
 import arroyo.exc
 import arroyo.extensions
+import arroyo.helpers.asyncutils
+import arroyo.helpers.stats
+
+
+# Providers unpickled in this (worker) process, see _parse_buffer
+_worker_providers = {}
+
+
+def _parse_buffer(provider, buffer):
+    # Module level function, it can be called from worker processes.
+    # Worker processes get a tuple (key, pickled provider) instead of the
+    # provider (see Scanner._pickle_provider), each worker unpickles it once
+    if isinstance(provider, tuple):
+        key, data = provider
+        try:
+            provider = _worker_providers[key]
+        except KeyError:
+            provider = _worker_providers[key] = pickle.loads(data)
+
+    return provider.parse(buffer)
 
 
 class Origin:
@@ -65,15 +89,56 @@ class Origin:
 
 
 class Scanner:
-    def __init__(self, logger=None, providers=None):
+    # Seconds a fetched buffer is reused for identical URIs
+    FETCH_MEMO_TTL = 5*60
+    # Executor for provider parsers: 'thread', 'process' or 'auto' (use
+    # provider's ProviderExtension.PARSER_EXECUTOR)
+    PARSER_EXECUTOR = 'auto'
+    PARSER_EXECUTORS = ('auto', 'thread', 'process')
+
+    def __init__(self, logger=None, providers=None, stats=None,
+                 shared_uris=True, fetch_memo_ttl=None, executor=None,
+                 parser_executor=None, get_process_executor=None):
         if providers is None:
             msg = "No providers supplied"
             raise ValueError(providers, msg)
 
+        parser_executor = parser_executor or self.PARSER_EXECUTOR
+        if parser_executor not in self.PARSER_EXECUTORS:
+            msg = "Invalid parser executor: {value}"
+            msg = msg.format(value=repr(parser_executor))
+            raise ValueError(parser_executor, msg)
+
         self.logger = logger or appkit.Null
         self.providers = providers
+        self.shared_uris = shared_uris
+        # Executor for CPU bound work, None means loop's default executor
+        self.executor = executor
+        self.parser_executor = parser_executor
+        # Callable returning the process pool for parsers, owned by the
+        # caller (see Application.get_process_executor). It's called only
+        # when a parser runs in the process executor. Without it all parsers
+        # run in threads
+        self.get_process_executor = get_process_executor
+        self._pickled = {}
+        self.stats = stats or arroyo.helpers.stats.Stats()
+        self.counters = collections.Counter()
+
+        # Fetch coalescing: identical URIs (for the same provider) being
+        # fetched concurrently share the same request and successful results
+        # are reused for fetch_memo_ttl seconds
+        if fetch_memo_ttl is None:
+            fetch_memo_ttl = self.FETCH_MEMO_TTL
+        self.fetch_memo_ttl = fetch_memo_ttl
+        self._fetch_inflight = {}
+        self._fetch_memo = {}
 
     def scan(self, query):
+        return arroyo.helpers.asyncutils.run_until_complete(
+            self.async_scan(query))
+
+    @asyncio.coroutine
+    def async_scan(self, query):
         # def _scan(origins_data):
         #     for source in origins_data:
         #         try:
@@ -89,14 +154,157 @@ class Scanner:
         #             meta=meta)
 
         # Get origins for query
-        origins = self.origins_for_query(query)
-        origins_data = self.process(*origins)
+        with self.stats.timer('scanner.origins'):
+            origins = self.origins_for_query(query)
+
+        origins_data = yield from self.async_process(*origins)
 
         # ret = list(_scan(origins_data))
-        ret = [
-            (arroyo.Source(**x), None)
-            for x in origins_data
-        ]
+        return [(record, None)
+                for (_, record) in self._build_records(*origins_data)]
+
+    def scan_many(self, queries, shared_uris=None):
+        return arroyo.helpers.asyncutils.run_until_complete(
+            self.async_scan_many(queries, shared_uris=shared_uris))
+
+    @asyncio.coroutine
+    def async_scan_many(self, queries, shared_uris=None):
+        """Scan several queries at once.
+
+        Queries are coalesced (see Scanner.plan): each distinct URI is
+        fetched once and its results are shared by all the queries it
+        serves. Records are shared too, they are the same objects in all
+        queries' results.
+
+        Returns:
+          A dict {query: [(ScanRecord, None), ...]}
+        """
+        with self.stats.timer('scanner.origins'):
+            plan = self.plan(queries, shared_uris=shared_uris)
+
+        origins_data = yield from self.async_get_data_from_origins(
+            *[origin for (origin, _) in plan])
+
+        # Which queries are served by each psource (by its dedup key)
+        queries_for_origin = {id(origin): qs for (origin, qs) in plan}
+        served = collections.defaultdict(list)
+        self._add_urns(*[psrc for (_, _, psrc) in origins_data])
+        for (origin, uri, psrc) in origins_data:
+            psrc['provider'] = origin.provider_name
+            served[self._deduplication_key(psrc)].append(
+                queries_for_origin[id(origin)])
+
+        psrcs = self._deduplicate_source_data(
+            *[psrc for (_, _, psrc) in origins_data])
+
+        ret = collections.OrderedDict([(query, []) for query in queries])
+        for (psrc, record) in self._build_records(*psrcs):
+            targets = set()
+            for qs in served[self._deduplication_key(psrc)]:
+                targets.update(qs)
+
+            for query in targets:
+                ret[query].append((record, None))
+
+        return ret
+
+    def plan(self, queries, shared_uris=None):
+        """Build the origins needed to scan all queries.
+
+        Providers implementing ProviderExtension.get_shared_uris serve
+        several queries from shared listings (unless shared_uris, by default
+        Scanner.shared_uris, is False); other queries get its own origin
+        from ProviderExtension.get_query_uri. Queries resolving to the same
+        URI share the origin.
+
+        Returns:
+          A list of tuples (origin, [queries])
+        """
+        if shared_uris is None:
+            shared_uris = self.shared_uris
+
+        plan = collections.OrderedDict()
+
+        def _add(provider, uri, iterations, qs):
+            key = (provider.__extension_name__, uri)
+            if key in plan:
+                origin, prev = plan[key]
+                origin.iterations = max(origin.iterations, iterations)
+                prev.extend([q for q in qs if q not in prev])
+            else:
+                plan[key] = (Origin(provider, uri=uri, iterations=iterations),
+                             list(qs))
+
+        for (name, ext) in self.providers:
+            served = set()
+
+            if shared_uris and len(queries) > 1:
+                for (uri, iterations, qs) in ext.get_shared_uris(queries):
+                    _add(ext, uri, iterations, qs)
+                    served.update(qs)
+
+                    msg = ("Provider '{name}' serves {n} queries from "
+                           "{uri}")
+                    msg = msg.format(name=name, n=len(qs), uri=uri)
+                    self.logger.info(msg)
+
+            for query in queries:
+                if query in served:
+                    continue
+
+                uri = self._get_query_uri(name, ext, query)
+                if uri:
+                    _add(ext, uri, 1, [query])
+
+        planned = set()
+        for (_, qs) in plan.values():
+            planned.update(qs)
+
+        for query in queries:
+            if query not in planned:
+                msg = "No compatible origins found for {query!r}"
+                msg = msg.format(query=query)
+                self.logger.error(msg)
+
+        msg = "{n_queries} queries planned into {n_origins} origins"
+        msg = msg.format(n_queries=len(queries), n_origins=len(plan))
+        self.logger.info(msg)
+
+        return list(plan.values())
+
+    def shared_queries(self, queries):
+        """
+        Queries served (at least by one provider) from shared URIs.
+
+        Shared URIs are listings of recent additions, queries for older
+        sources should be scanned again with its own URIs if they get no
+        matches (see Application.search_many)
+        """
+        if not self.shared_uris or len(queries) < 2:
+            return set()
+
+        ret = set()
+        for (_, ext) in self.providers:
+            for (_, _, qs) in ext.get_shared_uris(queries):
+                ret.update(qs)
+
+        return ret
+
+    def _build_records(self, *psrcs):
+        """Build ScanRecords from psources.
+
+        Returns:
+          A list of tuples (psource, ScanRecord). Invalid psources are
+          skipped.
+        """
+        ret = []
+        for psrc in psrcs:
+            try:
+                ret.append((psrc, arroyo.ScanRecord(**psrc)))
+            except (TypeError, ValueError) as e:
+                msg = "Invalid source data from {provider}: {e}"
+                msg = msg.format(provider=psrc.get('provider'), e=e)
+                self.logger.warning(msg)
 
         return ret
 
@@ -116,32 +324,9 @@ class Scanner:
         exts_and_uris = []
 
         for (name, ext) in self.providers:
-            try:
-                uri = ext.get_query_uri(query)
-            except arroyo.exc.IncompatibleQueryError as e:
-                err = "Provider '{name}' is not compatible"
-                err = err.format(name=name)
-
-                excstr = str(e)
-                if excstr:
-                    err += ": " + excstr
-                    self.logger.warning(err)
-                else:
-                    self.logger.info(err)
-                continue
-
-            # FIXME: Implement this in tests
-            if not uri:
-                err = "Provider {provider} has returned an empty URI. Fix it."
-                err = err.format(provider=name)
-                self.logger.critical(err)
-                continue
-
-            exts_and_uris.append((ext, uri))
-
-            msg = "Provider '{name}' is compatible. URI: {uri}"
-            msg = msg.format(name=name, uri=uri)
-            self.logger.info(msg)
+            uri = self._get_query_uri(name, ext, query)
+            if uri:
+                exts_and_uris.append((ext, uri))
 
         if not exts_and_uris:
             msg = "No compatible origins found for {query!r}"
@@ -152,7 +337,40 @@ class Scanner:
         origins = [Origin(p, uri=uri) for (p, uri) in exts_and_uris]
         return origins
 
+    def _get_query_uri(self, name, ext, query):
+        try:
+            uri = ext.get_query_uri(query)
+        except arroyo.exc.IncompatibleQueryError as e:
+            err = "Provider '{name}' is not compatible"
+            err = err.format(name=name)
+
+            excstr = str(e)
+            if excstr:
+                err += ": " + excstr
+                self.logger.warning(err)
+            else:
+                self.logger.info(err)
+            return None
+
+        # FIXME: Implement this in tests
+        if not uri:
+            err = "Provider {provider} has returned an empty URI. Fix it."
+            err = err.format(provider=name)
+            self.logger.critical(err)
+            return None
+
+        msg = "Provider '{name}' is compatible. URI: {uri}"
+        msg = msg.format(name=name, uri=uri)
+        self.logger.info(msg)
+
+        return uri
+
     def process(self, *origins):
+        return arroyo.helpers.asyncutils.run_until_complete(
+            self.async_process(*origins))
+
+    @asyncio.coroutine
+    def async_process(self, *origins):
         def _process(origins_data):
             for (origin, uri, data) in origins_data:
                 provider_name = origin.provider.__extension_name__
@@ -166,70 +384,158 @@ class Scanner:
                     msg = msg.format(provider=provider_name, e=str(e))
                     self.logger.warning(msg)
 
-        origins_data = self.get_data_from_origins(*origins)
-        return list(_process(origins_data))
+        origins_data = yield from self.async_get_data_from_origins(*origins)
+        return self._deduplicate_source_data(*_process(origins_data))
 
     def get_data_from_origins(self, *origins):
-        results = []
+        return arroyo.helpers.asyncutils.run_until_complete(
+            self.async_get_data_from_origins(*origins))
 
+    @asyncio.coroutine
+    def async_get_data_from_origins(self, *origins):
         @asyncio.coroutine
         def collect(origin):
-            res = yield from self.get_buffers_from_origin(origin)
-            results.extend(res)
+            # Buffers from each origin are parsed as soon as they are
+            # available while other origins are still being fetched
+            buffers = yield from self.get_buffers_from_origin(origin)
+            res = yield from asyncio.gather(*[
+                self.async_parse_buffer(origin, uri, buffer)
+                for (_, uri, buffer) in buffers])
+            return res
+
+        self.purge_fetch_memo()
 
         tasks = [collect(o) for o in origins]
+        results = yield from asyncio.gather(*tasks)
+
+        return [x
+                for origin_results in results
+                for buffer_results in origin_results
+                for x in buffer_results]
+
+    def get_parser_executor(self, provider):
+        """
+        Executor for provider's parser, see uses_process_executor.
+        """
+        if self.uses_process_executor(provider):
+            return self.get_process_executor()
+
+        return self.executor
+
+    def uses_process_executor(self, provider):
+        """
+        Check if provider's parser runs in the process executor.
+
+        Process executor is used only if it's available and provider can be
+        pickled and its parser doesn't need the application (see
+        ProviderExtension.PARSER_NEEDS_SHELL), otherwise parser runs in the
+        thread executor.
+        """
+        kind = self.parser_executor
+        if kind == 'auto':
+            kind = provider.PARSER_EXECUTOR
+
+        return (kind == 'process' and
+                self.get_process_executor is not None and
+                not provider.PARSER_NEEDS_SHELL and
+                self._pickle_provider(provider) is not None)
+
+    def _pickle_provider(self, provider):
+        """
+        Pickle provider once for all its buffers.
+
+        Returns a tuple (key, data) for _parse_buffer or None if provider
+        can't be pickled
+        """
+        name = provider.__extension_name__
+
+        try:
+            return self._pickled[name]
+        except KeyError:
+            pass
+
+        try:
+            data = pickle.dumps(provider)
+            key = (name, hashlib.sha1(data).hexdigest())
+            self._pickled[name] = (key, data)
+
+        except Exception as e:
+            msg = ("Provider «{name}» can't be sent to a worker process, "
+                   "using thread executor: {e}")
+            msg = msg.format(name=name, e=e)
+            self.logger.warning(msg)
+            self._pickled[name] = None
+
+        return self._pickled[name]
+
+    @asyncio.coroutine
+    def async_parse_buffer(self, origin, uri, buffer):
+        """
+        Parse buffer from uri using the origin's provider.
+
+        Parser runs in the provider's executor (see get_parser_executor).
+
+        Returns a list of tuples (origin, uri, psrc)
+        """
+        if isinstance(buffer, Exception) or buffer is None or buffer == '':
+            return []
+
         loop = asyncio.get_event_loop()
-        loop.run_until_complete(asyncio.gather(*tasks))
+        executor = self.get_parser_executor(origin.provider)
+        if self.uses_process_executor(origin.provider):
+            provider = self._pickle_provider(origin.provider)
+        else:
+            provider = origin.provider
 
-        data = []
-        for (origin, uri, res) in results:
-            if isinstance(res, Exception) or res is None or res == '':
-                continue
+        try:
+            timer_name = 'scanner.parse.' + origin.provider_name
+            with self.stats.timer(timer_name):
+                res = yield from loop.run_in_executor(
+                    executor, _parse_buffer, provider, buffer)
 
-            try:
-                res = origin.provider.parse(res)
-
-            # except arroyo.exc.OriginParseError as e:
-            #     msg = "Error parsing «{uri}»: {e}"
-            #     msg = msg.format(uri=uri, e=e)
-            #     self.logger.error(msg)
-            #     continue
-
-            except Exception as e:
-                print(traceback.format_exc(), file=sys.stderr)
-                msg = "Unhandled exception {type}: {e}"
-                msg = msg.format(type=type(e), e=e)
-                self.logger.critical(msg)
-                continue
+        # except arroyo.exc.OriginParseError as e:
+        #     msg = "Error parsing «{uri}»: {e}"
+        #     msg = msg.format(uri=uri, e=e)
+        #     self.logger.error(msg)
+        #     return []
 
-            if res is None:
-                msg = ("Incorrect API usage in {origin}, return None is not "
-                       "allowed. Raise an Exception or return [] if no "
-                       "sources are found")
-                msg = msg.format(origin=origin)
-                self.logger.critical(msg)
-                continue
+        except Exception as e:
+            print(traceback.format_exc(), file=sys.stderr)
+            msg = "Unhandled exception {type}: {e}"
+            msg = msg.format(type=type(e), e=e)
+            self.logger.critical(msg)
+            return []
 
-            if not isinstance(res, list):
-                msg = "Invalid data type for URI «{uri}»: '{type}'"
-                msg = msg.format(uri=uri, type=res.__class__.__name__)
-                self.logger.critical(msg)
-                continue
+        if res is None:
+            msg = ("Incorrect API usage in {origin}, return None is not "
+                   "allowed. Raise an Exception or return [] if no "
+                   "sources are found")
+            msg = msg.format(origin=origin)
+            self.logger.critical(msg)
+            return []
 
-            if len(res) == 0:
-                msg = "No sources found in «{uri}»"
-                msg = msg.format(uri=uri)
-                self.logger.warning(msg)
-                continue
+        if not isinstance(res, list):
+            msg = "Invalid data type for URI «{uri}»: '{type}'"
+            msg = msg.format(uri=uri, type=res.__class__.__name__)
+            self.logger.critical(msg)
+            return []
 
+        if len(res) == 0:
+            msg = "No sources found in «{uri}»"
+            msg = msg.format(uri=uri)
+            self.logger.warning(msg)
+            return []
+
+        with self.stats.timer('scanner.normalize'):
             res = self._normalize_source_data(origin, *res)
-            data.extend([(origin, uri, x) for x in res])
 
-            msg = "{n} sources found at {uri}"
-            msg = msg.format(n=len(res), uri=uri)
-            self.logger.info(msg)
+        self.stats.incr('scanner.sources', len(res))
 
-        return data
+        msg = "{n} sources found at {uri}"
+        msg = msg.format(n=len(res), uri=uri)
+        self.logger.info(msg)
+
+        return [(origin, uri, x) for x in res]
 
     @asyncio.coroutine
     def get_buffers_from_origin(self, origin):
@@ -270,7 +576,10 @@ class Scanner:
     def get_buffer_from_uri(self, origin, uri):
         """ Get buffer (read) from URI using origin.
 
-        In the 99% of the cases this means fetch some data from network
+        In the 99% of the cases this means fetch some data from network.
+        Identical requests (same provider and URI) are coalesced: concurrent
+        requests share the same fetch and successful results are reused
+        during fetch_memo_ttl seconds.
 
         Return:
           A tuple (origin, uri, result) where:
@@ -279,8 +588,59 @@ class Scanner:
           - result is a bytes object with the content from uri or an Exception
             if something goes wrong
         """
+        key = (origin.provider_name, uri)
+        now = time.monotonic()
+
+        memo = self._fetch_memo.get(key)
+        if memo is not None:
+            (expires, result) = memo
+            if expires > now:
+                self.counters['fetch.memo'] += 1
+                self.stats.incr('scanner.fetch.saved')
+                return (origin, uri, result)
+
+            del self._fetch_memo[key]
+
+        task = self._fetch_inflight.get(key)
+        if task is not None:
+            self.counters['fetch.shared'] += 1
+            self.stats.incr('scanner.fetch.saved')
+            # Don't cancel the shared fetch if this waiter is cancelled
+            result = yield from asyncio.shield(task)
+            return (origin, uri, result)
+
+        task = asyncio.ensure_future(self._fetch_uri(origin, uri))
+        self._fetch_inflight[key] = task
+        try:
+            result = yield from task
+        finally:
+            del self._fetch_inflight[key]
+
+        if (self.fetch_memo_ttl > 0 and result and
+                not isinstance(result, Exception) and
+                origin.provider.is_cacheable(result)):
+            self._fetch_memo[key] = (time.monotonic() + self.fetch_memo_ttl,
+                                     result)
+
+        return (origin, uri, result)
+
+    def purge_fetch_memo(self):
+        """
+        Remove expired entries from fetch memo
+        """
+        now = time.monotonic()
+        expired = [key for (key, (expires, _)) in self._fetch_memo.items()
+                   if expires <= now]
+        for key in expired:
+            del self._fetch_memo[key]
+
+    @asyncio.coroutine
+    def _fetch_uri(self, origin, uri):
+        self.stats.incr('scanner.fetch')
+
         try:
-            result = yield from origin.provider.fetch(uri)
+            with self.stats.timer('scanner.fetch'):
+                result = yield from origin.provider.fetch(uri)
 
         except (socket.gaierror,
                 asyncio.CancelledError,
@@ -293,6 +653,7 @@ class Scanner:
                 uri=uri, type=e.__class__.__name__,
                 err=str(e) or 'no reason')
             self.logger.error(err)
+            self.stats.incr('scanner.fetch.errors')
             result = e
 
         except Exception as e:
@@ -308,7 +669,7 @@ class Scanner:
             msg = msg.format(uri=uri)
             self.logger.error(msg)
 
-        return (origin, uri, result)
+        return result
 
     def _normalize_source_data(self, origin, *psrcs):
         """ Normalize input data for given origin.
@@ -411,20 +772,8 @@ class Scanner:
                         self.logger.warning(msg)
                         psrc['meta'] = {}
 
-            # Calculate URN from uri. If not found its a lazy source
-            # IMPORTANT: URN is **lowercased** and **sha1-encoded**
-            # try:
-            #     qs = parse.urlparse(psrc['uri']).query
-            #     urn = parse.parse_qs(qs)['xt'][-1]
-            #     normalized_urn = bittorrentlib.normalize_urn(urn)
-
-            #     # FIXME: This is a hack, fix uritools.alter_query_params
-            #     psrc['uri'] = psrc['uri'].replace(
-            #         'xt=' + urn, 'xt=' + normalized_urn)
-            #     psrc['urn'] = normalized_urn
-
-            # except KeyError:
-            #     pass
+            # URNs are calculated in batch before deduplication, see
+            # Scanner._add_urns
 
             # Fix created
             psrc['timestamp'] = psrc.get('timestamp', None) or now
@@ -433,3 +782,93 @@ class Scanner:
             ret.append(psrc)
 
         return ret
+
+    @staticmethod
+    def _add_urns(*psrcs):
+        """Calculate URNs for psources in batch.
+
+        URN is stored in 'urn' key, None for lazy sources or invalid URIs.
+        """
+        missing = [psrc for psrc in psrcs if 'urn' not in psrc]
+        urns = arroyo.bittorrentlib.normalize_many(
+            [psrc['uri'] for psrc in missing])
+
+        for (psrc, urn) in zip(missing, urns):
+            psrc['urn'] = urn
+
+    @staticmethod
+    def _deduplication_key(psrc):
+        try:
+            key = psrc['urn']
+        except KeyError:
+            try:
+                key = arroyo.bittorrentlib.urn_from_magnet(psrc['uri'])
+            except ValueError:
+                key = None
+
+        return key or psrc['uri']
+
+    def _deduplicate_source_data(self, *psrcs):
+        """ Merge psources pointing to the same torrent.
+
+        The same torrent can be found by multiple providers (or multiple
+        times by the same provider) with different URIs (tracker list, dn
+        encoding, etc). psources are keyed by its normalized infohash and
+        merged into the first one found: max seeds and leechers, earliest
+        timestamp and all the provider names in 'providers' key.
+
+        psources without URN (lazy sources) are deduplicated by URI.
+
+        Args:
+          psrcs - List of normalized psources (dicts).
+
+        Returns:
+          A list of unique psources (dicts).
+        """
+
+        def _max(a, b):
+            if a is None:
+                return b
+            if b is None:
+                return a
+            return max(a, b)
+
+        def _min(a, b):
+            if a is None:
+                return b
+            if b is None:
+                return a
+            return min(a, b)
+
+        index = {}
+        ret = []
+
+        self._add_urns(*psrcs)
+        for psrc in psrcs:
+            key = self._deduplication_key(psrc)
+            if key not in index:
+                psrc['providers'] = [psrc['provider']]
+                index[key] = psrc
+                ret.append(psrc)
+                continue
+
+            prev = index[key]
+            prev['seeds'] = _max(prev.get('seeds'), psrc.get('seeds'))
+            prev['leechers'] = _max(prev.get('leechers'),
+                                    psrc.get('leechers'))
+            prev['timestamp'] = _min(prev.get('timestamp'),
+                                     psrc.get('timestamp'))
+            if psrc['provider'] not in prev['providers']:
+                prev['providers'].append(psrc['provider'])
+
+        n_dups = len(psrcs) - len(ret)
+        self.counters['dedup.input'] += len(psrcs)
+        self.counters['dedup.merged'] += n_dups
+        self.stats.incr('scanner.dedup.merged', n_dups)
+
+        if n_dups:
+            msg = "{n} duplicated sources merged ({total} total)"
+            msg = msg.format(n=n_dups, total=len(psrcs))
+            self.logger.info(msg)
+
+        return ret
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import contextlib
+import json
+import os
+import threading
+
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class SharedState:
+    """
+    Small JSON document shared between all arroyo processes in the host.
+
+    Used by extensions to keep state that must be global (tokens,
+    rate-limit timestamps, etc). Access is serialized with a lock file
+    (flock) so read-modify-write sequences inside transaction() are atomic
+    between processes.
+
+    If path is None state is kept in memory (per process).
+    On platforms without fcntl only threads are serialized.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}
+
+    @contextlib.contextmanager
+    def transaction(self, durable=True):
+        """
+        Yields the state (a dict). Changes are saved on exit.
+
+        Access is blocking (file lock), don't use it from the event loop's
+        thread. Non durable transactions skip fsync, use them for data that
+        can be lost (rate-limit timestamps, etc).
+        """
+        with self._lock:
+            if self.path is None:
+                yield self._data
+                return
+
+            with open(self.path, 'a+') as fh:
+                if fcntl:
+                    fcntl.flock(fh, fcntl.LOCK_EX)
+
+                try:
+                    fh.seek(0)
+                    buff = fh.read()
+                    try:
+                        data = json.loads(buff) if buff else {}
+                    except ValueError:
+                        # Corrupted state, start from scratch
+                        data = {}
+
+                    yield data
+
+                    fh.seek(0)
+                    fh.truncate()
+                    json.dump(data, fh)
+                    fh.flush()
+                    if durable:
+                        os.fsync(fh.fileno())
+
+                finally:
+                    if fcntl:
+                        fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def get(self, key, default=None):
+        with self.transaction() as data:
+            return data.get(key, default)
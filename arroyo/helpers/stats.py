@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import collections
+import contextlib
+import json
+import threading
+import time
+
+
+try:
+    import contextvars
+except ImportError:
+    # Python < 3.7, see _ThreadScope
+    contextvars = None
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('stats', 'name', 'scope', 'start')
+
+    def __init__(self, stats, name, scope):
+        self.stats = stats
+        self.name = name
+        self.scope = scope
+        self.start = None
+
+    def __enter__(self):
+        if self.stats.observer:
+            self.stats.observer.stage_enter(self.name)
+
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.name, time.monotonic() - self.start,
+                            scope=self.scope)
+
+        if self.stats.observer:
+            self.stats.observer.stage_exit(self.name)
+
+        return False
+
+
+class _ContextScope:
+    """
+    Current scope for each thread and asyncio task
+    """
+    def __init__(self, default):
+        self._var = contextvars.ContextVar('stats-scope', default=default)
+
+    def get(self):
+        return self._var.get()
+
+    @contextlib.contextmanager
+    def push(self, name):
+        token = self._var.set(name)
+        try:
+            yield
+        finally:
+            self._var.reset(token)
+
+
+class _ThreadScope:
+    """
+    Current scope for each thread. Fallback for Python < 3.7, concurrent
+    tasks in the same thread must pass its scope explicitly to timers.
+    """
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def get(self):
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else self._default
+
+    @contextlib.contextmanager
+    def push(self, name):
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(name)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+
+class _ScopeData:
+    __slots__ = ('counters', 'timers')
+
+    def __init__(self):
+        self.counters = collections.Counter()
+        # name -> [count, total, max]
+        self.timers = {}
+
+    def asdict(self):
+        return {
+            'counters': dict(self.counters),
+            'timers': {
+                name: {'count': count, 'total': total, 'max': max_}
+                for (name, (count, total, max_)) in self.timers.items()
+            }
+        }
+
+
+class Stats:
+    """
+    Timers and counters for the search pipeline.
+
+    Data is aggregated per scope (usually one scope per query, see
+    Stats.scope). Current scope is tracked per thread and asyncio task:
+    concurrent queries don't mix their data. Use
+    arroyo.helpers.asyncutils.run_in_executor to keep the scope in executor
+    threads. Disabled instances don't record anything and its timers
+    are a shared no-op context manager so instrumentation can be left in
+    place at negligible cost.
+
+    Usage:
+
+        with stats.scope('lost s01'):
+            with stats.timer('scanner.fetch'):
+                ...
+            stats.incr('scanner.sources', 10)
+    """
+    GLOBAL_SCOPE = '*'
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        # Optional object with stage_enter(name) and stage_exit(name) methods
+        # called around timers, even if stats are disabled. See
+        # arroyo.helpers.profiling.MemoryTracker
+        self.observer = None
+        if contextvars is not None:
+            self._current = _ContextScope(self.GLOBAL_SCOPE)
+        else:
+            self._current = _ThreadScope(self.GLOBAL_SCOPE)
+
+        self.reset()
+
+    def reset(self):
+        self._scopes = collections.OrderedDict()
+
+    @property
+    def current_scope(self):
+        return self._current.get()
+
+    @contextlib.contextmanager
+    def scope(self, name):
+        with self._current.push(name):
+            yield self
+
+    def _get_scope_data(self, scope):
+        if scope is None:
+            scope = self.current_scope
+
+        try:
+            return self._scopes[scope]
+        except KeyError:
+            data = self._scopes[scope] = _ScopeData()
+            return data
+
+    def timer(self, name, scope=None):
+        """
+        Context manager measuring (monotonic) time spent in its block.
+
+        scope is captured when timer is created, pass it explicitly for
+        timers living in coroutines.
+        """
+        if not self.enabled and self.observer is None:
+            return _NULL_TIMER
+
+        return _Timer(self, name, scope or self.current_scope)
+
+    def add_time(self, name, elapsed, scope=None):
+        if not self.enabled:
+            return
+
+        timers = self._get_scope_data(scope).timers
+        try:
+            entry = timers[name]
+        except KeyError:
+            entry = timers[name] = [0, 0.0, 0.0]
+
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+    def incr(self, name, n=1, scope=None):
+        if not self.enabled:
+            return
+
+        self._get_scope_data(scope).counters[name] += n
+
+    def report(self):
+        """
+        Returns a dict with data for each scope and the aggregated data for
+        all of them under the 'total' key
+        """
+        total = _ScopeData()
+
+        for data in self._scopes.values():
+            total.counters.update(data.counters)
+            for (name, (count, elapsed, max_)) in data.timers.items():
+                entry = total.timers.setdefault(name, [0, 0.0, 0.0])
+                entry[0] += count
+                entry[1] += elapsed
+                entry[2] = max(entry[2], max_)
+
+        return {
+            'scopes': collections.OrderedDict(
+                (scope, data.asdict())
+                for (scope, data) in self._scopes.items()),
+            'total': total.asdict()
+        }
+
+    def dump(self, fh):
+        json.dump(self.report(), fh, indent=2, sort_keys=False)
+        fh.write('\n')
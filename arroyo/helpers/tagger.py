@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import functools
+import re
+
+
+# Default lists, extended from settings (see Application._build_mediaparser)
+# Matching is case insensitive
+
+# Distributors are matched between brackets: Foo.S01E01.x264-GRP[rartv]
+DISTRIBUTORS = [
+    'ethd',
+    'ettv',
+    'eztv',
+    'rartv',
+]
+
+# Release groups are matched after a dash: Foo.S01E01.x264-GRP
+RELEASE_GROUPS = [
+    '2hd', 'afg', 'asap', 'avs', 'batv', 'cravers', 'deflate', 'dimension',
+    'evo', 'evolve', 'fleet', 'fqm', 'fum', 'geckos', 'immerse', 'ion10',
+    'killers', 'lol', 'metcon', 'minx', 'mtb', 'ntb', 'ntg', 'rarbg',
+    'sparks', 'strife', 'sva', 'tbs', 'turbo', 'yify',
+]
+
+# Tags for low quality or unwanted releases, matched as whole words after
+# the episode or year token (see RELEASE_INFO_RE)
+BAD_TAGS = [
+    'cam', 'camrip', 'dvdscr', 'hc', 'hdcam', 'hdts', 'hardcoded', 'korsub',
+    'sample', 'scr', 'screener', 'tc', 'telecine', 'telesync', 'ts',
+    'workprint',
+]
+
+
+# Release info (bad tags, etc) follows the last episode (S01E01, 1x01) or
+# year token, words before it belong to the title
+RELEASE_INFO_RE = re.compile(
+    r'(?<![a-z0-9])(?:s\d{1,2}(?:e\d{1,3})+|\d{1,2}x\d{2,3}|(?:19|20)\d{2})'
+    r'(?![a-z0-9])',
+    re.IGNORECASE)
+
+
+def build_pattern(words):
+    """
+    Build a regex (source) matching any of words.
+
+    Words are factored as a trie, ex: ['foo', 'foobar', 'fox'] ->
+    'fo(?:o(?:bar)?|x)'. Python's re engine doesn't do this by itself and
+    a plain alternation of thousands of words is tried word by word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def _build(node):
+        final = '' in node
+        alts = [re.escape(char) + _build(node[char])
+                for char in sorted(node) if char]
+
+        if not alts:
+            return ''
+
+        if len(alts) == 1 and not final:
+            return alts[0]
+
+        ret = '(?:' + '|'.join(alts) + ')'
+        if final:
+            ret += '?'
+
+        return ret
+
+    return _build(trie)
+
+
+class Tagger:
+    """
+    Find known distributors, release groups and bad tags in one pass.
+    """
+    def __init__(self, distributors=None, release_groups=None, bad_tags=None):
+        def _normalize(words, default):
+            if words is None:
+                words = default
+
+            return sorted(set([x.strip().lower() for x in words if x.strip()]))
+
+        self.distributors = _normalize(distributors, DISTRIBUTORS)
+        self.release_groups = _normalize(release_groups, RELEASE_GROUPS)
+        self.bad_tags = _normalize(bad_tags, BAD_TAGS)
+
+        parts = []
+        if self.distributors:
+            parts.append(r'\[(?P<distributor>{})\]'.format(
+                build_pattern(self.distributors)))
+
+        if self.release_groups:
+            parts.append(r'(?<=-)(?P<release_group>{})(?=$|[\[.\s])'.format(
+                build_pattern(self.release_groups)))
+
+        if self.bad_tags:
+            parts.append(r'(?<![a-z0-9])(?P<bad_tag>{})(?![a-z0-9])'.format(
+                build_pattern(self.bad_tags)))
+
+        if parts:
+            self._re = re.compile('|'.join(parts), re.IGNORECASE)
+        else:
+            self._re = None
+
+    def tag(self, name):
+        """
+        Returns a tuple (name, info) where name has distributors removed and
+        info is a dict (guessit style keys) with optional
+        'release_distributors', 'release_group' and 'release_bad_tags' keys.
+        """
+        info = {}
+        if self._re is None:
+            return name, info
+
+        distributors = []
+        bad_tags = []
+        chunks = []
+        idx = 0
+        # Start of release info, found only if there are bad tags
+        info_start = None
+
+        for m in self._re.finditer(name):
+            # Groups of empty lists are not in the pattern
+            kind = m.lastgroup
+            if kind == 'distributor':
+                dist = m.group('distributor').lower()
+                if dist not in distributors:
+                    distributors.append(dist)
+
+                chunks.append(name[idx:m.start()])
+                idx = m.end()
+
+            elif kind == 'release_group':
+                info['release_group'] = m.group('release_group')
+
+            else:
+                if info_start is None:
+                    info_start = self._release_info_start(name)
+
+                tag = m.group('bad_tag').lower()
+                if m.start() >= info_start and tag not in bad_tags:
+                    bad_tags.append(tag)
+
+        if distributors:
+            chunks.append(name[idx:])
+            name = ''.join(chunks).strip()
+            info['release_distributors'] = distributors
+
+        if bad_tags:
+            info['release_bad_tags'] = bad_tags
+
+        return name, info
+
+    @staticmethod
+    def _release_info_start(name):
+        # Without episode or year tokens nothing is release info
+        ret = len(name)
+        for m in RELEASE_INFO_RE.finditer(name):
+            ret = m.end()
+
+        return ret
+
+
+@functools.lru_cache(maxsize=1)
+def default_tagger():
+    return Tagger()
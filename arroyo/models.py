@@ -20,7 +20,6 @@
 
 import re
 import sys
-from urllib import parse
 
 
 from appkit import utils
@@ -56,7 +55,95 @@ class Variable(sautils.KeyValueItem, sautils.Base):
     __table_args__ = schema.UniqueConstraint('key'),
 
 
-class Source(sautils.Base):
+class _SourceCommon:
+    """
+    Behaviour shared between Source and ScanRecord.
+
+    Subclasses must provide name, uri, seeds, leechers, timestamp and the
+    rest of attributes listed in ASDICT_ATTRS.
+    """
+    __slots__ = ()
+
+    ASDICT_ATTRS = (
+        'age',
+        'entity',
+        'episode',
+        'episode_id',
+        'id',
+        'language',
+        'leechers',
+        'movie',
+        'movie_id',
+        'name',
+        'provider',
+        'ratio',
+        'seeds',
+        'size',
+        'tags',
+        'timestamp',
+        'type',
+        'uri',
+        'urn'
+    )
+
+    def __lt__(self, other):
+        return _lt_from_attrs(self, other, ('name',))
+
+    def __str__(self):
+        return self.format()
+
+    def __hash__(self):
+        return hash(self.uri)
+
+    @property
+    def age(self):
+        return utils.now_timestamp() - self.timestamp
+
+    @property
+    def needs_postprocessing(self):
+        return self.urn is None and self.uri is not None
+
+    @property
+    def ratio(self):
+        seeds = self.seeds if self.seeds is not None else 0
+        leechers = self.leechers if self.leechers is not None else 0
+
+        if not self.seeds and not self.leechers:
+            return None
+
+        if seeds and leechers == 0:
+            return float(sys.maxsize)
+
+        if seeds == 0 and leechers:
+            return 0.0
+
+        return seeds / leechers
+
+    @property
+    def urn(self):
+        # URN is computed when uri is set, see Source.validate and
+        # ScanRecord.uri. Objects loaded from database need to compute it on
+        # first access
+        try:
+            return self._urn
+        except AttributeError:
+            self._urn = _urn_from_uri(self.uri)
+            return self._urn
+
+    def asdict(self):
+        return _asdict_from_attrs(self, self.ASDICT_ATTRS)
+
+    def format(self, fmt='{name}', extra_data={}):
+        data = self.asdict()
+        data['seeds'] = data.get('seeds', '-')
+        data['leechers'] = data.get('leechers', '-')
+        data['language'] = data.get('language', 'unknow')
+        data.update(extra_data)
+
+        return fmt.format(**data)
+
+
+class Source(_SourceCommon, sautils.Base):
     __tablename__ = 'source'
 
     # Required
@@ -109,27 +196,24 @@ class Source(sautils.Base):
     def __eq__(self, other):
         return _eq_from_attrs(self, other, ('uri',))
 
-    def __lt__(self, other):
-        return _lt_from_attrs(self, other, ('name',))
-
     def __repr__(self):
         return "<Source #{id} {fmt} object at 0x{oid:x}>".format(
             id=self.id or '??',
             oid=id(self),
             fmt=self.format())
 
-    def __str__(self):
-        return self.format()
-
-    def __hash__(self):
-        return hash(self.uri)
+    __hash__ = _SourceCommon.__hash__
 
     @orm.validates('name', 'provider', 'urn', 'uri', 'language', 'type')
     def validate(self, key, value):
         """
         Wrapper around static method normalize
         """
-        return self.normalize(key, value)
+        value = self.normalize(key, value)
+        if key == 'uri':
+            self._urn = _urn_from_uri(value)
+
+        return value
 
     @staticmethod
     def normalize(key, value):
@@ -213,80 +297,130 @@ class Source(sautils.Base):
         _entity_setter(self, entity)
 
     @property
-    def age(self):
-        return utils.now_timestamp() - self.timestamp
+    def selected(self):
+        return (
+            self.entity and
+            self.entity.selection and
+            self.entity.selection.source == self)
 
-    @property
-    def needs_postprocessing(self):
-        return self.urn is None and self.uri is not None
 
-    @property
-    def ratio(self):
-        seeds = self.seeds if self.seeds is not None else 0
-        leechers = self.leechers if self.leechers is not None else 0
+class ScanRecord(_SourceCommon):
+    """
+    Lightweight, non persistent, counterpart of Source.
+
+    Scanner emits ScanRecords instead of Source objects because most of the
+    scanned data is discarded by filters and building ORM instances for them
+    is expensive. Records flow through parsing, filtering and sorting and are
+    promoted into real Source objects when they are merged into the database
+    (see ScanRecord.to_source and Database.merge)
+    """
+    __slots__ = (
+        '_uri',
+        '_urn',
+        'entity',
+        'language',
+        'leechers',
+        'meta',
+        'name',
+        'provider',
+        'providers',
+        'seeds',
+        'size',
+        'tags',
+        'timestamp',
+        'type'
+    )
 
-        if not self.seeds and not self.leechers:
-            return None
+    # Scan records are never persisted, those attributes exist only for
+    # API compatibility with Source
+    id = None
+    download = None
 
-        if seeds and leechers == 0:
-            return float(sys.maxsize)
+    def __init__(self, name, uri, provider,
+                 timestamp=None,
+                 size=None,
+                 seeds=None,
+                 leechers=None,
+                 type=None,
+                 language=None,
+                 meta=None,
+                 tags=None,
+                 providers=None,
+                 urn=None):
+        normalize = Source.normalize
+
+        self.name = normalize('name', name)
+        if urn is None:
+            self.uri = uri
+        else:
+            # Trust URN precalculated by bittorrentlib.normalize_many
+            self._uri = normalize('uri', uri)
+            self._urn = _strip_urn_prefix(urn)
+        self.provider = normalize('provider', provider)
+        # Same source can be found by multiple providers, see
+        # Scanner._deduplicate_source_data
+        self.providers = tuple(providers or (self.provider,))
+        self.language = normalize('language', language)
+        self.type = normalize('type', type)
+
+        self.entity = None
+        self.leechers = leechers
+        self.meta = meta or {}
+        self.seeds = seeds
+        self.size = size
+        self.tags = tags or {}
+        self.timestamp = timestamp or utils.now_timestamp()
 
-        if seeds == 0 and leechers:
-            return 0.0
+    def __eq__(self, other):
+        if not isinstance(other, (Source, ScanRecord)):
+            raise TypeError(other.__class__)
 
-        return seeds / leechers
+        return self.uri == other.uri
 
-    @property
-    def selected(self):
-        return (
-            self.entity and
-            self.entity.selection and
-            self.entity.selection.source == self)
+    __hash__ = _SourceCommon.__hash__
+
+    def __repr__(self):
+        return "<ScanRecord {fmt} object at 0x{oid:x}>".format(
+            oid=id(self),
+            fmt=self.format())
 
     @property
-    def urn(self):
-        if self.uri.startswith('http'):
-            return None
+    def uri(self):
+        return self._uri
 
-        qs = parse.urlparse(self.uri).query
-        try:
-            urn = parse.parse_qs(qs)['xt'][-1]
-        except KeyError:
-            return None
-        urn = bittorrentlib.normalize_urn(urn)
-        return urn.lstrip('urn:')
+    @uri.setter
+    def uri(self, uri):
+        uri = Source.normalize('uri', uri)
+        self._urn = _urn_from_uri(uri)
+        self._uri = uri
 
-    def asdict(self):
-        return _asdict_from_attrs(
-            self, (
-                'age',
-                'entity',
-                'episode',
-                'episode_id',
-                'id',
-                'language',
-                'leechers',
-                'movie',
-                'movie_id',
-                'name',
-                'provider',
-                'ratio',
-                'seeds',
-                'size',
-                'tags',
-                'timestamp',
-                'type',
-                'uri',
-                'urn'))
+    @property
+    def episode(self):
+        return self.entity if isinstance(self.entity, Episode) else None
 
-    def format(self, fmt='{name}', extra_data={}):
-        data = self.asdict()
-        data['seeds'] = data.get('seeds', '-')
-        data['leechers'] = data.get('leechers', '-')
-        data['language'] = data.get('language', 'unknow')
-        data.update(extra_data)
+    @property
+    def movie(self):
+        return self.entity if isinstance(self.entity, Movie) else None
 
-        return fmt.format(**data)
+    def to_source(self):
+        """
+        Promote record into a real (ORM) Source
+        """
+        src = Source(
+            name=self.name,
+            uri=self.uri,
+            provider=self.provider,
+            timestamp=self.timestamp,
+            size=self.size,
+            seeds=self.seeds,
+            leechers=self.leechers,
+            type=self.type,
+            language=self.language,
+            meta=self.meta,
+            tags=self.tags)
+        src.entity = self.entity
+
+        return src
 
 
 # @event.listens_for(Source.tags, 'dispose_collection')
@@ -661,6 +795,24 @@ class Download(sautils.Base):
 #                                                  lazy='select'))
 
 
+def _urn_from_uri(uri):
+    """
+    Extract the normalized URN (see bittorrentlib.normalize_urn) from a
+    magnet URI without the 'urn:' prefix.
+
+    Returns None for lazy sources (non-magnet URIs) and raises ValueError if
+    URN can't be normalized.
+    """
+    return _strip_urn_prefix(bittorrentlib.urn_from_magnet(uri))
+
+
+def _strip_urn_prefix(urn):
+    if urn is None:
+        return None
+
+    return urn[len('urn:'):]
+
+
 def _init_check_required(kwargs, reqs):
     check = all([attr in kwargs for attr in reqs])
 
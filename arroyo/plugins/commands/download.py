@@ -18,8 +18,13 @@
 # USA.
 
 
+import asyncio
+
+
 import appkit
 
+import arroyo.exc
+import arroyo.helpers.asyncutils
 from arroyo.extensions import (
     CommandExtension,
     Parameter
@@ -46,6 +51,14 @@ class DownloadConsoleCommand(CommandExtension):
             action='store_true',
             help=("Manualy select downloads")),
 
+        Parameter(
+            'jobs',
+            abbr='j',
+            type=int,
+            default=1,
+            help=("Number of queries processed concurrently (ignored with "
+                  "--manual)")),
+
         Parameter(
             'filter',
             abbr='f',
@@ -62,13 +75,113 @@ class DownloadConsoleCommand(CommandExtension):
             help='keywords')
     )
 
-    def process_query(self, query, manual=False, force=False):
+    def process_query(self, query, manual=False, force=False, results=None):
         # curr_log_level = self.shell.settings.get(arroyo.SettingsKey.LOG_LEVEL)
         # curr_log_level = getattr(logging, curr_log_level)
         # in_debug = curr_log_level <= logging.DEBUG
 
-        results = self.shell.search(query)
-        results = list(self.shell.filter(results, query))
+        # results can be provided by the caller (see Application.search_many)
+        if results is None:
+            results = self.shell.search(query)
+
+        results = self.shell.filter(results, query)
+        selection = self.select_all(query, results,
+                                    manual=manual, force=force)
+        if not selection:
+            return
+
+        # Lazy sources are resolved only after selection and all at once
+        unresolved = self.shell.resolve(selection)
+
+        for selected in selection:
+            if selected in unresolved:
+                msg = "Unable to resolve {src}"
+                msg = msg.format(src=selected)
+                self.logger.error(msg)
+                continue
+
+            self.shell.download(selected)
+            msg = "Downloading {src}"
+            msg = msg.format(src=selected)
+            print(msg)
+
+    @asyncio.coroutine
+    def async_process_query(self, query, results, writer, force=False):
+        """
+        Coroutine version of process_query (without manual selection).
+
+        Many of them run concurrently in the same loop (see --jobs).
+        Downloads are serialized using the writer lock: a download spans
+        several suspension points (plugin sync and add) and two queries can
+        select the same source.
+        """
+        results = yield from self.shell.afilter(results, query)
+        selection = self.select_all(query, results, force=force)
+        if not selection:
+            return
+
+        unresolved = yield from self.shell.aresolve(selection)
+
+        for selected in selection:
+            if selected in unresolved:
+                msg = "Unable to resolve {src}"
+                msg = msg.format(src=selected)
+                self.logger.error(msg)
+                continue
+
+            yield from writer.acquire()
+            try:
+                yield from self.shell.adownload(selected)
+
+            except arroyo.exc.DuplicatedDownloadError:
+                msg = "{src} already selected by another query"
+                msg = msg.format(src=selected)
+                self.logger.info(msg)
+                continue
+
+            finally:
+                writer.release()
+
+            msg = "Downloading {src}"
+            msg = msg.format(src=selected)
+            print(msg)
+
+    @asyncio.coroutine
+    def async_process_queries(self, queries, jobs, force=False):
+        # Scan phase for all queries at once, requests are coalesced and
+        # fetched concurrently (see Application.search_many)
+        results = yield from self.shell.asearch_many(queries)
+
+        semaphore = asyncio.Semaphore(jobs)
+        writer = asyncio.Lock()
+
+        @asyncio.coroutine
+        def _process(query):
+            yield from semaphore.acquire()
+            try:
+                # Each query runs in its own task, scopes don't mix (see
+                # arroyo.helpers.stats)
+                with self.shell.query_stats_scope(query):
+                    yield from self.async_process_query(
+                        query, results[query], writer, force=force)
+
+            except Exception as e:
+                msg = "Error processing '{query}': {e}"
+                msg = msg.format(query=query, e=e)
+                self.logger.error(msg)
+
+            finally:
+                semaphore.release()
+
+        yield from asyncio.gather(*[_process(query) for query in queries])
+
+    def select_all(self, query, results, manual=False, force=False):
+        """
+        Select one source for each group (entity) in results.
+
+        Sources (or its entities) are merged into the database.
+        """
+        results = list(results)
 
         if not results:
             msg = "Looking for '{query}': no results found."
@@ -82,6 +195,7 @@ class DownloadConsoleCommand(CommandExtension):
         msg = msg.format(query=query, n_total=len(results), n_groups=len(groups))
         self.logger.info(msg)
 
+        selection = []
         for (idx, (entity, srcs)) in enumerate(groups):
             entity, srcs = self.merge(entity, srcs)
 
@@ -108,10 +222,9 @@ class DownloadConsoleCommand(CommandExtension):
                 self.logger.info(msg)
                 continue
 
-            self.shell.download(selected)
-            msg = "Downloading {src}"
-            msg = msg.format(src=selected)
-            print(msg)
+            selection.append(selected)
+
+        return selection
 
     def merge(self, entity, sources):
         if entity:
@@ -165,7 +278,8 @@ class DownloadConsoleCommand(CommandExtension):
     def main(self,
              filters=None, keywords=None, from_config=False,
              force=False,
-             manual=False):
+             manual=False,
+             jobs=1):
 
         if filters or keywords or from_config:
             if keywords:
@@ -185,12 +299,31 @@ class DownloadConsoleCommand(CommandExtension):
             else:
                 raise NotImplementedError()
 
-            for query in queries:
-                self.process_query(query, manual=manual, force=force)
+            # One HTTP client (connection pool) for the whole run
+            with self.shell.shared_http_client():
+                self.process_queries(queries, manual=manual, force=force,
+                                     jobs=jobs)
 
         else:
             raise NotImplementedError()
 
+    def process_queries(self, queries, manual=False, force=False, jobs=1):
+        if jobs > 1 and len(queries) > 1 and not manual:
+            arroyo.helpers.asyncutils.run_until_complete(
+                self.async_process_queries(queries, jobs, force=force))
+            return
+
+        # Coalesce requests from multiple queries
+        if len(queries) > 1:
+            results = self.shell.search_many(queries)
+        else:
+            results = {}
+
+        for query in queries:
+            with self.shell.query_stats_scope(query):
+                self.process_query(query, manual=manual, force=force,
+                                   results=results.get(query))
+
     def display_results(self, results):
         i = 1
         for (leader, group) in results:
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import arroyo.helpers.importer
+from arroyo.extensions import (
+    CommandExtension,
+    Parameter
+)
+
+
+class ImportCommand(CommandExtension):
+    __extension_name__ = 'import'
+    HELP = "Import sources from directories of .torrent files"
+
+    PARAMETERS = (
+        Parameter(
+            'jobs',
+            abbr='j',
+            type=int,
+            default=None,
+            help='Number of hashing processes (default: number of CPUs)'),
+
+        Parameter(
+            'batch-size',
+            type=int,
+            default=None,
+            help='Files imported in each transaction'),
+
+        Parameter(
+            'restart',
+            action='store_true',
+            help=("Ignore progress from a previous interrupted import and "
+                  "start from the beginning")),
+
+        Parameter(
+            'directories',
+            nargs='+',
+            help='Directories to import')
+    )
+
+    def main(self, directories=None, jobs=None, batch_size=None,
+             restart=False):
+        importer = arroyo.helpers.importer.Importer(
+            db=self.shell.db,
+            mediaparser=self.shell.mediaparser,
+            variables=self.shell.variables,
+            logger=self.logger,
+            stats=self.shell.stats,
+            jobs=jobs,
+            batch_size=batch_size)
+
+        for directory in directories or []:
+            counters = importer.run(directory, resume=not restart)
+
+            msg = ("{directory}: {imported} imported, {known} already known, "
+                   "{errors} errors")
+            msg = msg.format(directory=directory,
+                             imported=counters['imported'],
+                             known=counters['known'] + counters['skipped'],
+                             errors=counters['errors'])
+            print(msg)
+
+
+__arroyo_extensions__ = [
+    ImportCommand
+]
@@ -69,6 +69,9 @@ TRANSMISSION_API_ERROR_MSG = (
 class TransmissionDownloader(arroyo.extensions.DownloaderExtension):
     __extension_name__ = 'transmission'
 
+    # Network bound, doesn't use the database
+    RUN_IN_EXECUTOR = True
+
     def __init__(self, shell, *args, **kwargs):
         super().__init__(shell, *args, **kwargs)
         settings = shell.settings
@@ -45,6 +45,11 @@ class SourceFieldsFilter(arroyo.extensions.FilterExtension):
         except KeyError:
             return False
 
+    def _provider_match(self, key, value, item):
+        # Scan records can be found by multiple providers
+        providers = getattr(item, 'providers', None) or (item.provider,)
+        return value in providers
+
     def _glob_match(self, key, value, item):
         try:
             val = getattr(item, key)
@@ -55,7 +60,8 @@ class SourceFieldsFilter(arroyo.extensions.FilterExtension):
 
     def _type_match(self, key, value, item):
         _map = {
-            'source': lambda x: isinstance(x, arroyo.Source),
+            'source': lambda x: isinstance(x, (arroyo.Source,
+                                               arroyo.ScanRecord)),
             'episode': lambda x: x.entity and isinstance(x.entity, arroyo.Episode),
             'movie': lambda x: x.entity and isinstance(x.entity, arroyo.Movie),
         }
@@ -67,9 +73,12 @@ class SourceFieldsFilter(arroyo.extensions.FilterExtension):
         raise ValueError((key, value))
 
     def apply(self, key, value, it):
-        if key in ('name', 'provider'):
+        if key == 'name':
             fn = functools.partial(self._exact_match, key, value)
 
+        elif key == 'provider':
+            fn = functools.partial(self._provider_match, key, value)
+
         elif key in ('name_glob'):
             fn = functools.partial(self._glob_match, key[:-5], value.lower())
 
@@ -26,6 +26,7 @@ from urllib import parse
 import appkit.utils
 
 
+import arroyo.bittorrentlib
 import arroyo.extensions
 
 
@@ -39,6 +40,9 @@ class Eztv(arroyo.extensions.BS4ParserProviderExtensionMixin,
         r'^http(s)?://([^.]\.)?eztv\.[^.]{2,3}/'
     ]
 
+    # Listing pages used to serve several queries at once
+    SHARED_LISTING_PAGES = 5
+
     class Count(enum.Enum):
         NONE = 0
         ONE = 1
@@ -90,6 +94,14 @@ class Eztv(arroyo.extensions.BS4ParserProviderExtensionMixin,
             base=self._BASE_DOMAIN,
             q=parse.quote_plus(q))
 
+    def get_shared_uris(self, queries):
+        # Latest additions listing contains all series
+        queries = [q for q in queries if q.type == 'episode']
+        if len(queries) < self.SHARED_URIS_MIN_QUERIES:
+            return []
+
+        return [(self.DEFAULT_URI, self.SHARED_LISTING_PAGES, queries)]
+
     def parse_soup(self, soup):
         """
         Finds referentes to sources in buffer.
@@ -146,8 +158,7 @@ class Eztv(arroyo.extensions.BS4ParserProviderExtensionMixin,
 
     def parse_name_and_uri(self, node):
         magnet = node.select_one('a[href^=magnet:?]')
-        parsed = parse.urlparse(magnet.attrs['href'])
-        name = parse.parse_qs(parsed.query)['dn'][0]
+        name = arroyo.bittorrentlib.parse_magnet(magnet.attrs['href'])['dn']
 
         return (name, magnet.attrs['href'])
 
@@ -46,13 +46,13 @@
 
 
 import asyncio
+import contextlib
 import json
 import time
 from datetime import datetime
 from urllib import parse
 
 
-import aiohttp
 from appkit.libs import urilib
 
 
@@ -76,29 +76,67 @@ class TorrentAPI(arroyo.extensions.ProviderExtension):
         'movie': '14;48;17;44;45;47;50;51;52;42;46'
     }
 
+    # Minimal seconds between requests (API limit is 1 request / 2 seconds)
+    REQUEST_INTERVAL = 2
+
+    # Tokens expire after 15 minutes
+    TOKEN_TTL = 15*60
+
+    # Invalid and expired token error codes
+    TOKEN_ERROR_CODES = (2, 4)
+
+    # Key in shell.shared_state
+    SHARED_STATE_KEY = 'providers.torrentapi'
+
+    # parse invalidates tokens in shell.shared_state
+    PARSER_NEEDS_SHELL = True
+
+    # (loop, asyncio.Lock) serializing token requests, see refresh_token
+    _token_lock = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.logger = self.shell.logger.getChild('provider.torrentapi')
-        self.last_request = None
         self.token = None
-        self.token_ts = 0
-        self.token_last_use = 0
         self._tz_diff = datetime.utcnow() - datetime.now()
 
+    @contextlib.contextmanager
+    def _state(self, durable=True):
+        # Token and rate limit state is shared by all processes (see
+        # arroyo.helpers.sharedstate)
+        with self.shell.shared_state.transaction(durable=durable) as data:
+            yield data.setdefault(self.SHARED_STATE_KEY, {})
+
+    @asyncio.coroutine
+    def _update_state(self, fn, durable=True):
+        # Shared state access blocks on a file lock, keep it out of the
+        # loop's thread
+        def _run():
+            with self._state(durable=durable) as state:
+                return fn(state)
+
+        loop = asyncio.get_event_loop()
+        return (yield from loop.run_in_executor(None, _run))
+
     @asyncio.coroutine
     def throttle(self):
-        now = time.time()
+        def _reserve(state):
+            now = time.time()
+            wait = state.get('last-request', 0) + self.REQUEST_INTERVAL - now
+            if wait <= 0:
+                # Reserve this slot
+                state['last-request'] = now
 
-        if self.last_request is None:
-            self.last_request = now
-            return
+            return wait
 
-        diff = self.last_request - now
-        if diff < 2:
-            yield from asyncio.sleep(2 - diff)
+        while True:
+            # Losing a timestamp only costs an extra wait, skip fsync
+            wait = yield from self._update_state(_reserve, durable=False)
+            if wait <= 0:
+                return
 
-        self.last_request = time.time()
+            yield from asyncio.sleep(wait)
 
     @asyncio.coroutine
     def fetch(self, uri):
@@ -115,24 +153,53 @@ class TorrentAPI(arroyo.extensions.ProviderExtension):
         yield from self.throttle()
         return (yield from super().fetch(uri))
 
+    @classmethod
+    def _get_token_lock(cls):
+        loop = asyncio.get_event_loop()
+        if cls._token_lock is None or cls._token_lock[0] is not loop:
+            cls._token_lock = (loop, asyncio.Lock())
+
+        return cls._token_lock[1]
+
     @asyncio.coroutine
     def refresh_token(self):
-        if time.time() - self.token_ts < 15*60:
-            return
+        # Origins are fetched concurrently, only the first fetch requests a
+        # new token, the others wait for it and reuse it from shared state
+        lock = self._get_token_lock()
+        yield from lock.acquire()
+        try:
+            yield from self._refresh_token()
+        finally:
+            lock.release()
 
-        conn = aiohttp.TCPConnector(verify_ssl=False)
-        client = aiohttp.ClientSession(connector=conn)
+    @asyncio.coroutine
+    def _refresh_token(self):
+        def _get_token(state):
+            token = state.get('token')
+            age = time.time() - state.get('token-ts', 0)
+            return token if token and age < self.TOKEN_TTL else None
+
+        def _set_token(state):
+            state['token'] = self.token
+            state['token-ts'] = time.time()
+
+        token = yield from self._update_state(_get_token, durable=False)
+        if token:
+            self.token = token
+            return
 
         yield from self.throttle()
-        resp = yield from client.get(self.TOKEN_URL)
-        buff = yield from resp.content.read()
-
-        yield from resp.release()
-        yield from client.close()
+        with self.shell.get_async_http_client() as client:
+            buff = yield from client.fetch(self.rewrite_uri(self.TOKEN_URL))
 
         self.token = json.loads(buff.decode('utf-8'))['token']
-        self.token_ts = time.time()
-        self.token_last_use = None
+        yield from self._update_state(_set_token)
+
+    def invalidate_token(self):
+        self.token = None
+        with self._state() as state:
+            state.pop('token', None)
+            state.pop('token-ts', None)
 
     def parse(self, buff):
         def convert_data(e):
@@ -157,6 +224,10 @@ class TorrentAPI(arroyo.extensions.ProviderExtension):
         try:
             psrcs = data['torrent_results']
         except KeyError:
+            if data.get('error_code', None) in self.TOKEN_ERROR_CODES:
+                # Get a new token on next request
+                self.invalidate_token()
+
             if data.get('error_code', None) != 20:
                 msg = "Invalid response, missing torrent_results key. Data: {data}"
                 msg = msg.format(data=repr(data))
@@ -167,6 +238,17 @@ class TorrentAPI(arroyo.extensions.ProviderExtension):
         ret = [convert_data(x) for x in psrcs]
         return ret
 
+    def is_cacheable(self, buff):
+        # API errors (invalid or expired token, rate limit...) come with a
+        # 200 status, only results and 'No results found' can be reused
+        try:
+            data = json.loads(buff.decode('utf-8'))
+        except ValueError:
+            return False
+
+        return (isinstance(data, dict) and
+                ('torrent_results' in data or data.get('error_code') == 20))
+
     def get_query_uri(self, query):
         try:
             querystr = str(query)
@@ -184,6 +266,20 @@ class TorrentAPI(arroyo.extensions.ProviderExtension):
 
         return self.SEARCH_URL + "&" + parse.urlencode(qs)
 
+    def get_shared_uris(self, queries):
+        # Use category feeds for all queries of the same type
+        ret = []
+        for (type, category) in sorted(self.CATEGORY_MAP.items()):
+            type_queries = [q for q in queries if q.type == type]
+            if len(type_queries) < self.SHARED_URIS_MIN_QUERIES:
+                continue
+
+            uri = self.DEFAULT_URI + '&' + parse.urlencode(dict(
+                app_id='arroyo', category=category))
+            ret.append((uri, 1, type_queries))
+
+        return ret
+
     @classmethod
     def parse_category(cls, category):
         """
@@ -21,98 +21,82 @@
 import arroyo
 
 
-import functools
+import bisect
 import sys
 
 
-class BasicSorter(arroyo.extensions.SorterExtension):
-    __extension_name__ = 'basic'
-
-    def cmp_source_health(self, a, b):
-        def get_tag(src, tag_name, *args, **kwargs):
-            return src.tags.get(tag_name, *args, **kwargs)
+# Share ratios are compared by "steps": two ratios in the same step are
+# considered equivalent. Each step is 20% bigger than the previous one.
+RATIO_STEPS = tuple(1.2 ** x for x in range(-50, 51))
 
-        def is_proper(src):
-            return get_tag(src, 'core.release.proper', False)
+# Step for sources without seeds/leechers information. Ratio 0.0 is step 0.
+NO_RATIO_STEP = -1
 
-        def has_release_group(src):
-            return get_tag(src, 'core.release.group', None) is not None
+PROPER_TAG = 'release.proper'
+RELEASE_GROUP_TAG = 'release.group'
+RELEVANT_SEEDS = 10
 
-        def seeds_are_relevant(src):
-            return (src.seeds or 0) > 10
 
-        def get_share_ratio(src):
-            seeds = src.seeds if src.seeds is not None else 0
-            leechers = src.leechers if src.leechers is not None else 0
+def share_ratio(seeds, leechers):
+    seeds = seeds if seeds is not None else 0
+    leechers = leechers if leechers is not None else 0
 
-            if not src.seeds and not src.leechers:
-                return None
+    if not seeds and not leechers:
+        return None
 
-            if seeds and leechers == 0:
-                return float(sys.maxsize)
+    if seeds and leechers == 0:
+        return float(sys.maxsize)
 
-            if seeds == 0 and leechers:
-                return 0.0
+    if seeds == 0 and leechers:
+        return 0.0
 
-            return seeds / leechers
+    return seeds / leechers
 
-        # proper over non-proper
-        a_is_proper = is_proper(a)
-        b_is_proper = is_proper(b)
 
-        if a_is_proper and not b_is_proper:
-            return -1
+def ratio_step(ratio):
+    if ratio is None:
+        return NO_RATIO_STEP
 
-        if b_is_proper and not a_is_proper:
-            return 1
+    return bisect.bisect_right(RATIO_STEPS, ratio)
 
-        #
-        # Priorize s/l info over others
-        #
-        if seeds_are_relevant(a) and not seeds_are_relevant(b):
-            return -1
 
-        if seeds_are_relevant(b) and not seeds_are_relevant(a):
-            return 1
+def source_health_key(src):
+    """
+    Sort key for sources, healthier sources go first:
 
-        #
-        # Order by seed ratio
-        #
-        if (a.leechers and b.leechers):
-            a_ratio = get_share_ratio(a)
-            b_ratio = get_share_ratio(b)
+    - proper releases over non-proper
+    - sources with relevant number of seeds over others
+    - better share ratio (by steps, see RATIO_STEPS)
+    - more seeds
+    - releases from a team over others
+    - name
+    """
+    seeds = src.seeds or 0
 
-            try:
-                balance = (max(a_ratio, b_ratio) /
-                           min(a_ratio, b_ratio))
-                if balance > 1.2:
-                    return -1 if a_ratio > b_ratio else 1
+    return (
+        0 if src.tags.get(PROPER_TAG, False) else 1,
+        0 if seeds > RELEVANT_SEEDS else 1,
+        -ratio_step(share_ratio(src.seeds, src.leechers)),
+        -seeds,
+        0 if src.tags.get(RELEASE_GROUP_TAG, None) is not None else 1,
+        src.name
+    )
 
-            except ZeroDivisionError:
-                return -1 if int(a_ratio) else 1
 
-            return -1 if a.seeds > b.seeds else 1
-
-        #
-        # Put releases from a team over others
-        #
-        a_has_release_team = has_release_group(a)
-        b_has_release_team = has_release_group(b)
+class BasicSorter(arroyo.extensions.SorterExtension):
+    __extension_name__ = 'basic'
 
-        if a_has_release_team and not b_has_release_team:
-            return -1
-        if b_has_release_team and a_has_release_team:
-            return 1
+    def cmp_source_health(self, a, b):
+        a_key = source_health_key(a)
+        b_key = source_health_key(b)
 
-        # Nothing makes one source better that the other
-        # Fallback to default sort
-        if a == b:
+        if a_key == b_key:
             return 0
 
-        return -1 if a < b else 1
+        return -1 if a_key < b_key else 1
 
     def sort(self, items, query):
-        return sorted(items, key=functools.cmp_to_key(self.cmp_source_health))
+        return sorted(items, key=source_health_key)
 
 
 __arroyo_extensions__ = (
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import array
+import sys
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+import arroyo.extensions
+from arroyo.plugins.sorters import basic
+
+
+class VectorizedSorter(arroyo.extensions.SorterExtension):
+    """
+    Columnar implementation of basic sorter.
+
+    Fields used for ranking are extracted once into arrays and scored in one
+    pass. Uses numpy if available, array.array otherwise.
+    Ordering is the same as basic sorter (see basic.source_health_key)
+    """
+    __extension_name__ = 'vectorized'
+
+    def sort(self, items, query):
+        items = list(items)
+        return [items[idx] for idx in self.argsort(items)]
+
+    def argsort(self, items):
+        if not items:
+            return []
+
+        if numpy is None:
+            return self._argsort_array(items)
+        else:
+            return self._argsort_numpy(items)
+
+    @staticmethod
+    def _extract_columns(items):
+        seeds = [x.seeds or 0 for x in items]
+        leechers = [x.leechers or 0 for x in items]
+        proper = [0 if x.tags.get(basic.PROPER_TAG, False) else 1
+                  for x in items]
+        group = [0 if x.tags.get(basic.RELEASE_GROUP_TAG, None) is not None
+                 else 1 for x in items]
+        names = [x.name for x in items]
+
+        return seeds, leechers, proper, group, names
+
+    def _argsort_numpy(self, items):
+        seeds, leechers, proper, group, names = self._extract_columns(items)
+
+        seeds = numpy.array(seeds, dtype=numpy.int64)
+        leechers = numpy.array(leechers, dtype=numpy.int64)
+        proper = numpy.array(proper, dtype=numpy.int8)
+        group = numpy.array(group, dtype=numpy.int8)
+        names = numpy.array(names)
+
+        relevant = numpy.where(seeds > basic.RELEVANT_SEEDS, 0, 1)
+
+        # Keep in sync with basic.share_ratio
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ratio = seeds / leechers
+
+        ratio[(seeds != 0) & (leechers == 0)] = float(sys.maxsize)
+        ratio[(seeds == 0) & (leechers != 0)] = 0.0
+
+        steps = numpy.searchsorted(numpy.array(basic.RATIO_STEPS), ratio,
+                                   side='right')
+        steps[(seeds == 0) & (leechers == 0)] = basic.NO_RATIO_STEP
+
+        # lexsort uses the last key as the primary one
+        order = numpy.lexsort((names, group, -seeds, -steps, relevant,
+                               proper))
+        return order.tolist()
+
+    def _argsort_array(self, items):
+        seeds, leechers, proper, group, names = self._extract_columns(items)
+
+        seeds = array.array('q', seeds)
+        proper = array.array('b', proper)
+        group = array.array('b', group)
+        relevant = array.array('b', [
+            0 if x > basic.RELEVANT_SEEDS else 1 for x in seeds])
+        steps = array.array('q', [
+            basic.ratio_step(basic.share_ratio(s, l))
+            for (s, l) in zip(seeds, leechers)])
+
+        return sorted(
+            range(len(items)),
+            key=lambda idx: (proper[idx], relevant[idx], -steps[idx],
+                             -seeds[idx], group[idx], names[idx]))
+
+
+__arroyo_extensions__ = (
+    VectorizedSorter,
+)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+"""
+Offline benchmarks for arroyo.
+
+Usage (from the repository root):
+
+  python -m benchmarks run --output baseline.json
+  python -m benchmarks run --output current.json
+  python -m benchmarks compare baseline.json current.json
+
+Synthetic input for load tests can be generated with:
+
+  python -m benchmarks corpus --count 1000000 --seed 1 > names.txt
+  python -m benchmarks corpus --count 1000000 --records > records.jsonl
+
+Benchmarks are defined in the bench_*.py modules using the
+benchmarks.core.benchmark decorator. Input data lives in benchmarks/fixtures.
+"""
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import argparse
+import asyncio
+import json
+import sys
+
+
+from benchmarks import core, corpus
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='Run benchmarks')
+    run_parser.add_argument(
+        '--output', '-o',
+        help='Save results as JSON into OUTPUT')
+    run_parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='Repetitions of each benchmark, best time is used')
+    run_parser.add_argument(
+        '--sources', type=int, default=10000,
+        help='Number of sources for filter/sort/database benchmarks')
+    run_parser.add_argument(
+        '--seed', type=int, default=0,
+        help='Seed for synthetic data')
+    run_parser.add_argument(
+        'patterns', nargs='*',
+        help='Run only benchmarks matching those glob patterns')
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='Compare results against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='Flag slowdowns bigger than THRESHOLD (default: 0.1 = 10%%)')
+
+    corpus_parser = subparsers.add_parser(
+        'corpus', help='Generate synthetic release names or records')
+    corpus_parser.add_argument(
+        '--count', '-n', type=int, default=10000)
+    corpus_parser.add_argument(
+        '--seed', type=int, default=0)
+    corpus_parser.add_argument(
+        '--records', action='store_true',
+        help='Generate provider records as JSON lines instead of names')
+    corpus_parser.add_argument(
+        '--provider',
+        help='Provider name for records')
+
+    replay_parser = subparsers.add_parser(
+        'replay', help='Run local replay server for providers')
+    replay_parser.add_argument('--host', default='127.0.0.1')
+    replay_parser.add_argument('--port', type=int, default=8080)
+    replay_parser.add_argument(
+        '--pages', type=int, default=10,
+        help='Number of non-empty eztv pages')
+    replay_parser.add_argument(
+        '--latency', type=float, default=0.0,
+        help='Seconds to wait before each response')
+    replay_parser.add_argument(
+        '--bandwidth', type=int,
+        help='Bytes per second for each response')
+    replay_parser.add_argument(
+        '--error-rate', type=float, default=0.0,
+        help='Probability of injected 503 errors')
+    replay_parser.add_argument(
+        '--torrentapi-interval', type=float, default=2.0,
+        help='Minimal seconds between torrentapi requests')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        options = core.Options(sources=args.sources, repeat=args.repeat,
+                               seed=args.seed)
+        results = core.run_benchmarks(args.patterns, options=options,
+                                      logfn=print)
+        if args.output:
+            core.save(results, args.output)
+
+        return 0
+
+    elif args.command == 'compare':
+        comparison = core.compare(core.load(args.baseline),
+                                  core.load(args.current),
+                                  threshold=args.threshold)
+
+        regressions = 0
+        for (name, base, curr, ratio, is_regression) in comparison:
+            if is_regression:
+                regressions += 1
+
+            msg = '{flag} {name:<40} {base:>10.4f}s {curr:>10.4f}s {ratio:>7.2f}x'
+            msg = msg.format(flag='!' if is_regression else ' ', name=name,
+                             base=base, curr=curr, ratio=ratio)
+            print(msg)
+
+        return 1 if regressions else 0
+
+    elif args.command == 'corpus':
+        gen = corpus.CorpusGenerator(seed=args.seed)
+        if args.records:
+            for record in gen.records(args.count, provider=args.provider):
+                print(json.dumps(record))
+        else:
+            for name in gen.names(args.count):
+                print(name)
+
+        return 0
+
+    elif args.command == 'replay':
+        # Imported here, aiohttp server is not needed by other commands
+        from benchmarks import replay
+
+        def _route(**kwargs):
+            return replay.RouteConfig(latency=args.latency,
+                                      bandwidth=args.bandwidth,
+                                      error_rate=args.error_rate,
+                                      **kwargs)
+
+        routes = {name: _route() for name in replay.ReplayServer.PROVIDERS}
+        routes['torrentapi'] = _route(min_interval=args.torrentapi_interval)
+
+        loop = asyncio.get_event_loop()
+        server = replay.ReplayServer(routes=routes, pages=args.pages,
+                                     loop=loop)
+        base_uri = loop.run_until_complete(server.start(args.host, args.port))
+        print("Serving on {uri}".format(uri=base_uri))
+
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(server.stop())
+
+        return 0
+
+    else:
+        parser.print_help()
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import base64
+import binascii
+from urllib import parse
+
+
+from arroyo import bittorrentlib
+
+
+from benchmarks import corpus
+from benchmarks.core import benchmark
+
+
+# Big enough for the pieces string to dominate, like real torrents
+TORRENT_LENGTH = 4 * 1024 ** 3
+TORRENT_PIECE_LENGTH = 1024 ** 2
+TORRENT_COUNT = 200
+
+
+@benchmark('bittorrentlib.magnet_from_torrent_data')
+def magnet_from_torrent_data(options):
+    torrents = [
+        bittorrentlib.mock_torrent_data(
+            'torrent {}'.format(idx), length=TORRENT_LENGTH,
+            piece_length=TORRENT_PIECE_LENGTH)
+        for idx in range(min(options.sources, TORRENT_COUNT))]
+
+    def run():
+        for data in torrents:
+            bittorrentlib.magnet_from_torrent_data(data)
+
+    return run, len(torrents)
+
+
+def _magnets(options):
+    # Mix of hex and base32 URNs, as found in the wild
+    gen = corpus.CorpusGenerator(seed=options.seed)
+    ret = []
+    for (idx, record) in enumerate(gen.records(options.sources)):
+        uri = record['uri']
+        if idx % 2:
+            urn = bittorrentlib.mock_urn(record['name'])
+            b32 = base64.b32encode(binascii.unhexlify(urn[len('urn:btih:'):]))
+            uri = uri.replace(urn, 'urn:btih:' + b32.decode('ascii'))
+        ret.append(uri)
+
+    return ret
+
+
+def _urllib_urn_from_magnet(uri):
+    # Reference implementation: urllib plus normalize_urn
+    qs = parse.parse_qs(parse.urlparse(uri).query)
+    try:
+        return bittorrentlib.normalize_urn(qs['xt'][-1])
+    except KeyError:
+        return None
+
+
+@benchmark('bittorrentlib.urn_from_magnet')
+def urn_from_magnet(options):
+    magnets = _magnets(options)
+
+    def run():
+        for uri in magnets:
+            bittorrentlib.urn_from_magnet(uri)
+
+    return run, len(magnets)
+
+
+@benchmark('bittorrentlib.urn_from_magnet.urllib')
+def urn_from_magnet_urllib(options):
+    magnets = _magnets(options)
+
+    def run():
+        for uri in magnets:
+            _urllib_urn_from_magnet(uri)
+
+    return run, len(magnets)
+
+
+@benchmark('bittorrentlib.normalize_many')
+def normalize_many(options):
+    magnets = _magnets(options)
+
+    def run():
+        bittorrentlib.normalize_many(magnets)
+
+    return run, len(magnets)
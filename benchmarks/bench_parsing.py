@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+from arroyo.helpers import mediaparser
+
+
+from benchmarks import corpus, utils
+from benchmarks.core import benchmark
+
+
+# guessit is slow, keep synthetic parsing runs bounded
+SYNTHETIC_NAMES = 2000
+
+
+@benchmark('mediaparser.parse_name')
+def parse_name(options):
+    names = utils.release_names()
+    mp = mediaparser.MediaParser()
+    # Exclude backend loading from measures
+    mediaparser.warmup()
+
+    def run():
+        for name in names:
+            try:
+                mp.parse_name(name)
+            except mediaparser.InvalidEntityTypeError:
+                pass
+
+    return run, len(names)
+
+
+@benchmark('mediaparser.parse_name.synthetic')
+def parse_synthetic_name(options):
+    gen = corpus.CorpusGenerator(seed=options.seed)
+    names = list(gen.names(min(options.sources, SYNTHETIC_NAMES)))
+    mp = mediaparser.MediaParser()
+    mediaparser.warmup()
+
+    def run():
+        for name in names:
+            try:
+                mp.parse_name(name)
+            except mediaparser.InvalidEntityTypeError:
+                pass
+
+    return run, len(names)
+
+
+@benchmark('mediaparser.parse_name.guessit')
+def parse_name_guessit(options):
+    names = utils.release_names()
+    mp = mediaparser.MediaParser(fast_path=False)
+    mediaparser.warmup()
+
+    def run():
+        for name in names:
+            try:
+                mp.parse_name(name)
+            except mediaparser.InvalidEntityTypeError:
+                pass
+
+    return run, len(names)
+
+
+@benchmark('mediaparser.fast_parse')
+def fast_parse(options):
+    gen = corpus.CorpusGenerator(seed=options.seed)
+    names = list(gen.names(options.sources))
+
+    def run():
+        for name in names:
+            mediaparser.fast_parse(name)
+
+    return run, len(names)
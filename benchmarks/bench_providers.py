@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import asyncio
+
+
+import arroyo
+from arroyo.helpers import scanner
+
+
+from benchmarks import replay, utils
+from benchmarks.core import benchmark
+
+
+def _provider_benchmark(provider_name, fixture):
+    app = utils.BenchmarkApp()
+    provider = app.get_provider(provider_name)
+    buff = utils.read_fixture(fixture)
+    items = len(provider.parse(buff))
+
+    def run():
+        provider.parse(buff)
+
+    return run, items
+
+
+@benchmark('providers.eztv.parse')
+def eztv_parse(options):
+    return _provider_benchmark('eztv', 'eztv.html')
+
+
+@benchmark('providers.torrentapi.parse')
+def torrentapi_parse(options):
+    return _provider_benchmark('torrentapi', 'torrentapi.json')
+
+
+@benchmark('providers.epublibre.parse')
+def epublibre_parse(options):
+    return _provider_benchmark('epublibre', 'epublibre.html')
+
+
+# Pages fetched from the replay server in each scan
+REPLAY_PAGES = 10
+
+
+@benchmark('scanner.process.replay')
+def scanner_process_replay(options):
+    """
+    End to end scan (fetch, parse, normalize, dedup) of eztv listings served
+    by a local replay server with some latency.
+    """
+    loop = asyncio.get_event_loop()
+    server = replay.ReplayServer(
+        routes={'eztv': replay.RouteConfig(latency=0.05)},
+        pages=REPLAY_PAGES, seed=options.seed, loop=loop)
+    base_uri = loop.run_until_complete(server.start())
+
+    app = utils.BenchmarkApp({
+        arroyo.SettingsKey.PROVIDERS_BASE_URI: base_uri
+    })
+    provider = app.get_provider('eztv')
+    origin = scanner.Origin(provider, iterations=REPLAY_PAGES)
+
+    def run():
+        app.scanner.process(origin)
+
+    return run, REPLAY_PAGES
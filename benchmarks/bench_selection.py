@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+from benchmarks import utils
+from benchmarks.core import benchmark
+
+
+def _group(records):
+    # Biggest group of records pointing to the same entity
+    groups = {}
+    for record in records:
+        groups.setdefault(record.entity, []).append(record)
+
+    return max(groups.values(), key=len)
+
+
+@benchmark('engine.filter')
+def engine_filter(options):
+    app = utils.BenchmarkApp()
+    records = utils.build_records(options.sources)
+    query = app.get_query_from_params(type='episode', series='lost',
+                                      quality='720p')
+    selector = app.selector
+
+    def run():
+        selector.filter(records, query)
+
+    return run, len(records)
+
+
+def _sorter_benchmark(name, options):
+    app = utils.BenchmarkApp()
+    sorter = app.get_sorter(name)
+    group = _group(utils.build_records(options.sources))
+
+    def run():
+        sorter.sort(group, None)
+
+    return run, len(group)
+
+
+@benchmark('sorters.basic.sort')
+def basic_sort(options):
+    return _sorter_benchmark('basic', options)
+
+
+@benchmark('sorters.vectorized.sort')
+def vectorized_sort(options):
+    return _sorter_benchmark('vectorized', options)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+from benchmarks import utils
+from benchmarks.core import benchmark
+
+
+@benchmark('database.merge_all')
+def merge_all(options):
+    n = min(options.sources, 5000)
+
+    def setup():
+        app = utils.BenchmarkApp()
+        records = utils.build_records(n, clone_entities=True)
+        return app, records
+
+    def run(args):
+        app, records = args
+        app.db.merge_all(records)
+        app.db.session.commit()
+
+    return run, n, setup
+
+
+@benchmark('downloads.sync')
+def downloads_sync(options):
+    n = min(options.sources, 500)
+
+    app = utils.BenchmarkApp()
+    for record in utils.build_records(n):
+        app.download(record)
+
+    downloads = app.downloads
+
+    def run():
+        downloads.sync()
+
+    return run, n
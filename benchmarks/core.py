@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import collections
+import fnmatch
+import gc
+import json
+import platform
+import time
+
+
+REGISTRY = collections.OrderedDict()
+
+BENCHMARK_MODULES = (
+    'benchmarks.bench_bittorrent',
+    'benchmarks.bench_providers',
+    'benchmarks.bench_parsing',
+    'benchmarks.bench_selection',
+    'benchmarks.bench_storage',
+)
+
+
+class Options:
+    def __init__(self, sources=10000, repeat=5, seed=0):
+        self.sources = sources
+        self.repeat = repeat
+        self.seed = seed
+
+
+def benchmark(name):
+    """
+    Register a benchmark.
+
+    Decorated function receives an Options object, prepares its data and
+    returns a tuple (run, items) or (run, items, setup):
+    - run: callable to measure. If setup is provided run is called with
+      setup's return value.
+    - items: number of items processed by each run call, used to calculate
+      rates.
+    - setup: callable called (without being measured) before each run.
+    """
+    def decorator(fn):
+        REGISTRY[name] = fn
+        return fn
+
+    return decorator
+
+
+def load_benchmarks():
+    for mod in BENCHMARK_MODULES:
+        __import__(mod)
+
+
+def run_benchmark(fn, options):
+    ret = fn(options)
+    if len(ret) == 2:
+        (run, items), setup = ret, None
+    else:
+        run, items, setup = ret
+
+    times = []
+    for i in range(options.repeat):
+        args = (setup(),) if setup else ()
+
+        gc.collect()
+        start = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - start)
+
+    best = min(times)
+    return {
+        'best': best,
+        'mean': sum(times) / len(times),
+        'items': items,
+        'rate': items / best if best else None,
+    }
+
+
+def run_benchmarks(patterns=None, options=None, logfn=None):
+    options = options or Options()
+    load_benchmarks()
+
+    results = collections.OrderedDict()
+    for (name, fn) in REGISTRY.items():
+        if patterns and not any([fnmatch.fnmatch(name, p) for p in patterns]):
+            continue
+
+        results[name] = run_benchmark(fn, options)
+        if logfn:
+            logfn(format_result(name, results[name]))
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': int(time.time()),
+        'options': {'sources': options.sources, 'repeat': options.repeat},
+        'results': results
+    }
+
+
+def format_result(name, result):
+    return '{name:<40} {best:>10.4f}s {rate:>14.1f} items/s'.format(
+        name=name, best=result['best'], rate=result['rate'] or 0.0)
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compare two result sets (as returned by run_benchmarks).
+
+    Returns a list of tuples (name, baseline_best, current_best, ratio,
+    is_regression) for benchmarks present in both sets. A benchmark is a
+    regression if it is slower than baseline by more than threshold
+    (0.1 = 10%)
+    """
+    ret = []
+    for (name, base) in baseline['results'].items():
+        try:
+            curr = current['results'][name]
+        except KeyError:
+            continue
+
+        ratio = curr['best'] / base['best'] if base['best'] else 1.0
+        ret.append((name, base['best'], curr['best'], ratio,
+                    ratio > 1.0 + threshold))
+
+    return ret
+
+
+def load(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save(data, path):
+    with open(path, 'w') as fh:
+        json.dump(data, fh, indent=2)
+        fh.write('\n')
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+"""
+Synthetic (but realistic) release names and provider records.
+
+Output is deterministic for a given seed. Names are generated lazily so
+millions of them can be streamed without keeping them in memory.
+
+  >>> gen = CorpusGenerator(seed=1)
+  >>> names = list(gen.names(1000))
+  >>> records = list(gen.records(1000, provider='eztv'))
+"""
+
+
+import random
+
+
+from arroyo import bittorrentlib
+
+
+TITLE_WORDS = (
+    'Dark', 'Lost', 'Black', 'Mirror', 'Good', 'Fight', 'House', 'Cards',
+    'Walking', 'Dead', 'Game', 'Thrones', 'Expanse', 'Legion', 'Robot',
+    'Better', 'Call', 'Saul', 'Night', 'Manager', 'Crown', 'Handmaids',
+    'Tale', 'Westworld', 'Counterpart', 'Atlanta', 'Billions', 'Vikings',
+    'Gotham', 'Doctor', 'Homeland', 'Ozark', 'Narcos', 'Fargo', 'Sherlock',
+    'Killing', 'Eve', 'Blue', 'Planet', 'Star', 'Trek', 'Discovery', 'City',
+    'Runner', 'Blade', 'Alien', 'Heat', 'Matrix', 'Arrival', 'Moon', 'Drive',
+    'Last', 'First', 'Red', 'Dragon', 'Silent', 'Hill', 'Iron', 'Fist',
+    'Mad', 'Men', 'Young', 'Sheldon', 'Modern', 'Family', 'Big', 'Bang',
+    'Theory', 'True', 'Detective', 'Station', 'Eleven', 'Hidden', 'Valley',
+)
+
+ARTICLES = ('', '', '', 'The', 'A')
+
+QUALITIES = ('', '', '480p', '720p', '720p', '1080p', '1080p', '2160p')
+
+FORMATS = ('HDTV', 'HDTV', 'WEB', 'WEBRip', 'WEB-DL', 'BluRay', 'DVDRip',
+           'AMZN.WEB-DL', 'NF.WEBRip')
+
+CODECS = ('x264', 'x264', 'x265', 'h264', 'H.264', 'HEVC', 'XviD')
+
+AUDIO = ('', '', '', 'AAC', 'DD5.1', 'AC3', 'DTS', 'DDP5.1')
+
+GROUPS = (
+    'KILLERS', 'SVA', 'ION10', 'DIMENSION', 'LOL', 'AVS', 'FLEET', 'TURBO',
+    'SERIOUSLY', 'CRAVERS', 'METCON', 'NTb', 'SPARKS', 'GECKOS', 'DEFLATE',
+    'BATV', 'FUM', 'TBS', 'MiNX', 'RARBG', 'YIFY', 'EVO', 'NTG', 'SKGTV',
+)
+
+DISTRIBUTORS = ('', '', '[rartv]', '[eztv]', '[ettv]', '[ethd]')
+
+FLAGS = ('', '', '', '', 'PROPER', 'REPACK', 'iNTERNAL', 'REAL')
+
+LANGUAGES = (None, None, None, 'eng-us', 'spa-es', 'swe-sv')
+
+
+class CorpusGenerator:
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def _choice(self, seq):
+        return self.random.choice(seq)
+
+    def _join(self, *parts, sep='.'):
+        return sep.join([x for x in parts if x])
+
+    def _tail(self):
+        """Quality, format, codec and team/distributor tail"""
+        return '{tags}-{group}{dist}'.format(
+            tags=self._join(self._choice(FLAGS),
+                            self._choice(QUALITIES),
+                            self._choice(FORMATS),
+                            self._choice(AUDIO),
+                            self._choice(CODECS)),
+            group=self._choice(GROUPS),
+            dist=self._choice(DISTRIBUTORS))
+
+    def title(self, words=None):
+        words = words or self.random.randint(1, 3)
+        return self._join(
+            self._choice(ARTICLES),
+            *[self._choice(TITLE_WORDS) for _ in range(words)],
+            sep=' ')
+
+    def episode_name(self):
+        title = self.title().replace(' ', '.')
+        if self.random.random() < 0.1:
+            # Series with year
+            title += '.' + str(self.random.randint(1990, 2018))
+
+        season = self.random.randint(1, 15)
+        episode = self.random.randint(1, 24)
+        if self.random.random() < 0.05:
+            # Multi-episode
+            number = 'S{:02d}E{:02d}E{:02d}'.format(season, episode,
+                                                    episode + 1)
+        else:
+            number = 'S{:02d}E{:02d}'.format(season, episode)
+
+        return self._join(title, number, self._tail())
+
+    def movie_name(self):
+        return self._join(self.title().replace(' ', '.'),
+                          str(self.random.randint(1950, 2018)),
+                          self._tail())
+
+    def dated_episode_name(self):
+        return self._join(
+            self.title().replace(' ', '.'),
+            '{:04d}.{:02d}.{:02d}'.format(self.random.randint(2000, 2018),
+                                          self.random.randint(1, 12),
+                                          self.random.randint(1, 28)),
+            self._tail())
+
+    def part_name(self):
+        return self._join(
+            self.title().replace(' ', '.'),
+            'Part.' + str(self.random.randint(1, 6)),
+            self._tail())
+
+    def count_name(self):
+        total = self.random.randint(2, 8)
+        return self._join(
+            self.title().replace(' ', '.'),
+            '{}of{}'.format(self.random.randint(1, total), total),
+            self._tail())
+
+    def casual_name(self):
+        # Non-scene style: spaces, lowercase, NxNN numbering
+        name = '{title} {season}x{episode:02d} {quality} {dist}'.format(
+            title=self.title().lower(),
+            season=self.random.randint(1, 9),
+            episode=self.random.randint(1, 24),
+            quality=self._choice(QUALITIES),
+            dist=self._choice(DISTRIBUTORS))
+        return ' '.join(name.split())
+
+    # (generator, type, weight)
+    SHAPES = (
+        ('episode_name', 'episode', 70),
+        ('movie_name', 'movie', 20),
+        ('dated_episode_name', 'episode', 3),
+        ('part_name', 'episode', 2),
+        ('count_name', 'episode', 2),
+        ('casual_name', 'episode', 3),
+    )
+
+    def typed_name(self):
+        total = sum([x[2] for x in self.SHAPES])
+        n = self.random.randint(1, total)
+        for (method, type, weight) in self.SHAPES:
+            n -= weight
+            if n <= 0:
+                break
+
+        return getattr(self, method)(), type
+
+    def names(self, count):
+        for _ in range(count):
+            yield self.typed_name()[0]
+
+    def records(self, count, provider=None):
+        """
+        Yield provider shaped dicts (see Scanner._normalize_source_data).
+
+        If provider is None records are spread over some well-known provider
+        names.
+        """
+        providers = (provider,) if provider else (
+            'eztv', 'torrentapi', 'epublibre')
+        now = 1514764800  # 2018-01-01
+
+        for _ in range(count):
+            name, type = self.typed_name()
+            yield {
+                'name': name,
+                'uri': bittorrentlib.mock_uri(name),
+                'provider': self._choice(providers),
+                'type': type,
+                'language': self._choice(LANGUAGES),
+                'seeds': self.random.randint(0, 5000),
+                'leechers': self.random.randint(0, 2000),
+                'size': self.random.randint(100, 8000) * 1024 * 1024,
+                'timestamp': now - self.random.randint(0, 60*60*24*365),
+            }
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+"""
+Local stand-in for provider sites.
+
+Serves recorded responses (from benchmarks/fixtures) for eztv, torrentapi
+and epublibre with configurable latency, bandwidth, error injection and rate
+limits for each provider.
+
+Run it with:
+
+  python -m benchmarks replay --port 8080 --latency 0.2
+
+and point arroyo to it with the 'providers-base-uri' setting (or
+'plugins.providers.<name>.base-uri' for a single provider):
+
+  providers-base-uri: http://127.0.0.1:8080
+"""
+
+
+import asyncio
+import collections
+import json
+import random
+import re
+
+
+from aiohttp import web
+
+
+from benchmarks import utils
+
+
+# Seconds between chunks when bandwidth is limited
+CHUNK_INTERVAL = 0.05
+
+# Empty listing served for eztv pages beyond ReplayServer.pages
+EMPTY_PAGE = b'<html><body><table></table></body></html>'
+
+
+class RouteConfig:
+    """
+    Behaviour for a provider's routes.
+
+    - latency: seconds to wait before responding
+    - bandwidth: bytes per second (None for unlimited)
+    - error_rate: probability (0..1) of responding with a 503 error
+    - min_interval: minimal seconds between requests. Faster requests are
+      rejected with 429 (torrentapi allows 1 request each 2 seconds)
+    """
+    def __init__(self, latency=0.0, bandwidth=None, error_rate=0.0,
+                 min_interval=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.min_interval = min_interval
+
+
+class ReplayServer:
+    PROVIDERS = ('eztv', 'torrentapi', 'epublibre')
+
+    def __init__(self, routes=None, pages=10, seed=0, loop=None):
+        self.routes = {name: RouteConfig() for name in self.PROVIDERS}
+        self.routes.update(routes or {})
+        self.pages = pages
+        self.random = random.Random(seed)
+        self.loop = loop or asyncio.get_event_loop()
+        self.counters = collections.Counter()
+
+        self._fixtures = {
+            'eztv': utils.read_fixture('eztv.html'),
+            'torrentapi': utils.read_fixture('torrentapi.json'),
+            'epublibre': utils.read_fixture('epublibre.html'),
+        }
+        self._last_request = {}
+        self._tokens = set()
+        self._handler = None
+        self._server = None
+        self.base_uri = None
+
+        self.app = web.Application(loop=self.loop)
+        self.app.router.add_get('/eztv/{path:.*}', self.handle_eztv)
+        self.app.router.add_get('/torrentapi/pubapi_v2.php',
+                                self.handle_torrentapi)
+        self.app.router.add_get('/epublibre/{path:.*}', self.handle_epublibre)
+
+    @asyncio.coroutine
+    def start(self, host='127.0.0.1', port=0):
+        self._handler = self.app.make_handler()
+        self._server = yield from self.loop.create_server(
+            self._handler, host, port)
+
+        port = self._server.sockets[0].getsockname()[1]
+        self.base_uri = 'http://{host}:{port}'.format(host=host, port=port)
+
+        return self.base_uri
+
+    @asyncio.coroutine
+    def stop(self):
+        self._server.close()
+        yield from self._server.wait_closed()
+        yield from self.app.shutdown()
+        yield from self._handler.shutdown()
+        yield from self.app.cleanup()
+
+        self._server = self._handler = self.base_uri = None
+
+    @asyncio.coroutine
+    def respond(self, provider, request, status, content_type, body):
+        config = self.routes[provider]
+        self.counters[provider + '.requests'] += 1
+
+        if config.min_interval:
+            now = self.loop.time()
+            last = self._last_request.get(provider)
+            self._last_request[provider] = now
+
+            if last is not None and now - last < config.min_interval:
+                self.counters[provider + '.rate-limited'] += 1
+                return web.Response(status=429, text='Too many requests')
+
+        if config.latency:
+            yield from asyncio.sleep(config.latency)
+
+        if config.error_rate and self.random.random() < config.error_rate:
+            self.counters[provider + '.errors'] += 1
+            return web.Response(status=503, text='Injected error')
+
+        if not config.bandwidth:
+            return web.Response(status=status, body=body,
+                                content_type=content_type)
+
+        resp = web.StreamResponse(status=status)
+        resp.content_type = content_type
+        resp.content_length = len(body)
+        yield from resp.prepare(request)
+
+        chunk_size = max(1, int(config.bandwidth * CHUNK_INTERVAL))
+        for idx in range(0, len(body), chunk_size):
+            resp.write(body[idx:idx+chunk_size])
+            yield from resp.drain()
+            yield from asyncio.sleep(CHUNK_INTERVAL)
+
+        yield from resp.write_eof()
+        return resp
+
+    @asyncio.coroutine
+    def handle_eztv(self, request):
+        body = self._fixtures['eztv']
+
+        m = re.search(r'^page_(\d+)$', request.match_info['path'])
+        if m and int(m.group(1)) >= self.pages:
+            body = EMPTY_PAGE
+
+        return (yield from self.respond('eztv', request, 200, 'text/html',
+                                        body))
+
+    @asyncio.coroutine
+    def handle_torrentapi(self, request):
+        params = request.query
+
+        if 'get_token' in params:
+            token = 'replay{}'.format(len(self._tokens))
+            self._tokens.add(token)
+            data = {'token': token}
+
+        elif params.get('token') not in self._tokens:
+            data = {'error': 'Invalid token. Use get_token for a new one!',
+                    'error_code': 4}
+
+        elif params.get('mode') == 'search':
+            words = params.get('search_string', '').lower().split()
+            results = json.loads(self._fixtures['torrentapi'].decode('utf-8'))
+            results = [
+                x for x in results['torrent_results']
+                if all([w in x['title'].lower() for w in words])]
+
+            if results:
+                data = {'torrent_results': results}
+            else:
+                data = {'error': 'No results found', 'error_code': 20}
+
+        else:
+            data = None
+
+        if data is None:
+            body = self._fixtures['torrentapi']
+        else:
+            body = json.dumps(data).encode('utf-8')
+
+        return (yield from self.respond('torrentapi', request, 200,
+                                        'application/json', body))
+
+    @asyncio.coroutine
+    def handle_epublibre(self, request):
+        return (yield from self.respond('epublibre', request, 200,
+                                        'text/html',
+                                        self._fixtures['epublibre']))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import logging
+import os
+
+
+import arroyo
+from arroyo import bittorrentlib
+from arroyo.helpers import mediaparser
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fixtures')
+
+PLUGINS = [
+    'downloaders.mock',
+    'filters.episode',
+    'filters.movie',
+    'filters.source',
+    'filters.tags',
+    'providers.epublibre',
+    'providers.eztv',
+    'providers.torrentapi',
+    'sorters.basic',
+    'sorters.vectorized',
+]
+
+
+class BenchmarkApp(arroyo.Application):
+    def __init__(self, settings=None):
+        defaults = {
+            'plugins.' + plugin + '.enabled': True
+            for plugin in PLUGINS
+        }
+        defaults.update({
+            arroyo.SettingsKey.DB_URI: 'sqlite:///:memory:',
+            arroyo.SettingsKey.DOWNLOADER: 'mock',
+            arroyo.SettingsKey.LOG_LEVEL: logging.CRITICAL,
+            arroyo.SettingsKey.SORTER: 'basic',
+        })
+        defaults.update(settings or {})
+
+        super().__init__(defaults)
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as fh:
+        return fh.read()
+
+
+def release_names():
+    buff = read_fixture('release-names.txt').decode('utf-8')
+    return [x.strip() for x in buff.split('\n') if x.strip()]
+
+
+def clone_entity(entity):
+    if entity is None:
+        return None
+
+    return entity.__class__(**entity.asdict())
+
+
+def build_records(n, names=None, clone_entities=False):
+    """
+    Build n parsed ScanRecords cycling over names (release names fixture by
+    default). Names are parsed once.
+    """
+    names = names or release_names()
+    mp = mediaparser.MediaParser()
+
+    parsed = []
+    for name in names:
+        record = arroyo.ScanRecord(name=name,
+                                   uri=bittorrentlib.mock_uri(name),
+                                   provider='mock')
+        try:
+            entity, tags = mp.parse(record)
+        except (mediaparser.InvalidEntityTypeError,
+                mediaparser.InvalidEntityArgumentsError):
+            continue
+
+        parsed.append((name, entity, tags))
+
+    ret = []
+    for idx in range(n):
+        name, entity, tags = parsed[idx % len(parsed)]
+        record = arroyo.ScanRecord(
+            name=name,
+            uri=bittorrentlib.mock_uri('{} {}'.format(name, idx)),
+            provider='mock',
+            seeds=(idx * 7) % 500,
+            leechers=(idx * 13) % 300)
+        record.entity = clone_entity(entity) if clone_entities else entity
+        record.tags = dict(tags)
+        ret.append(record)
+
+    return ret
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import asyncio
+import unittest
+import unittest.mock
+
+
+import arroyo
+import arroyo.extensions
+from arroyo import (
+    Query,
+    SettingsKey
+)
+from arroyo.exc import DuplicatedDownloadError
+
+
+import testutils
+
+
+class ControllersTest(unittest.TestCase):
+    PLUGINS = [
+        'downloaders.mock',
+        'filters.source',
+        'providers.eztv',
+        'sorters.basic'
+    ]
+
+    def setUp(self):
+        super().setUp()
+        settings = {'plugins.' + k + '.enabled': True
+                    for k in self.PLUGINS}
+        settings[SettingsKey.DOWNLOADER] = 'mock'
+        settings[SettingsKey.SORTER] = 'basic'
+        self.app = testutils.TestApp(settings)
+
+    def test_controllers_are_cached(self):
+        for attr in ['scanner', 'mediaparser', 'selector', 'downloads']:
+            self.assertTrue(
+                getattr(self.app, attr) is getattr(self.app, attr))
+
+    def test_settings_change_invalidates(self):
+        downloads = self.app.downloads
+        self.app.settings.set(SettingsKey.DOWNLOADER, 'mock')
+        self.assertFalse(downloads is self.app.downloads)
+
+    def test_process_executor_is_shared(self):
+        provider = self.app.get_provider('eztv')
+        provider.PARSER_EXECUTOR = 'process'
+
+        pool = self.app.scanner.get_parser_executor(provider)
+        self.assertTrue(pool is self.app.get_process_executor())
+
+        # Settings change shuts it down, controllers get a new one
+        self.app.settings.set(SettingsKey.DOWNLOADER, 'mock')
+        self.assertFalse(
+            pool is self.app.scanner.get_parser_executor(provider))
+        with self.assertRaises(RuntimeError):
+            pool.submit(len, [])
+
+        self.app.shutdown_process_executor()
+
+    def test_process_executor_is_created_on_demand(self):
+        self.app.settings.set(SettingsKey.SCANNER_PARSER_EXECUTOR, 'thread')
+        provider = self.app.get_provider('eztv')
+
+        self.app.scanner.get_parser_executor(provider)
+        self.assertTrue(self.app._process_executor is None)
+
+    def test_process_executor_lifecycle(self):
+        pool = self.app.get_process_executor()
+
+        # HTTP client context doesn't touch the pool
+        with self.app.shared_http_client():
+            pass
+        self.assertTrue(pool is self.app.get_process_executor())
+
+        with unittest.mock.patch.object(arroyo._BaseApplication,
+                                        'execute_from_args'):
+            self.app.execute_from_args([])
+
+        with self.assertRaises(RuntimeError):
+            pool.submit(len, [])
+
+
+class ProvidersBaseURITest(unittest.TestCase):
+    def build_app(self, **settings):
+        settings.update({
+            'plugins.providers.eztv.enabled': True,
+            'plugins.providers.torrentapi.enabled': True,
+        })
+        return testutils.TestApp(settings)
+
+    def test_no_rewrite(self):
+        provider = self.build_app().get_provider('eztv')
+        self.assertEqual(
+            provider.rewrite_uri('https://eztv.ag/page_1'),
+            'https://eztv.ag/page_1')
+
+    def test_global_base_uri(self):
+        app = self.build_app(**{
+            SettingsKey.PROVIDERS_BASE_URI: 'http://127.0.0.1:8080/'
+        })
+        self.assertEqual(
+            app.get_provider('eztv').rewrite_uri('https://eztv.ag/page_1'),
+            'http://127.0.0.1:8080/eztv/page_1')
+        self.assertEqual(
+            app.get_provider('torrentapi').rewrite_uri(
+                'http://torrentapi.org/pubapi_v2.php?mode=list'),
+            'http://127.0.0.1:8080/torrentapi/pubapi_v2.php?mode=list')
+
+    def test_provider_base_uri(self):
+        app = self.build_app(**{
+            SettingsKey.PROVIDERS_BASE_URI: 'http://127.0.0.1:8080',
+            'plugins.providers.eztv.base-uri': 'http://mirror.local'
+        })
+        self.assertEqual(
+            app.get_provider('eztv').rewrite_uri('https://eztv.ag/page_1'),
+            'http://mirror.local/page_1')
+
+
+class AsyncAPITest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = testutils.TestApp({
+            'plugins.filters.source.enabled': True
+        })
+        self.loop = asyncio.get_event_loop()
+
+        @asyncio.coroutine
+        def async_scan(query):
+            return [(testutils.mock_record(name), None)
+                    for name in ['Lost.S01E01.HDTV.x264-FOO',
+                                 'Dark.S01E01.HDTV.x264-FOO']]
+
+        self.app.scanner.async_scan = async_scan
+
+    def test_search_and_filter_in_running_loop(self):
+        query = Query(name_glob='lost*')
+
+        @asyncio.coroutine
+        def search():
+            results = yield from self.app.asearch(query)
+            return (yield from self.app.afilter(results, query))
+
+        res = self.loop.run_until_complete(search())
+        self.assertEqual([x.name for x in res],
+                         ['Lost.S01E01.HDTV.x264-FOO'])
+        self.assertTrue(res[0].entity is not None)
+
+    def test_sync_api_in_running_loop(self):
+        @asyncio.coroutine
+        def search():
+            return self.app.search(Query(name_glob='lost*'))
+
+        with self.assertRaises(RuntimeError):
+            self.loop.run_until_complete(search())
+
+    def test_sync_api_wraps_async_api(self):
+        res = self.app.search(Query(name_glob='lost*'))
+        self.assertEqual(len(res), 2)
+
+
+class SearchManyTest(unittest.TestCase):
+    LISTING = ['Lost.S01E01.HDTV.x264-FOO', 'Dark.S02E01.HDTV.x264-FOO']
+
+    def setUp(self):
+        super().setUp()
+        self.app = testutils.TestApp({
+            'plugins.filters.source.enabled': True
+        })
+        self.queries = [Query(name_glob='lost*'), Query(name_glob='dark*'),
+                        Query(name_glob='mad*')]
+        self.scans = []
+
+        @asyncio.coroutine
+        def async_scan_many(queries, shared_uris=None):
+            self.scans.append((list(queries), shared_uris))
+            if shared_uris is False:
+                # Own search URIs
+                names = {q: [q.name_glob[:-1].title() +
+                             '.S01E01.HDTV.x264-FOO']
+                         for q in queries}
+            else:
+                # Recent additions listing, served to all queries
+                names = {q: self.LISTING for q in queries}
+
+            return {q: [(testutils.mock_record(name), None)
+                        for name in names[q]]
+                    for q in queries}
+
+        self.app.scanner.async_scan_many = async_scan_many
+        self.app.scanner.shared_queries = lambda queries: set(queries)
+
+    def test_queries_without_matches_are_scanned_again(self):
+        res = self.app.search_many(self.queries)
+
+        self.assertEqual(self.scans, [
+            (self.queries, None),
+            ([self.queries[2]], False)])
+        self.assertEqual(
+            [x.name for x in res[self.queries[2]]],
+            ['Mad.S01E01.HDTV.x264-FOO'])
+        self.assertEqual(
+            sorted([x.name for x in res[self.queries[0]]]),
+            sorted(self.LISTING))
+
+
+class DownloadJobsTest(unittest.TestCase):
+    # Both queries select the same source
+    NAMES = ['Lost.S01E01.HDTV.x264-FOO', 'Dark.S01E01.HDTV.x264-FOO']
+
+    def setUp(self):
+        super().setUp()
+        self.app = testutils.TestApp({
+            'plugins.commands.download.enabled': True,
+            'plugins.downloaders.mock.enabled': True,
+            'plugins.filters.source.enabled': True,
+            'plugins.sorters.basic.enabled': True,
+            SettingsKey.DOWNLOADER: 'mock',
+            SettingsKey.SORTER: 'basic'
+        })
+        self.command = self.app.get_extension(
+            arroyo.extensions.CommandExtension, 'download')
+        self.queries = [Query(name_glob='lost*'),
+                        Query(name_glob='lost.s01*')]
+
+        records = [testutils.mock_record(name) for name in self.NAMES]
+
+        @asyncio.coroutine
+        def async_scan_many(queries, shared_uris=None):
+            return {q: [(rec, None) for rec in records] for q in queries}
+
+        self.app.scanner.async_scan_many = async_scan_many
+        self.app.scanner.shared_queries = lambda queries: set()
+
+    def run_queries(self, jobs=2):
+        asyncio.get_event_loop().run_until_complete(
+            self.command.async_process_queries(self.queries, jobs))
+
+    def test_same_source_is_downloaded_once(self):
+        errors = []
+        adownload = self.app.adownload
+        aresolve = self.app.aresolve
+
+        @asyncio.coroutine
+        def _aresolve(sources):
+            # Let both queries select its sources before any download
+            yield from asyncio.sleep(0.01)
+            return (yield from aresolve(sources))
+
+        @asyncio.coroutine
+        def _adownload(source):
+            try:
+                yield from adownload(source)
+            except DuplicatedDownloadError as e:
+                errors.append(e)
+                raise
+
+        self.app.aresolve = _aresolve
+        self.app.adownload = _adownload
+        self.run_queries()
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual([x.name for x in self.app.downloads.list()],
+                         ['Lost.S01E01.HDTV.x264-FOO'])
+
+    def test_downloads_are_serialized(self):
+        counters = {'running': 0, 'max': 0}
+        adownload = self.app.adownload
+
+        @asyncio.coroutine
+        def _adownload(source):
+            counters['running'] += 1
+            counters['max'] = max(counters['max'], counters['running'])
+            try:
+                yield from asyncio.sleep(0.01)
+                yield from adownload(source)
+            finally:
+                counters['running'] -= 1
+
+        self.queries = [Query(name_glob='lost*'), Query(name_glob='dark*')]
+        self.app.adownload = _adownload
+        self.run_queries()
+
+        self.assertEqual(counters['max'], 1)
+        self.assertEqual(
+            sorted([x.name for x in self.app.downloads.list()]),
+            sorted(self.NAMES))
+
+    def test_jobs_bound(self):
+        counters = {'running': 0, 'max': 0}
+
+        @asyncio.coroutine
+        def async_process_query(query, results, writer, force=False):
+            counters['running'] += 1
+            counters['max'] = max(counters['max'], counters['running'])
+            yield from asyncio.sleep(0.01)
+            counters['running'] -= 1
+
+        self.queries = [Query(name_glob=str(idx) + '*') for idx in range(6)]
+        self.command.async_process_query = async_process_query
+        self.run_queries(jobs=2)
+
+        self.assertEqual(counters['max'], 2)
+
+    def test_errors_are_isolated(self):
+        processed = []
+
+        @asyncio.coroutine
+        def async_process_query(query, results, writer, force=False):
+            yield from asyncio.sleep(0)
+            if query is self.queries[0]:
+                raise ValueError(query)
+
+            processed.append(query)
+
+        self.command.async_process_query = async_process_query
+        self.run_queries()
+
+        self.assertEqual(processed, [self.queries[1]])
+
+    def test_manual_is_sequential(self):
+        processed = []
+
+        def process_query(query, manual=False, force=False, results=None):
+            processed.append((query, manual))
+
+        def async_process_queries(*args, **kwargs):
+            self.fail("--manual must not process queries concurrently")
+
+        self.command.async_process_queries = async_process_queries
+        self.command.process_query = process_query
+        self.command.process_queries(self.queries, manual=True, jobs=2)
+
+        self.assertEqual(processed,
+                         [(query, True) for query in self.queries])
+
+
+class SharedHTTPClientTest(unittest.TestCase):
+    def test_shared_http_client(self):
+        app = testutils.TestApp()
+
+        with app.shared_http_client() as shared:
+            with app.get_async_http_client() as client:
+                self.assertIs(client, shared)
+
+            # Nested contexts share the client too
+            with app.shared_http_client() as nested:
+                self.assertIs(nested, shared)
+
+        with app.get_async_http_client() as client:
+            self.assertIsNot(client, shared)
+
+
+if __name__ == '__main__':
+    unittest.main()
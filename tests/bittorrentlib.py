@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import base64
+import hashlib
+import os
+import tempfile
+import unittest
+from urllib import parse
+
+
+import bencodepy
+
+
+from arroyo import bittorrentlib
+
+
+def old_style_infohash(data):
+    # Decode everything and re-encode the info dict
+    metadata = bencodepy.decode(data)
+    digest = hashlib.sha1(bencodepy.encode(metadata[b'info'])).digest()
+    return base64.b32encode(digest).decode('ascii')
+
+
+def magnet_params(magnet):
+    return parse.parse_qs(parse.urlparse(magnet).query)
+
+
+class TorrentDataTest(unittest.TestCase):
+    def test_single_file(self):
+        data = bittorrentlib.mock_torrent_data('foo', length=2048,
+                                               trackers=['udp://a', 'udp://b'])
+        params = magnet_params(bittorrentlib.magnet_from_torrent_data(data))
+
+        self.assertEqual(params['xt'],
+                         ['urn:btih:' + old_style_infohash(data)])
+        self.assertEqual(params['dn'], ['foo'])
+        self.assertEqual(params['xl'], ['2048'])
+        self.assertEqual(params['tr'], ['udp://a', 'udp://b'])
+
+    def test_multiple_files(self):
+        data = bencodepy.encode({
+            b'announce': b'udp://a',
+            b'comment': b'foo',
+            b'info': {
+                b'name': 'dïr'.encode('utf-8'),
+                b'files': [{b'length': 1, b'path': [b'a', b'b']},
+                           {b'length': 2, b'path': [b'c']}],
+                b'piece length': 1,
+                b'pieces': b'x' * 60
+            }
+        })
+        params = magnet_params(bittorrentlib.magnet_from_torrent_data(data))
+
+        self.assertEqual(params['xt'],
+                         ['urn:btih:' + old_style_infohash(data)])
+        self.assertEqual(params['dn'], ['dïr'])
+        self.assertEqual(params['tr'], ['udp://a'])
+        self.assertTrue('xl' not in params)
+
+    def test_decode(self):
+        data = bittorrentlib.mock_torrent_data('foo')
+        self.assertEqual(bittorrentlib._bencode_decode(data, 0),
+                         (bencodepy.decode(data), len(data)))
+
+    def test_invalid_data(self):
+        for data in [b'', b'de', b'd4:info', b'd4:info3:ab', b'l1:ae',
+                     b'<html></html>']:
+            with self.assertRaises(ValueError):
+                bittorrentlib.magnet_from_torrent_data(data)
+
+    def test_torrent_file(self):
+        data = bittorrentlib.mock_torrent_data('foo', length=10**6)
+        fd, path = tempfile.mkstemp()
+        os.write(fd, data)
+        os.close(fd)
+
+        try:
+            self.assertEqual(
+                bittorrentlib.magnet_from_torrent_file(path),
+                bittorrentlib.magnet_from_torrent_data(data))
+        finally:
+            os.unlink(path)
+
+
+
+class MagnetTest(unittest.TestCase):
+    HEX = 'aa' * 20
+    BASE32 = 'VKVKVKVKVKVKVKVKVKVKVKVKVKVKVKVK'
+
+    def test_parse(self):
+        magnet = ('magnet:?xt=urn:btih:{hash}&dn=foo+bar%2B&xl=10'
+                  '&tr=udp%3A%2F%2Fa&tr=udp%3A%2F%2Fb')
+        magnet = magnet.format(hash=self.BASE32)
+
+        self.assertEqual(
+            bittorrentlib.parse_magnet(magnet),
+            {'xt': 'urn:btih:' + self.HEX, 'dn': 'foo bar+', 'xl': 10,
+             'tr': ['udp://a', 'udp://b']})
+
+    def test_non_magnets(self):
+        self.assertEqual(bittorrentlib.parse_magnet('http://foo/'), None)
+        self.assertEqual(bittorrentlib.urn_from_magnet('magnet:?dn=foo'),
+                         None)
+
+    def test_normalization(self):
+        for urn in [self.HEX, self.HEX.upper(), self.BASE32,
+                    self.BASE32.lower()]:
+            self.assertEqual(
+                bittorrentlib.urn_from_magnet('magnet:?xt=urn:btih:' + urn),
+                'urn:btih:' + self.HEX)
+
+    def test_same_result_as_urllib(self):
+        def urllib_urn_from_magnet(uri):
+            qs = parse.parse_qs(parse.urlparse(uri).query)
+            try:
+                return bittorrentlib.normalize_urn(qs['xt'][-1])
+            except KeyError:
+                return None
+
+        for uri in [bittorrentlib.mock_uri('foo'),
+                    'magnet:?dn=a&xt=urn%3Abtih%3A' + self.BASE32,
+                    'magnet:?xt=urn:ed2k:foo&xt=urn:btih:' + self.HEX,
+                    'magnet:?xt=&dn=foo']:
+            self.assertEqual(bittorrentlib.urn_from_magnet(uri),
+                             urllib_urn_from_magnet(uri))
+
+    def test_invalid_urns(self):
+        for urn in ['urn:btih:foo', 'urn:sha1:' + self.HEX,
+                    'URN:btih:' + self.HEX]:
+            with self.assertRaises(ValueError):
+                bittorrentlib.urn_from_magnet('magnet:?xt=' + urn)
+
+    def test_normalize_many(self):
+        self.assertEqual(
+            bittorrentlib.normalize_many([
+                'magnet:?xt=urn:btih:' + self.BASE32,
+                'http://foo/',
+                'magnet:?xt=urn:btih:foo',
+                'magnet:?xt=urn:btih:' + self.HEX]),
+            ['urn:btih:' + self.HEX, None, None, 'urn:btih:' + self.HEX])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+
+from arroyo import Source
+from arroyo.helpers import database
+
+
+import testutils
+
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = testutils.TestApp()
+        self.db = self.app.db
+
+    def count(self):
+        return self.db.session.query(Source).count()
+
+    def test_commit(self):
+        with self.db.transaction():
+            self.db.add(testutils.mock_source('foo'))
+
+        self.db.session.rollback()
+        self.assertEqual(self.count(), 1)
+
+    def test_rollback(self):
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.add(testutils.mock_source('foo'))
+                raise RuntimeError()
+
+        self.assertEqual(self.count(), 0)
+
+    def test_nested(self):
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                with self.db.transaction():
+                    self.db.add(testutils.mock_source('foo'))
+
+                # Inner block doesn't commit
+                raise RuntimeError()
+
+        self.assertEqual(self.count(), 0)
+
+
+class SQLiteTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dirpath = tempfile.mkdtemp()
+        self.uri = 'sqlite:///' + os.path.join(self.dirpath, 'arroyo.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath)
+        super().tearDown()
+
+    def test_pragmas(self):
+        sess = database.create_session(self.uri)
+        self.assertEqual(
+            sess.execute('PRAGMA journal_mode').scalar().lower(), 'wal')
+        self.assertEqual(sess.execute('PRAGMA busy_timeout').scalar(), 5000)
+
+    def test_reader_during_write(self):
+        db = database.Database(database.create_session(self.uri))
+        reader = database.create_session(self.uri)
+
+        with db.transaction():
+            db.add(testutils.mock_source('foo'))
+            db.session.flush()
+
+            # WAL: readers aren't blocked by the pending write
+            self.assertEqual(reader.query(Source).count(), 0)
+
+        self.assertEqual(reader.query(Source).count(), 1)
+
+    def test_thread_sessions(self):
+        db = database.Database(database.create_session(self.uri))
+        sessions = []
+
+        def worker():
+            sessions.append(db.session())
+            with db.transaction():
+                db.add(testutils.mock_source('foo'))
+            db.session.remove()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+        self.assertFalse(sessions[0] is db.session())
+        self.assertEqual(db.session.query(Source).count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,8 @@
 # USA.
 
 
+import asyncio
+import threading
 import unittest
 import unittest.mock
 import time
@@ -188,12 +190,46 @@ class BaseTest:
         self.app.download(src)
         self.app.downloads.get_info(src)
 
+    def test_async_add(self):
+        src1 = testutils.mock_source('foo')
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self.app.adownload(src1))
+        self.wait()
+
+        self.assertEqual(
+            set(self.app.downloads.list()),
+            set([src1]))
+
+        with self.assertRaises(DuplicatedDownloadError):
+            loop.run_until_complete(self.app.adownload(src1))
+
 
 class MockTest(BaseTest, unittest.TestCase):
     PLUGINS = ['downloaders.mock']
     DOWNLOADER = 'mock'
     DOWNLOADER_CLASS = 'arroyo.plugins.downloaders.mock.MockDownloader'
 
+    def test_async_add_in_caller_thread(self):
+        # Mock downloader uses app variables (database), it must not run in
+        # another thread
+        threads = []
+        plugin = self.app.downloads.plugin
+        add = plugin.add
+
+        def _add(source):
+            threads.append(threading.get_ident())
+            return add(source)
+
+        src1 = testutils.mock_source('foo')
+        with unittest.mock.patch.object(plugin, 'add', _add):
+            asyncio.get_event_loop().run_until_complete(
+                self.app.adownload(src1))
+
+        self.assertEqual(threads, [threading.get_ident()])
+        self.assertEqual(
+            set(self.app.downloads.list()),
+            set([src1]))
+
 
 class TransmissionTest(BaseTest, unittest.TestCase):
     PLUGINS = ['downloaders.transmission']
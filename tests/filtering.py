@@ -18,11 +18,14 @@
 # USA.
 
 
+import random
+import types
 import unittest
 
 
 from testutils import (
     analyze,
+    mock_record,
     mock_source
 )
 
@@ -36,6 +39,7 @@ from arroyo.plugins.filters.source import SourceFieldsFilter
 from arroyo.plugins.filters.episode import EpisodeFieldsFilter
 from arroyo.plugins.filters.movie import MovieFieldsFilter
 from arroyo.plugins.sorters.basic import BasicSorter
+from arroyo.plugins.sorters.vectorized import VectorizedSorter
 
 
 # class DumbFilterMixin(FilterExtension):
@@ -112,6 +116,16 @@ class TestEngine(EngineUtilsMixin, unittest.TestCase):
         res = engine.filter_by(sources, name_glob='*foo*')
         self.assertEqual(res[0], sources[0])
 
+    def test_scan_records_filter(self):
+        records = [analyze(mock_record(x)) for x in [
+            'foo.txt',
+            'bar.txt']
+        ]
+        engine = self.get_engine([SourceFieldsFilter])
+
+        res = engine.filter_by(records, type='source', name_glob='*bar*')
+        self.assertEqual(res, [records[1]])
+
 
 class TestSelection(EngineUtilsMixin, unittest.TestCase):
     def assertSelection(self, expected, sources):
@@ -126,6 +140,35 @@ class TestSelection(EngineUtilsMixin, unittest.TestCase):
         self.assertSelection(sources[1], sources)
 
 
+class TestVectorizedSorter(unittest.TestCase):
+    def random_source(self, rnd, idx):
+        def maybe(x):
+            return x if rnd.random() > 0.2 else None
+
+        tags = {}
+        if rnd.random() > 0.8:
+            tags['release.proper'] = True
+        if rnd.random() > 0.5:
+            tags['release.group'] = 'TEAM'
+
+        return types.SimpleNamespace(
+            name='source {}'.format(rnd.randint(0, idx)),
+            seeds=maybe(rnd.randint(0, 50)),
+            leechers=maybe(rnd.randint(0, 50)),
+            tags=tags)
+
+    def test_same_order_as_basic(self):
+        rnd = random.Random(0)
+        sources = [self.random_source(rnd, idx) for idx in range(2000)]
+
+        basic = BasicSorter(shell=Null, logger=None)
+        vectorized = VectorizedSorter(shell=Null, logger=None)
+
+        self.assertEqual(
+            [id(x) for x in basic.sort(sources, None)],
+            [id(x) for x in vectorized.sort(sources, None)])
+
+
 # class FilterEngineTest_(unittest.TestCase):
 #     def __init__(self, *args, **kwargs):
 #         super().__init__(*args, **kwargs)
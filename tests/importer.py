@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+
+
+from arroyo import (
+    Episode,
+    Source
+)
+from arroyo.bittorrentlib import (
+    magnet_from_torrent_data,
+    mock_torrent_data
+)
+from arroyo.helpers.importer import Importer
+
+
+import testutils
+
+
+class ImporterTest(unittest.TestCase):
+    NAMES = [
+        'Lost.S01E01.720p.HDTV.x264-FOO',
+        'Lost.S01E01.HDTV.x264-BAR',
+        'Lost.S01E02.HDTV.x264-FOO',
+        'Foo.2017.1080p.BluRay.x264-FOO',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.app = testutils.TestApp()
+        self.dirpath = tempfile.mkdtemp()
+        for (idx, name) in enumerate(self.NAMES):
+            # Spread files over subdirectories
+            subdir = os.path.join(self.dirpath, str(idx % 2))
+            os.makedirs(subdir, exist_ok=True)
+            with open(os.path.join(subdir, name + '.torrent'), 'wb') as fh:
+                fh.write(mock_torrent_data(name))
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath)
+        super().tearDown()
+
+    def importer(self, **kwargs):
+        kwargs['jobs'] = kwargs.get('jobs', 1)
+        return Importer(db=self.app.db, mediaparser=self.app.mediaparser,
+                        variables=self.app.variables, **kwargs)
+
+    def sources(self):
+        return self.app.db.session.query(Source).all()
+
+    def test_import(self):
+        counters = self.importer(batch_size=3).run(self.dirpath)
+
+        self.assertEqual(counters['imported'], 4)
+        self.assertEqual(
+            sorted([x.name for x in self.sources()]),
+            sorted(self.NAMES))
+        self.assertTrue(all([x.provider == 'import' and x.urn
+                             for x in self.sources()]))
+
+        # Both sources for Lost S01E01 share the same entity
+        episodes = self.app.db.session.query(Episode).all()
+        self.assertEqual(
+            sorted([(x.season, x.number, len(x.sources)) for x in episodes]),
+            [(1, 1, 2), (1, 2, 1)])
+
+    def test_known_sources_are_skipped(self):
+        self.importer().run(self.dirpath)
+        counters = self.importer().run(self.dirpath)
+
+        self.assertEqual(counters['imported'], 0)
+        self.assertEqual(counters['known'], 4)
+        self.assertEqual(len(self.sources()), 4)
+
+    def test_known_sources_with_other_uris(self):
+        # Same torrent found by a provider with a base32 infohash and other
+        # parameters
+        magnet = magnet_from_torrent_data(mock_torrent_data(self.NAMES[0]))
+        infohash = Source(name='x', uri=magnet, provider='x').urn[5:]
+        base32 = base64.b32encode(bytes.fromhex(infohash)).decode('ascii')
+
+        with self.app.db.transaction():
+            self.app.db.session.add(Source(
+                name='Lost S01E01',
+                uri='magnet:?dn=Lost+S01E01&xt=urn:btih:' + base32,
+                provider='eztv'))
+
+        counters = self.importer().run(self.dirpath)
+        self.assertEqual(counters['known'], 1)
+        self.assertEqual(counters['imported'], 3)
+        self.assertEqual(len(self.sources()), 4)
+
+    def test_name_from_magnet(self):
+        self.assertEqual(
+            Importer.name_from_magnet('magnet:?xt=urn:btih:' + 'a' * 40 +
+                                      '&dn=Foo+Bar%5Brartv%5D'),
+            'Foo Bar[rartv]')
+        self.assertEqual(
+            Importer.name_from_magnet('magnet:?xt=urn:btih:' + 'a' * 40),
+            None)
+        self.assertEqual(
+            Importer.name_from_magnet('http://example.com/foo'),
+            None)
+
+    def test_invalid_files(self):
+        with open(os.path.join(self.dirpath, 'bad.torrent'), 'wb') as fh:
+            fh.write(b'<html></html>')
+
+        counters = self.importer().run(self.dirpath)
+        self.assertEqual(counters['imported'], 4)
+        self.assertEqual(counters['errors'], 1)
+
+    def test_resume(self):
+        importer = self.importer()
+        files = sorted([os.path.join(dirpath, x)
+                        for (dirpath, _, names) in os.walk(self.dirpath)
+                        for x in names])
+        importer.set_marker(self.dirpath, files[1])
+
+        counters = importer.run(self.dirpath)
+        self.assertEqual(counters['skipped'], 2)
+        self.assertEqual(counters['imported'], 2)
+
+        # Marker is removed after a complete import
+        self.assertEqual(importer.get_marker(self.dirpath), None)
+
+    def test_process_pool(self):
+        counters = self.importer(jobs=2).run(self.dirpath)
+        self.assertEqual(counters['imported'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,11 @@
 # USA.
 
 
+import itertools
+import os
+import re
+import subprocess
+import sys
 import unittest
 
 
@@ -29,7 +34,13 @@ from arroyo import (
 from arroyo.helpers.mediaparser import (
     MediaParser,
     InvalidEntityTypeError,
-    InvalidEntityArgumentsError
+    InvalidEntityArgumentsError,
+    fast_parse
+)
+from arroyo.helpers.tagger import (
+    RELEASE_GROUPS,
+    Tagger,
+    build_pattern
 )
 
 
@@ -139,5 +150,174 @@ class SourceParsingTest(unittest.TestCase):
         self.assertEqual(e1, e2)
 
 
+class FastPathTest(unittest.TestCase):
+    TITLES = [
+        'Black.Mirror', 'Doctor.Who.2005', 'Game.of.Thrones',
+        'The.Walking.Dead', 'Westworld', 'Star.Trek.Discovery',
+        'The.Handmaids.Tale', 'Better.Call.Saul'
+    ]
+    NUMBERS = ['S01E01', 'S04E10', 'S10E23']
+    MOVIES = ['Blade.Runner.1982', 'Dark.City.1998', 'The.Matrix.1999']
+    TAILS = [
+        '.'.join(filter(None, x))
+        for x in itertools.product(
+            ['', '720p', '1080p'],
+            ['HDTV', 'WEB-DL', 'WEBRip', 'BluRay'],
+            ['x264-KILLERS', 'x265-SVA', 'h264-FLEET', 'XviD-AVS'])
+    ]
+    DISTRIBUTORS = ['', '[rartv]', '[eztv]']
+
+    # Release groups in the corpus above are known to the tagger, which
+    # overrides release_group in both paths. Those are not.
+    UNKNOWN_GROUPS = ['QWERTY', 'Zeppelin']
+    # Names using the fast path with groups only found by the parsers
+    UNKNOWN_GROUP_NAMES = [
+        'Westworld.S02E03.720p.HDTV.x264-QWERTY',
+        'Black.Mirror.S04E01.1080p.WEBRip.x265-Zeppelin[eztv]',
+        'The.Flash.2014.S04E01.720p.HDTV.x264-QWERTY',
+        'Dark.City.1998.720p.BluRay.h264-Zeppelin[rartv]',
+    ]
+    # Shapes the fast path must leave to guessit: multi-episode, year in
+    # title, no release group
+    OTHER_NAMES = [
+        'Doctor.Who.2005.S10E01E02.720p.HDTV.x264-QWERTY',
+        'Game.of.Thrones.S07E01-E02.720p.HDTV.x264-Zeppelin',
+        'Blade.Runner.2049.2017.1080p.BluRay.x264-QWERTY',
+        'Westworld.S02E03.720p.HDTV.x264',
+        'Better.Call.Saul.S03E01.HDTV.x264[rartv]',
+        'The.Matrix.1999.1080p.BluRay.x264',
+    ]
+
+    def corpus(self):
+        episodes = itertools.product(
+            self.TITLES, self.NUMBERS, self.TAILS, self.DISTRIBUTORS)
+        for (title, number, tail, dist) in episodes:
+            yield '{}.{}.{}{}'.format(title, number, tail, dist)
+
+        movies = itertools.product(self.MOVIES, self.TAILS,
+                                   self.DISTRIBUTORS)
+        for (title, tail, dist) in movies:
+            yield '{}.{}{}'.format(title, tail, dist)
+
+    def test_same_results_as_guessit(self):
+        fast = MediaParser(fast_path=True)
+        slow = MediaParser(fast_path=False)
+
+        names = itertools.chain(
+            self.corpus(), self.UNKNOWN_GROUP_NAMES, self.OTHER_NAMES)
+        for name in names:
+            self.assertEqual(fast.parse_name(name), slow.parse_name(name),
+                             msg=name)
+
+    def test_unknown_groups(self):
+        groups = [x.lower() for x in self.UNKNOWN_GROUPS]
+        self.assertFalse(set(groups) & set(RELEASE_GROUPS))
+
+        for name in self.UNKNOWN_GROUP_NAMES:
+            name = name.split('[')[0]
+            info = fast_parse(name)
+            self.assertTrue(info is not None, msg=name)
+            self.assertEqual(info['release_group'], name.split('-')[-1])
+
+    def test_other_names_are_deferred(self):
+        for name in self.OTHER_NAMES:
+            name = name.split('[')[0]
+            self.assertTrue(fast_parse(name) is None, msg=name)
+
+    def test_corpus_uses_fast_path(self):
+        for name in self.corpus():
+            name = name.split('[')[0]
+            self.assertTrue(fast_parse(name) is not None, msg=name)
+
+    def test_ambiguous_names_are_deferred(self):
+        names = [
+            'Lost s01e01',
+            'The.Office.US.S01E01.HDTV.x264-LOL',
+            'Dark.S01E05.DUBBED.1080p.WEBRip.x264-SERIOUSLY',
+            'Dark.S01E05.PROPER.720p.HDTV.x264-KILLERS',
+            'Dark.S01E05E06.720p.HDTV.x264-KILLERS',
+            'Dark.S01E05.720p.HDTV.AAC.x264-KILLERS',
+            'Blade.Runner.2049.2017.1080p.BluRay.x264-SPARKS',
+        ]
+        for name in names:
+            self.assertTrue(fast_parse(name) is None, msg=name)
+
+    def test_type_hint(self):
+        name = 'Blade.Runner.1982.1080p.BluRay.x264-SPARKS'
+        self.assertEqual(fast_parse(name)['type'], 'movie')
+        self.assertTrue(fast_parse(name, type='episode') is None)
+
+
+class TaggerTest(unittest.TestCase):
+    def test_build_pattern(self):
+        words = ['foo', 'foobar', 'fox', 'bar']
+        pattern = re.compile('^(?:' + build_pattern(words) + ')$')
+        for word in words:
+            self.assertTrue(pattern.match(word))
+
+        for word in ['fo', 'foob', 'foxy', 'ba']:
+            self.assertFalse(pattern.match(word))
+
+    def test_distributors(self):
+        tagger = Tagger()
+        name, info = tagger.tag('Foo.S01E01.HDTV.x264-Bar[eztv][RARTV]')
+        self.assertEqual(name, 'Foo.S01E01.HDTV.x264-Bar')
+        self.assertEqual(info, {'release_distributors': ['eztv', 'rartv']})
+
+    def test_release_group(self):
+        tagger = Tagger(release_groups=['killers'])
+        name, info = tagger.tag('Foo.S01E01.HDTV.x264-KILLERS[rartv]')
+        self.assertEqual(info['release_group'], 'KILLERS')
+
+        name, info = tagger.tag('Foo.S01E01.HDTV.x264-KILLERSX')
+        self.assertFalse('release_group' in info)
+
+    def test_bad_tags(self):
+        tagger = Tagger(bad_tags=['cam', 'ts'])
+        name, info = tagger.tag('Foo.2017.CAM.x264-Bar')
+        self.assertEqual(info, {'release_bad_tags': ['cam']})
+
+        name, info = tagger.tag('Foo.2017.DTS.Camera.x264-Bar')
+        self.assertEqual(info, {})
+
+    def test_bad_tags_in_title(self):
+        tagger = Tagger(distributors=[], release_groups=[],
+                        bad_tags=['cam', 'sample', 'ts'])
+        for name in ['The.TS.Show.S01E01-sva',
+                     'Cam.2018.1080p.WEBRip.x264',
+                     'The.Sample.1x02.HDTV',
+                     'Cam.Girl']:
+            self.assertEqual(tagger.tag(name), (name, {}))
+
+        name, info = tagger.tag('The.TS.Show.S01E01.TS.x264-sva')
+        self.assertEqual(info, {'release_bad_tags': ['ts']})
+
+    def test_large_lists(self):
+        groups = ['group{}'.format(x) for x in range(5000)]
+        tagger = Tagger(release_groups=groups)
+        name, info = tagger.tag('Foo.S01E01.HDTV.x264-GROUP4321')
+        self.assertEqual(info['release_group'], 'GROUP4321')
+
+    def test_parser_uses_tagger(self):
+        mp = MediaParser(tagger=Tagger(bad_tags=['korsub']))
+        t, p, m, o = mp.parse_name('Foo.2017.KORSUB.HDRip.x264-Bar')
+        self.assertEqual(m['release.bad-tags'], ['korsub'])
+
+
+class LazyBackendsTest(unittest.TestCase):
+    def test_backends_are_not_loaded_on_import(self):
+        code = (
+            'import sys, arroyo; '
+            'assert "guessit" not in sys.modules; '
+            'assert "babelfish" not in sys.modules')
+        cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.check_call([sys.executable, '-c', code], cwd=cwd)
+
+    def test_backends_are_loaded_on_use(self):
+        mp = MediaParser()
+        mp.parse_name('Lost s01e01')
+        self.assertTrue('guessit' in sys.modules)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import cProfile
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+
+
+from arroyo.helpers.profiling import Profiler, collapsed_stacks
+
+
+def leaf():
+    return sum([x * x for x in range(50000)])
+
+
+def parent():
+    return leaf() + leaf()
+
+
+class CollapsedStacksTest(unittest.TestCase):
+    def test_stacks(self):
+        profile = cProfile.Profile()
+        profile.runcall(parent)
+        lines = collapsed_stacks(pstats.Stats(profile))
+
+        stacks = [line.rsplit(' ', 1)[0].split(';') for line in lines]
+        self.assertTrue(any([
+            stack[-1].endswith('(leaf)') and stack[-2].endswith('(parent)')
+            for stack in stacks]))
+
+        for line in lines:
+            self.assertTrue(int(line.rsplit(' ', 1)[1]) > 0)
+
+    def test_dense_call_graph(self):
+        # Each function calls every function in the next layer: 3^40 paths
+        class FakeStats:
+            stats = {}
+
+        layers = [[('mock.py', 1, 'root')]] + [
+            [('mock.py', 1, 'f{}_{}'.format(i, j)) for j in range(3)]
+            for i in range(40)]
+
+        cts = {}
+        for (idx, layer) in reversed(list(enumerate(layers))):
+            for func in layer:
+                cts[func] = 1.0 + sum([
+                    cts[callee] / len(layer)
+                    for callee in (layers[idx + 1]
+                                   if idx + 1 < len(layers) else [])])
+
+        for (idx, layer) in enumerate(layers):
+            callers = layers[idx - 1] if idx else []
+            for func in layer:
+                FakeStats.stats[func] = (
+                    1, 1, 1.0, cts[func],
+                    {caller: (1, 1, 1.0 / len(callers),
+                              cts[func] / len(callers))
+                     for caller in callers})
+
+        t0 = time.time()
+        lines = collapsed_stacks(FakeStats)
+        self.assertTrue(time.time() - t0 < 10)
+
+        total = sum([int(line.rsplit(' ', 1)[1]) for line in lines])
+        self.assertAlmostEqual(total / 1000000, cts[layers[0][0]],
+                               delta=0.01)
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_threads_are_profiled(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profiler = Profiler(os.path.join(tmpdir, 'arroyo.pstats'))
+            profiler.start()
+            thread = threading.Thread(target=parent)
+            thread.start()
+            thread.join()
+            profiler.stop()
+
+            funcs = [func for (_, _, func) in profiler.get_stats().stats]
+            self.assertTrue('leaf' in funcs)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,5 @@
+import copy
+import pickle
 import unittest
 
 
@@ -41,6 +43,45 @@ class QueryTest(unittest.TestCase):
         self.assertEqual(query.name_glob, '*foo*bar*')
 
 
+class QueryValueTest(unittest.TestCase):
+    def test_interned(self):
+        q1 = Query(type='episode', series='lost', season=1)
+        q2 = Query(season=1, series='lost', type='episode')
+        self.assertTrue(q1 is q2)
+        self.assertEqual(hash(q1), hash(q2))
+
+        self.assertTrue(Query(**{'name-glob': '*'}) is Query(name_glob='*'))
+        self.assertTrue(Query('lost s01e01') is Query('lost s01e01'))
+
+    def test_value_types_are_not_mixed(self):
+        self.assertFalse(Query(foo=1) is Query(foo=True))
+        self.assertNotEqual(Query(foo=1), Query(foo='1'))
+
+    def test_immutable(self):
+        query = Query(type='movie', title='foo')
+        with self.assertRaises(TypeError):
+            query.title = 'bar'
+
+        data = query.asdict()
+        data['title'] = 'bar'
+        self.assertEqual(query.title, 'foo')
+
+    def test_copy_and_pickle(self):
+        query = Query(type='movie', title='foo', movie_year=2018)
+        self.assertTrue(copy.copy(query) is query)
+        self.assertTrue(copy.deepcopy(query) is query)
+        self.assertTrue(pickle.loads(pickle.dumps(query)) is query)
+
+    def test_cache_key(self):
+        self.assertEqual(
+            Query(type='episode', series='lost', season=1).cache_key,
+            'season=1&series=lost&type=episode')
+
+    def test_usable_as_key(self):
+        d = {Query(type='movie', title='foo'): 1}
+        self.assertEqual(d[Query(title='foo', type='movie')], 1)
+
+
 class QueryStrTest(unittest.TestCase):
     def test_source(self):
         self.assertEqual(
@@ -144,6 +185,18 @@ class TestApplicationQueries(unittest.TestCase):
              'type': 'source', 'name_glob': '*foo*bar*'})
 
 
+    def test_duplicated_config_queries(self):
+        app = testutils.TestApp(settings={
+            'queries.a.series': 'lost',
+            'queries.a.type': 'episode',
+            'queries.b.series': 'lost',
+            'queries.b.type': 'episode',
+            'queries.c.title': 'foo',
+            'queries.c.type': 'movie',
+        })
+        queries = app.get_queries_from_config()
+        self.assertEqual(len(queries), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
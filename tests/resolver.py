@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import asyncio
+import unittest
+
+
+import bencodepy
+
+
+from arroyo import ScanRecord
+from arroyo.bittorrentlib import mock_uri
+from arroyo.helpers.resolver import Resolver
+
+
+class DictCache(dict):
+    # Same interface as appkit caches
+    def get(self, key):
+        return self[key]
+
+    def set(self, key, value):
+        self[key] = value
+
+
+class Provider:
+    TORRENT = bencodepy.encode({
+        b'announce': b'udp://tracker.local:80',
+        b'info': {b'name': b'foo', b'length': 1024, b'piece length': 512,
+                  b'pieces': b'x' * 40}
+    })
+
+    def __init__(self):
+        self.fetches = []
+        self.running = 0
+        self.max_running = 0
+
+    @asyncio.coroutine
+    def fetch(self, uri):
+        self.fetches.append(uri)
+        self.running += 1
+        self.max_running = max(self.running, self.max_running)
+        yield from asyncio.sleep(0.01)
+        self.running -= 1
+
+        if uri.endswith('/broken'):
+            raise ValueError(uri)
+        elif uri.endswith('.torrent'):
+            return self.TORRENT
+        elif uri.endswith('/missing'):
+            return b'<html></html>'
+        else:
+            return uri.encode('utf-8')
+
+    def parse(self, buffer):
+        if buffer == b'<html></html>':
+            return []
+
+        return [{'name': 'foo',
+                 'uri': mock_uri(buffer.decode('utf-8'))}]
+
+
+class ResolverTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.provider = Provider()
+        self.cache = DictCache()
+
+    def resolver(self, **kwargs):
+        return Resolver(providers=[('mock', self.provider)],
+                        cache=self.cache, **kwargs)
+
+    def record(self, uri):
+        return ScanRecord(name='foo', uri=uri, provider='mock')
+
+    def test_detail_page(self):
+        src = self.record('http://mock/1')
+        failed = self.resolver().resolve_all([src])
+
+        self.assertEqual(failed, [])
+        self.assertEqual(src.uri, mock_uri('http://mock/1'))
+        self.assertFalse(src.needs_postprocessing)
+
+    def test_torrent_file(self):
+        src = self.record('http://mock/1.torrent')
+        self.resolver().resolve_all([src])
+
+        self.assertTrue(src.uri.startswith('magnet:?xt=urn:btih:'))
+        self.assertIsNotNone(src.urn)
+
+    def test_failures(self):
+        src = self.record('http://mock/missing')
+        failed = self.resolver().resolve_all([src])
+
+        self.assertEqual(failed, [src])
+        self.assertEqual(src.uri, 'http://mock/missing')
+
+    def test_unexpected_errors(self):
+        srcs = [self.record('http://mock/broken'),
+                self.record('http://mock/1')]
+        failed = self.resolver().resolve_all(srcs)
+
+        self.assertEqual(failed, [srcs[0]])
+        self.assertEqual(srcs[1].uri, mock_uri('http://mock/1'))
+
+    def test_only_lazy_sources_are_fetched(self):
+        self.resolver().resolve_all([self.record(mock_uri('foo'))])
+        self.assertEqual(self.provider.fetches, [])
+
+    def test_bounded_concurrency(self):
+        srcs = [self.record('http://mock/' + str(i)) for i in range(10)]
+        self.resolver(concurrency=3).resolve_all(srcs)
+
+        self.assertEqual(len(self.provider.fetches), 10)
+        self.assertEqual(self.provider.max_running, 3)
+        self.assertTrue(all([not x.needs_postprocessing for x in srcs]))
+
+    def test_cache(self):
+        resolver = self.resolver()
+        resolver.resolve_all([self.record('http://mock/1')])
+        src = self.record('http://mock/1')
+        resolver.resolve_all([src])
+
+        self.assertEqual(self.provider.fetches, ['http://mock/1'])
+        self.assertEqual(src.uri, mock_uri('http://mock/1'))
+        self.assertEqual(resolver.counters['resolve.cache'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import asyncio
+import concurrent.futures
+import os
+import pickle
+import unittest
+import unittest.mock
+
+
+from arroyo import Query
+from arroyo.bittorrentlib import mock_uri
+from arroyo.helpers.scanner import Scanner
+
+
+import testutils
+
+
+HEX_URN = 'urn:btih:' + 'a' * 40
+# Same infohash as HEX_URN in base32
+B32_URN = 'urn:btih:VKVKVKVKVKVKVKVKVKVKVKVKVKVKVKVK'
+
+
+def psrc(provider, uri, **kwargs):
+    ret = dict(name='foo', provider=provider, uri=uri, seeds=None,
+               leechers=None, timestamp=None)
+    ret.update(kwargs)
+    return ret
+
+
+class DeduplicationTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.scanner = Scanner(providers=[])
+
+    def test_same_infohash(self):
+        res = self.scanner._deduplicate_source_data(
+            psrc('eztv', 'magnet:?xt=' + HEX_URN + '&tr=x',
+                 seeds=10, leechers=1, timestamp=200),
+            psrc('torrentapi', 'magnet:?xt=' + B32_URN + '&dn=foo',
+                 seeds=5, leechers=7, timestamp=100))
+
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['provider'], 'eztv')
+        self.assertEqual(res[0]['providers'], ['eztv', 'torrentapi'])
+        self.assertEqual(res[0]['seeds'], 10)
+        self.assertEqual(res[0]['leechers'], 7)
+        self.assertEqual(res[0]['timestamp'], 100)
+        self.assertEqual(self.scanner.counters['dedup.merged'], 1)
+
+    def test_urns_are_reused_by_records(self):
+        psrcs = self.scanner._deduplicate_source_data(
+            psrc('eztv', 'magnet:?xt=' + B32_URN),
+            psrc('epublibre', 'http://foo/1'))
+
+        self.assertEqual([x['urn'] for x in psrcs], [HEX_URN, None])
+        records = [x for (_, x) in self.scanner._build_records(*psrcs)]
+        self.assertEqual([x.urn for x in records],
+                         [HEX_URN[len('urn:'):], None])
+
+    def test_lazy_sources(self):
+        res = self.scanner._deduplicate_source_data(
+            psrc('epublibre', 'http://foo/1'),
+            psrc('epublibre', 'http://foo/2'),
+            psrc('epublibre', 'http://foo/1'))
+
+        self.assertEqual(
+            [x['uri'] for x in res],
+            ['http://foo/1', 'http://foo/2'])
+
+
+class PlannerTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = testutils.TestApp({
+            'plugins.providers.eztv.enabled': True,
+            'plugins.providers.torrentapi.enabled': True,
+        })
+        self.scanner = self.app.scanner
+        self.queries = [
+            Query(type='episode', series='lost'),
+            Query(type='episode', series='dark'),
+            Query(type='movie', title='foo'),
+        ]
+
+    def test_plan(self):
+        plan = self.scanner.plan(self.queries)
+        plan = {(o.provider_name, o.uri): qs for (o, qs) in plan}
+
+        # eztv listing and torrentapi episodes feed serve both episodes.
+        # Movie query goes to torrentapi search
+        self.assertEqual(len(plan), 3)
+        shared = [qs for qs in plan.values() if len(qs) == 2]
+        self.assertEqual(len(shared), 2)
+
+    def test_single_query_does_not_use_shared_uris(self):
+        plan = self.scanner.plan(self.queries[:1])
+        self.assertEqual(
+            sorted([o.uri for (o, _) in plan]),
+            sorted([o.uri for o in
+                    self.scanner.origins_for_query(self.queries[0])]))
+
+    def test_plan_without_shared_uris(self):
+        plan = self.scanner.plan(self.queries, shared_uris=False)
+        self.assertEqual(
+            sorted([o.uri for (o, _) in plan]),
+            sorted([o.uri
+                    for q in self.queries
+                    for o in self.scanner.origins_for_query(q)]))
+
+    def test_shared_queries(self):
+        self.assertEqual(
+            self.scanner.shared_queries(self.queries),
+            set(self.queries[:2]))
+        self.assertEqual(
+            self.scanner.shared_queries(self.queries[:1]),
+            set())
+
+    def test_scan_many_fans_out(self):
+        @asyncio.coroutine
+        def get_data_from_origins(*origins):
+            ret = []
+            for origin in origins:
+                if origin.iterations > 1 or 'mode=list' in origin.uri:
+                    names = ['Lost.S01E01.HDTV.x264-FOO',
+                             'Dark.S01E01.HDTV.x264-FOO']
+                else:
+                    names = ['Foo.2017.1080p.BluRay.x264-FOO']
+
+                ret.extend([
+                    (origin, origin.uri,
+                     psrc(origin.provider_name, mock_uri(name), name=name))
+                    for name in names])
+
+            return ret
+
+        self.scanner.async_get_data_from_origins = get_data_from_origins
+        res = self.scanner.scan_many(self.queries)
+
+        lost, dark, movie = [res[q] for q in self.queries]
+        self.assertEqual(
+            sorted([x.name for (x, _) in lost]),
+            ['Dark.S01E01.HDTV.x264-FOO', 'Lost.S01E01.HDTV.x264-FOO'])
+        self.assertEqual(
+            [x.name for (x, _) in movie],
+            ['Foo.2017.1080p.BluRay.x264-FOO'])
+
+        # Records from eztv and torrentapi are merged and shared
+        self.assertEqual(len(lost), 2)
+        self.assertTrue(all([a is b for ((a, _), (b, _)) in zip(
+            sorted(lost, key=lambda x: x[0].name),
+            sorted(dark, key=lambda x: x[0].name))]))
+
+
+class ParserProvider:
+    # Module level, instances must be picklable
+    __extension_name__ = 'mock'
+    PARSER_NEEDS_SHELL = False
+    overrides = {}
+
+    def __init__(self, executor):
+        self.PARSER_EXECUTOR = executor
+
+    def parse(self, buffer):
+        return [dict(name='pid-' + str(os.getpid()),
+                     uri=mock_uri(buffer.decode('utf-8')))]
+
+
+class FetchCoalescingTest(unittest.TestCase):
+    class Provider:
+        def __init__(self):
+            self.fetches = []
+
+        @asyncio.coroutine
+        def fetch(self, uri):
+            self.fetches.append(uri)
+            yield from asyncio.sleep(0.01)
+            return b'buffer for ' + uri.encode('utf-8')
+
+        def is_cacheable(self, buffer):
+            return not buffer.endswith(b'/error')
+
+    class Origin:
+        provider_name = 'mock'
+
+        def __init__(self, provider):
+            self.provider = provider
+
+    def setUp(self):
+        super().setUp()
+        self.provider = self.Provider()
+        self.origin = self.Origin(self.provider)
+        self.loop = asyncio.get_event_loop()
+
+    def fetch(self, scanner, *uris):
+        tasks = [scanner.get_buffer_from_uri(self.origin, uri)
+                 for uri in uris]
+        return self.loop.run_until_complete(asyncio.gather(*tasks))
+
+    def test_inflight_requests_are_shared(self):
+        scanner = Scanner(providers=[], fetch_memo_ttl=0)
+        res = self.fetch(scanner, 'http://a/', 'http://a/', 'http://b/')
+
+        self.assertEqual(sorted(self.provider.fetches),
+                         ['http://a/', 'http://b/'])
+        self.assertEqual(res[0][2], res[1][2])
+        self.assertEqual(scanner.counters['fetch.shared'], 1)
+
+    def test_memo(self):
+        scanner = Scanner(providers=[])
+        self.fetch(scanner, 'http://a/')
+        self.fetch(scanner, 'http://a/')
+
+        self.assertEqual(self.provider.fetches, ['http://a/'])
+        self.assertEqual(scanner.counters['fetch.memo'], 1)
+
+    def test_memo_rejected_buffers(self):
+        scanner = Scanner(providers=[])
+        self.fetch(scanner, 'http://a/error')
+        self.fetch(scanner, 'http://a/error')
+
+        self.assertEqual(self.provider.fetches,
+                         ['http://a/error', 'http://a/error'])
+        self.assertEqual(scanner.counters['fetch.memo'], 0)
+
+    def test_memo_disabled(self):
+        scanner = Scanner(providers=[], fetch_memo_ttl=0)
+        self.fetch(scanner, 'http://a/')
+        self.fetch(scanner, 'http://a/')
+
+        self.assertEqual(self.provider.fetches, ['http://a/', 'http://a/'])
+
+
+class ParserExecutorTest(unittest.TestCase):
+    class Origin:
+        provider_name = 'mock'
+
+        def __init__(self, provider):
+            self.provider = provider
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        super().tearDown()
+
+    def scanner(self, **kwargs):
+        return Scanner(providers=[], get_process_executor=lambda: self.pool,
+                       **kwargs)
+
+    def parse(self, scanner, provider):
+        origin = self.Origin(provider)
+        res = self.loop.run_until_complete(
+            scanner.async_parse_buffer(origin, 'http://a/', b'foo'))
+
+        self.assertEqual(len(res), 1)
+        return res[0][2]['name']
+
+    def test_thread(self):
+        self.assertEqual(
+            self.parse(self.scanner(), ParserProvider('thread')),
+            'pid-' + str(os.getpid()))
+
+    def test_process(self):
+        self.assertNotEqual(
+            self.parse(self.scanner(), ParserProvider('process')),
+            'pid-' + str(os.getpid()))
+
+    def test_provider_is_pickled_once(self):
+        scanner = self.scanner()
+        provider = ParserProvider('process')
+
+        with unittest.mock.patch('pickle.dumps',
+                                 wraps=pickle.dumps) as dumps:
+            self.parse(scanner, provider)
+            self.parse(scanner, provider)
+
+        self.assertEqual(dumps.call_count, 1)
+
+    def test_without_process_executor(self):
+        self.assertEqual(
+            self.parse(Scanner(providers=[]), ParserProvider('process')),
+            'pid-' + str(os.getpid()))
+
+    def test_setting_overrides_provider(self):
+        self.assertEqual(
+            self.parse(self.scanner(parser_executor='thread'),
+                       ParserProvider('process')),
+            'pid-' + str(os.getpid()))
+
+    def test_parser_needing_shell_uses_thread(self):
+        provider = ParserProvider('process')
+        provider.PARSER_NEEDS_SHELL = True
+
+        self.assertEqual(
+            self.parse(self.scanner(parser_executor='process'), provider),
+            'pid-' + str(os.getpid()))
+
+    def test_unpicklable_provider_uses_thread(self):
+        provider = ParserProvider('process')
+        provider.parse = lambda buffer: ParserProvider.parse(provider, buffer)
+
+        self.assertEqual(
+            self.parse(self.scanner(), provider),
+            'pid-' + str(os.getpid()))
+
+    def test_invalid_executor(self):
+        with self.assertRaises(ValueError):
+            Scanner(providers=[], parser_executor='foo')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+
+from arroyo.helpers.sharedstate import SharedState
+
+
+import testutils
+
+
+class SharedStateTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+        super().tearDown()
+
+    def test_shared_between_instances(self):
+        a = SharedState(self.path)
+        b = SharedState(self.path)
+
+        with a.transaction() as data:
+            data['foo'] = 1
+
+        self.assertEqual(b.get('foo'), 1)
+
+    def test_errors_discard_changes(self):
+        state = SharedState(self.path)
+
+        with self.assertRaises(ValueError):
+            with state.transaction() as data:
+                data['foo'] = 1
+                raise ValueError()
+
+        self.assertEqual(state.get('foo'), None)
+
+    def test_corrupted_file(self):
+        with open(self.path, 'w') as fh:
+            fh.write('{foo')
+
+        self.assertEqual(SharedState(self.path).get('foo', 1), 1)
+
+    def test_non_durable(self):
+        state = SharedState(self.path)
+
+        with unittest.mock.patch('os.fsync') as fsync:
+            with state.transaction(durable=False) as data:
+                data['foo'] = 1
+
+            self.assertFalse(fsync.called)
+
+            with state.transaction() as data:
+                data['foo'] = 2
+
+            self.assertTrue(fsync.called)
+
+        self.assertEqual(SharedState(self.path).get('foo'), 2)
+
+    def test_in_memory(self):
+        state = SharedState()
+        with state.transaction() as data:
+            data['foo'] = 1
+
+        self.assertEqual(state.get('foo'), 1)
+
+
+class TorrentAPIStateTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = testutils.TestApp({
+            'plugins.providers.torrentapi.enabled': True
+        })
+        self.provider = self.app.get_provider('torrentapi')
+        self.loop = asyncio.get_event_loop()
+
+    def test_token_is_reused(self):
+        with self.app.shared_state.transaction() as data:
+            data[self.provider.SHARED_STATE_KEY] = {
+                'token': 'foo',
+                'token-ts': time.time()
+            }
+
+        self.loop.run_until_complete(self.provider.refresh_token())
+        self.assertEqual(self.provider.token, 'foo')
+
+    def test_token_is_requested_once(self):
+        requests = []
+
+        class Client:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                pass
+
+            @asyncio.coroutine
+            def fetch(self, uri):
+                requests.append(uri)
+                yield from asyncio.sleep(0.1)
+                return b'{"token": "foo"}'
+
+        self.app.get_async_http_client = Client
+        others = [self.app.get_provider('torrentapi') for _ in range(2)]
+
+        self.loop.run_until_complete(asyncio.gather(
+            *[p.refresh_token() for p in [self.provider] + others]))
+
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(
+            [p.token for p in [self.provider] + others],
+            ['foo'] * 3)
+
+    def test_throttle_does_not_block_loop(self):
+        ticks = []
+        locked = threading.Event()
+
+        def hold():
+            with self.app.shared_state.transaction():
+                locked.set()
+                time.sleep(0.2)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        locked.wait()
+        t0 = time.time()
+
+        @asyncio.coroutine
+        def tick():
+            for _ in range(5):
+                ticks.append(time.time())
+                yield from asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(
+            asyncio.gather(self.provider.throttle(), tick()))
+        thread.join()
+
+        # Loop kept running while state was locked
+        self.assertTrue(ticks[-1] - t0 < 0.15)
+
+    def test_throttle_is_shared(self):
+        other = self.app.get_provider('torrentapi')
+
+        self.loop.run_until_complete(self.provider.throttle())
+        t0 = time.time()
+        self.loop.run_until_complete(other.throttle())
+
+        self.assertTrue(
+            time.time() - t0 >= self.provider.REQUEST_INTERVAL - 0.1)
+
+    def test_invalid_token_response(self):
+        with self.app.shared_state.transaction() as data:
+            data[self.provider.SHARED_STATE_KEY] = {
+                'token': 'foo',
+                'token-ts': time.time()
+            }
+
+        self.provider.parse(b'{"error": "Invalid token", "error_code": 4}')
+        self.assertEqual(
+            self.app.shared_state.get(self.provider.SHARED_STATE_KEY),
+            {})
+
+    def test_errors_are_not_cacheable(self):
+        self.assertFalse(self.provider.is_cacheable(
+            b'{"error": "Invalid token", "error_code": 4}'))
+        self.assertFalse(self.provider.is_cacheable(b'<html>'))
+        self.assertTrue(self.provider.is_cacheable(
+            b'{"error": "No results found", "error_code": 20}'))
+        self.assertTrue(self.provider.is_cacheable(
+            b'{"torrent_results": []}'))
+
+
+if __name__ == '__main__':
+    unittest.main()
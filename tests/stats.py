@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2017 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+
+import asyncio
+import io
+import json
+import threading
+import unittest
+
+
+import arroyo.helpers.stats
+from arroyo.helpers.asyncutils import run_in_executor
+from arroyo.helpers.stats import Stats
+
+
+class StatsTest(unittest.TestCase):
+    def test_disabled(self):
+        stats = Stats()
+        with stats.timer('foo'):
+            stats.incr('bar')
+
+        self.assertEqual(stats.report()['scopes'], {})
+
+    def test_scopes(self):
+        stats = Stats(enabled=True)
+
+        with stats.scope('q1'):
+            with stats.timer('foo'):
+                stats.incr('bar')
+
+        with stats.scope('q2'):
+            with stats.timer('foo'):
+                stats.incr('bar', 2)
+
+        report = stats.report()
+        self.assertEqual(list(report['scopes'].keys()), ['q1', 'q2'])
+        self.assertEqual(report['scopes']['q2']['counters'], {'bar': 2})
+        self.assertEqual(report['total']['counters'], {'bar': 3})
+        self.assertEqual(report['total']['timers']['foo']['count'], 2)
+
+    def test_dump(self):
+        stats = Stats(enabled=True)
+        stats.incr('foo')
+
+        fh = io.StringIO()
+        stats.dump(fh)
+        self.assertEqual(
+            json.loads(fh.getvalue())['scopes'][Stats.GLOBAL_SCOPE],
+            {'counters': {'foo': 1}, 'timers': {}})
+
+    def test_scopes_are_per_thread(self):
+        stats = Stats(enabled=True)
+
+        def worker():
+            stats.incr('bar')
+
+        with stats.scope('q1'):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+            stats.incr('foo')
+
+        report = stats.report()['scopes']
+        self.assertEqual(report['q1']['counters'], {'foo': 1})
+        self.assertEqual(report[Stats.GLOBAL_SCOPE]['counters'], {'bar': 1})
+
+    @unittest.skipIf(arroyo.helpers.stats.contextvars is None,
+                     "contextvars not available")
+    def test_scopes_are_per_task(self):
+        stats = Stats(enabled=True)
+
+        @asyncio.coroutine
+        def query(name, delay):
+            with stats.scope(name):
+                yield from asyncio.sleep(delay)
+                with stats.timer('foo'):
+                    stats.incr('bar')
+
+                yield from run_in_executor(None, stats.incr, 'baz')
+
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(asyncio.gather(
+            query('q1', 0.02), query('q2', 0.01)))
+
+        report = stats.report()['scopes']
+        self.assertEqual(sorted(report.keys()), ['q1', 'q2'])
+        for name in ['q1', 'q2']:
+            self.assertEqual(report[name]['counters'], {'bar': 1, 'baz': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
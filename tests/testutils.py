@@ -24,6 +24,7 @@ from urllib import parse
 
 from arroyo import (
     Application,
+    ScanRecord,
     SettingsKey,
     Source
 )
@@ -42,6 +43,12 @@ def mock_source(name, type=None, **kwargs):
     return Source(name=name, type=type, **kwargs)
 
 
+def mock_record(name, type=None, **kwargs):
+    src = mock_source(name, type=type, **kwargs)
+    return ScanRecord(name=src.name, uri=src.uri, provider=src.provider,
+                      type=src.type)
+
+
 def analyze(src):
     mp = MediaParser()
     entity, tags = mp.parse(src)